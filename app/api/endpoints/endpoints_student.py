@@ -1,19 +1,30 @@
 # app/api/endpoints/endpoints_student.py
 import os
 from fastapi import APIRouter, HTTPException, Request, Form, File, UploadFile
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import List
 from ...schemas.student import (
     UniversityRequest, ErasmusProgramResponse,
     DepartmentsListRequest, DepartmentsListResponse,
     DepartmentAndStudyPlanRequest, DestinationsResponse,
-    DestinationUniversityRequest, ExamsAnalysisResponse
+    DestinationUniversityRequest, ExamsAnalysisResponse,
+    DestinationSearchRequest, DestinationSearchResponse
 )
 from ...services.rag_service import get_call_summary, get_available_universities, get_available_departments
+from ...services.executor_service import run_io
+from ...services.destinations_search import destinations_search
 from uuid import uuid4
+import tempfile
+import json
 
 router = APIRouter()
 
+def save_temporary_pdf(content: bytes) -> str:
+    """Salva il contenuto in un file PDF temporaneo e ne restituisce il path."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        tmp_file.write(content)
+        return tmp_file.name
+
 @router.post("/step1", response_model=ErasmusProgramResponse)
 async def get_erasmus_program(body: UniversityRequest, req: Request):
     """
@@ -79,6 +90,99 @@ async def analyze_destinations(request: DepartmentAndStudyPlanRequest, req: Requ
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/step2/stream")
+async def stream_destinations(request: DepartmentAndStudyPlanRequest, req: Request):
+    """
+    STEP 2 (streaming): come /step2, ma restituisce le destinazioni in NDJSON
+    (una riga JSON per evento) man mano che vengono trovate.
+    
+    Eventi:
+    - {"destination": {...}}: una DestinationUniversity
+    - {"done": true, "count": N}: fine dello stream
+    - {"error": "..."}: errore dopo l'inizio dello stream
+    
+    Gli errori che avvengono prima della prima destinazione restituiscono
+    il normale codice di errore HTTP.
+    """
+    session = req.app.state.session_store.get(request.session_id)
+    if not session or "home_university" not in session:
+        raise HTTPException(status_code=400, detail="Sessione non valida o scaduta. Rieseguire lo Step 1.")
+
+    from ...services.rag_service import stream_destinations_for_department
+    destinations = stream_destinations_for_department(
+        home_university=session["home_university"],
+        department=request.department,
+        period=request.period
+    )
+
+    # Attende la prima destinazione: se fallisce, l'errore è ancora un errore HTTP
+    try:
+        first = await anext(destinations, None)
+    except Exception as e:
+        print(f"Errore nell'endpoint /step2/stream: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        count = 0
+        try:
+            if first is not None:
+                count += 1
+                yield json.dumps({"destination": first.model_dump()}, ensure_ascii=False) + "\n"
+                async for destination in destinations:
+                    count += 1
+                    yield json.dumps({"destination": destination.model_dump()}, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "count": count}) + "\n"
+        except Exception as e:
+            print(f"Errore durante lo streaming di /step2/stream: {e}")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            await destinations.aclose()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.post("/destinations/search", response_model=DestinationSearchResponse)
+async def search_destinations(request: DestinationSearchRequest, req: Request):
+    """
+    Ricerca a faccette sulle destinazioni dell'università dell'utente
+    (lingua, area ISCED, livello, flag), con ordinamento per posti.
+    Usa un indice in memoria: nessuna chiamata al modello.
+    """
+    try:
+        session = req.app.state.session_store.get(request.session_id)
+        if not session or "home_university" not in session:
+            raise HTTPException(status_code=400, detail="Sessione non valida o scaduta. Rieseguire lo Step 1.")
+
+        home_university = session["home_university"]
+
+        from ...services.rag_service import ensure_destinations_loaded_async
+        await ensure_destinations_loaded_async(home_university)
+        index = await run_io(destinations_search.get_index, home_university)
+
+        result = index.search(
+            filters={
+                "department": request.departments,
+                "language": request.languages,
+                "area": request.areas,
+                "level": request.levels,
+            },
+            flags={
+                "blended": request.blended,
+                "short_mobility": request.short_mobility,
+                "bip": request.bip,
+            },
+            sort=request.sort,
+            limit=request.limit,
+            offset=request.offset
+        )
+        return DestinationSearchResponse(**result)
+    except HTTPException:
+        raise
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"Errore nell'endpoint /destinations/search: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/step3", response_model=ExamsAnalysisResponse)
 async def analyze_exams(
     session_id: str = Form(...),
@@ -101,17 +205,15 @@ async def analyze_exams(
             raise HTTPException(status_code=400, detail="Il piano di studi deve essere un file PDF.")
 
         # Salva temporaneamente il file del piano di studi
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            content = await study_plan_file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
+        content = await study_plan_file.read()
+        tmp_file_path = await run_io(save_temporary_pdf, content)
 
         try:
             # Estrai il testo dal PDF del piano di studi
-            from ...services.rag_service import extract_text_from_pdf, analyze_exams_compatibility
+            from ...services.rag_service import extract_text_from_pdf_async, analyze_exams_compatibility
             
-            study_plan_text = extract_text_from_pdf(tmp_file_path)
+            # Il piano di studi è un documento personale: resta solo nella cache in memoria
+            study_plan_text = await extract_text_from_pdf_async(tmp_file_path, persist=False)
             print(f"📚 Piano di studi estratto: {len(study_plan_text)} caratteri")
             
             # Analizza la compatibilità degli esami
@@ -124,7 +226,7 @@ async def analyze_exams(
             
         finally:
             # Rimuovi il file temporaneo
-            os.unlink(tmp_file_path)
+            await run_io(os.unlink, tmp_file_path)
             
     except HTTPException:
         raise
@@ -139,7 +241,7 @@ async def list_available_universities():
     Questa lista può essere usata nel frontend per popolare un menu a tendina.
     """
     try:
-        universities = get_available_universities()
+        universities = await run_io(get_available_universities)
         return universities
     except Exception as e:
         print(f"Errore nell'endpoint /universities: {e}")
@@ -9,6 +9,96 @@ class Settings(BaseSettings):
     # --- Percorsi Applicazione ---
     DB_PATH: str = str(Path(__file__).parent.parent.parent / "vector_db")
 
+    # --- Destinazioni (step 2) ---
+    # Se True, Gemini viene usato solo per generare il campo "description"
+    # delle destinazioni estratte dal parser deterministico
+    DESTINATIONS_LLM_DESCRIPTIONS: bool = False
+    # Database SQLite con le righe delle destinazioni di tutte le università
+    DESTINATIONS_DB_PATH: str = str(Path(__file__).parent.parent.parent / "data" / "destinazioni" / "processed" / "destinazioni.sqlite3")
+    # Fallback con Gemini: dimensione massima (caratteri) di un blocco della
+    # sezione del dipartimento e numero di blocchi elaborati in contemporanea
+    DESTINATIONS_LLM_CHUNK_CHARS: int = 12000
+    DESTINATIONS_LLM_CONCURRENCY: int = 4
+
+    # --- Estrazione dai PDF ---
+    # Motore di estrazione: "pymupdf" (veloce) o "pdfplumber"
+    PDF_ENGINE: str = "pymupdf"
+    # Processi usati per estrarre in parallelo le pagine dei PDF (0 = numero di CPU)
+    PDF_WORKERS: int = 0
+    # Sotto questo numero di pagine l'estrazione avviene nel processo corrente
+    PDF_PARALLEL_MIN_PAGES: int = 16
+
+    # --- Cache delle estrazioni dai PDF ---
+    # Archivio su disco dei testi estratti (chiave: hash del PDF + estrattore)
+    EXTRACTION_CACHE_DIR: str = str(Path(__file__).parent.parent.parent / "data" / "cache" / "extraction")
+    # Numero massimo di estrazioni tenute in memoria
+    EXTRACTION_CACHE_MAX_ENTRIES: int = 64
+
+    # --- Cache dei risultati (es. destinazioni dello step 2) ---
+    RESULT_CACHE_PATH: str = str(Path(__file__).parent.parent.parent / "data" / "cache" / "results.sqlite3")
+    # Budget in byte della cache in memoria
+    RESULT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # --- Embeddings ---
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # Cache persistente degli embeddings (chiave: modello + hash del testo normalizzato)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = str(Path(__file__).parent.parent.parent / "data" / "cache" / "embeddings")
+    # Tipo dei vettori salvati: "float16" (metà spazio) o "float32"
+    EMBEDDING_CACHE_DTYPE: str = "float16"
+    # Numero di embeddings di query tenuti in memoria (0 = disabilitato)
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1024
+
+    # --- Database vettoriale ---
+    # Backend: "chroma" (SQLite + HNSW) o "numpy" (matrice mappata in memoria e
+    # ricerca esatta, adatto a categorie con poche migliaia di chunk)
+    VECTOR_BACKEND: str = "chroma"
+    # Tipo dei vettori dello store NumPy: "float32" o "float16" (metà spazio)
+    NUMPY_VECTOR_DTYPE: str = "float32"
+    # Categorie partizionate per un metadato (categoria -> metadato): le ricerche
+    # filtrate su quel metadato interrogano solo la sua partizione
+    VECTOR_PARTITION_KEYS: dict[str, str] = {"calls": "source"}
+
+    # Lunghezza massima (caratteri) dei chunk; righe di tabella e voci di elenco non
+    # vengono divise, i paragrafi solo a righe intere. Le unità più lunghe di
+    # CHUNK_SIZE vengono divise a caratteri con CHUNK_FALLBACK_OVERLAP caratteri di overlap
+    CHUNK_SIZE: int = 1000
+    CHUNK_FALLBACK_OVERLAP: int = 100
+    # Eliminazione dei chunk quasi duplicati (MinHash + LSH) e soglia di similarità
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.85
+    # Chunk per blocco durante l'ingestion (embeddings e scrittura nello store)
+    INGEST_BATCH_SIZE: int = 256
+
+    # --- Retrieval ---
+    # "vector" (solo Chroma) o "hybrid" (Chroma + BM25 uniti con reciprocal rank fusion);
+    # le categorie senza indice BM25 usano comunque la ricerca vettoriale
+    RETRIEVAL_MODE: str = "hybrid"
+    # In modalità ibrida ogni metodo restituisce top_k * fattore candidati da fondere
+    HYBRID_CANDIDATES_FACTOR: int = 4
+
+    # --- Contesto dei prompt (vedi context_packing.py) ---
+    # Il retriever restituisce top_k * fattore candidati, tra cui la MMR sceglie i top_k
+    CONTEXT_CANDIDATES_FACTOR: int = 3
+    # Peso della rilevanza rispetto alla diversità nella MMR (1.0 = solo rilevanza)
+    CONTEXT_MMR_LAMBDA: float = 0.7
+    # Budget (token stimati) del contesto estratto dai documenti
+    CONTEXT_MAX_TOKENS: int = 1500
+
+    # --- Avvio dell'applicazione ---
+    # Warm-up all'avvio: modello di embeddings, store e query di prova (vedi /ready)
+    WARMUP_ON_STARTUP: bool = True
+    # Categorie del database vettoriale aperte durante il warm-up
+    WARMUP_CATEGORIES: list[str] = ["calls"]
+    # Carica il modello di embeddings all'import dell'app (gunicorn con preload_app)
+    PRELOAD_EMBEDDINGS: bool = False
+
+    # --- Esecuzione del lavoro bloccante ---
+    # Thread del pool "io" (letture da disco, database)
+    EXECUTOR_IO_WORKERS: int = 16
+    # Thread del pool "cpu" (parsing PDF, embeddings; 0 = numero di CPU)
+    EXECUTOR_CPU_WORKERS: int = 0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
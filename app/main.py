@@ -1,11 +1,53 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from .api.endpoints import endpoints_student
+from .core.config import settings
+from .services.executor_service import get_executor_metrics, run_cpu, shutdown_executors
+from .services.pdf_extraction import shutdown_process_pool
+from .services.rag_service import extraction_flight, retrieval_flight, llm_flight, step2_flight
+from .services.result_cache import result_cache
+from .services.vector_db_service import close_vector_stores, vector_store_service
+
+
+# Con gunicorn e preload_app il modulo viene importato nel master prima del
+# fork: il modello caricato qui è condiviso copy-on-write da tutti i worker
+if settings.PRELOAD_EMBEDDINGS:
+    vector_store_service.preload()
+
+
+async def warm_up(app: FastAPI):
+    """Esegue il warm-up nel pool "cpu" e aggiorna lo stato di /ready."""
+    try:
+        timings = await run_cpu(vector_store_service.warm_up, settings.WARMUP_CATEGORIES)
+        app.state.readiness.update(ready=True, timings_ms=timings)
+    except Exception as e:
+        print(f"❌ Warm-up fallito: {e}")
+        app.state.readiness["error"] = str(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Il warm-up gira in background: il server risponde subito e /ready
+    # indica quando le prime richieste non pagheranno il caricamento
+    app.state.readiness = {"ready": not settings.WARMUP_ON_STARTUP, "error": None, "timings_ms": {}}
+    warm_up_task = asyncio.create_task(warm_up(app)) if settings.WARMUP_ON_STARTUP else None
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    # Allo spegnimento chiude i pool di thread e di processi e i vector store
+    shutdown_executors()
+    shutdown_process_pool()
+    close_vector_stores()
+
 
 app = FastAPI(
     title="Erasmus Suggester API",
     description="Un'API per suggerire la meta Erasmus perfetta usando l'IA Generativa.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # In-memory session store (simple, volatile). Use a proper store for production.
@@ -15,4 +57,30 @@ app.include_router(endpoints_student.router, prefix="/api/v1")
 
 @app.get("/", tags=["Root"])
 def read_root():
-    return {"message": "Benvenuto nell'API di Erasmus Suggester!"}
\ No newline at end of file
+    return {"message": "Benvenuto nell'API di Erasmus Suggester!"}
+
+@app.get("/ready", tags=["Monitoring"])
+def read_readiness():
+    """Readiness probe: 200 dopo il warm-up, 503 finché è in corso o se è fallito."""
+    readiness = app.state.readiness
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/metrics/executors", tags=["Monitoring"])
+def read_executor_metrics():
+    """Metriche dei pool di esecuzione: task in coda, in esecuzione e completati."""
+    return get_executor_metrics()
+
+@app.get("/metrics/single-flight", tags=["Monitoring"])
+def read_single_flight_metrics():
+    """Elaborazioni eseguite e condivise tra richieste concorrenti (estrazione, retrieval, LLM, step 2)."""
+    return {flight.name: flight.metrics() for flight in (extraction_flight, retrieval_flight, llm_flight, step2_flight)}
+
+@app.get("/metrics/embeddings", tags=["Monitoring"])
+def read_embedding_metrics():
+    """Hit e miss delle cache degli embeddings (LRU delle query e archivio su disco)."""
+    return vector_store_service.embedding_metrics()
+
+@app.get("/metrics/result-cache", tags=["Monitoring"])
+def read_result_cache_metrics():
+    """Occupazione e hit rate della cache dei risultati."""
+    return result_cache.metrics()
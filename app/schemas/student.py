@@ -1,7 +1,7 @@
 # app/schemas/student.py
 
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from enum import Enum
 
 
@@ -35,6 +35,22 @@ class DepartmentAndStudyPlanRequest(BaseModel):
     department: str = Field(..., example="Computer Science", description="Dipartimento di afferenza")
     period: Period = Field(..., example="fall", description="Periodo desiderato (fall/spring)")
 
+# STEP 2 (ricerca): Filtri a faccette sulle destinazioni
+class DestinationSearchRequest(BaseModel):
+    """Ricerca delle destinazioni con filtri a faccette (senza chiamate al modello)."""
+    model_config = ConfigDict(extra='forbid')
+    session_id: str = Field(..., example="6f1d2c9e-9a3b-4a9e-94a1-3e2f8c5d9b1a", description="ID di sessione restituito dallo step 1")
+    departments: List[str] = Field(default_factory=list, example=["Dipartimento di Informatica"], description="Dipartimenti (in OR)")
+    languages: List[str] = Field(default_factory=list, example=["English B2"], description="Requisiti linguistici o sole lingue (in OR)")
+    areas: List[str] = Field(default_factory=list, example=["0612"], description="Codici area ISCED (in OR)")
+    levels: List[str] = Field(default_factory=list, example=["2"], description="Livelli di studio (in OR)")
+    blended: Optional[bool] = Field(None, description="Solo mobilità blended (True) o non blended (False)")
+    short_mobility: Optional[bool] = Field(None, description="Solo mobilità brevi (True) o non brevi (False)")
+    bip: Optional[bool] = Field(None, description="Solo Blended Intensive Programme (True) o esclusi (False)")
+    sort: Literal["bando", "posti_desc", "posti_asc"] = Field("bando", description="Ordinamento dei risultati")
+    limit: int = Field(50, ge=1, le=1000, description="Numero massimo di destinazioni restituite")
+    offset: int = Field(0, ge=0, description="Numero di destinazioni da saltare")
+
 # STEP 3: Richiesta analisi esami per università scelta
 class DestinationUniversityRequest(BaseModel):
     """Richiesta analisi esami disponibili presso università di destinazione."""
@@ -73,11 +89,31 @@ class DestinationUniversity(BaseModel):
     livello: Optional[str] = Field(None, example="U", description="Livello di studio (U=Undergraduate, etc.)")
     dettagli_livello: Optional[str] = Field(None, example="", description="Dettagli aggiuntivi sul livello")
     requisiti_linguistici: Optional[str] = Field(None, example="German B2", description="Requisiti linguistici richiesti")
+    descrizione_area: Optional[str] = Field(None, example="0732 - BUILDING AND CIVIL ENGINEERING", description="Descrizione dell'area ISCED")
+    blended: Optional[str] = Field(None, example="SI", description="Mobilità blended")
+    short_mobility: Optional[str] = Field(None, example="", description="Mobilità di breve durata")
+    bip: Optional[str] = Field(None, example="", description="Blended Intensive Programme")
+    circle_u: Optional[str] = Field(None, example="", description="Accordo dell'alleanza CIRCLE U")
+    sotto_condizione: Optional[str] = Field(None, example="", description="Accordo sotto condizione")
+    note: Optional[str] = Field(None, example="", description="Note per gli studenti")
 
 class DestinationsResponse(BaseModel):
     """Lista delle destinazioni compatibili."""
     destinations: List[DestinationUniversity]
 
+# STEP 2 (ricerca): Risultati e conteggi delle faccette
+class FacetCount(BaseModel):
+    """Numero di destinazioni con un certo valore di una faccetta."""
+    value: str = Field(..., example="English B2")
+    count: int = Field(..., example=129)
+    label: Optional[str] = Field(None, example="INFORMATION AND COMMUNICATION TECHNOLOGIES", description="Descrizione del valore (aree ISCED)")
+
+class DestinationSearchResponse(BaseModel):
+    """Pagina dei risultati della ricerca a faccette."""
+    total: int = Field(..., description="Numero totale di destinazioni che soddisfano i filtri")
+    destinations: List[DestinationUniversity]
+    facets: Dict[str, List[FacetCount]] = Field(..., description="Conteggi per faccetta (department, language, area, level, blended, short_mobility, bip)")
+
 # STEP 3: Risposta con analisi esami
 class MatchedExam(BaseModel):
     """Rappresenta un esame dello studente con corrispondenza nell'università di destinazione."""
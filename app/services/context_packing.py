@@ -0,0 +1,165 @@
+"""Preparazione del contesto dei prompt a partire dai chunk recuperati.
+
+Unire i primi k chunk così come arrivano dal retrieval porta nel prompt
+testo ripetuto: chunk quasi identici di pagine diverse e chunk adiacenti
+che condividono l'overlap dello splitter. Qui i candidati passano da tre fasi:
+
+1. Maximal Marginal Relevance: si sceglie ogni volta il chunk che massimizza
+
+       lambda * sim(query, chunk) - (1 - lambda) * max sim(chunk, già scelti)
+
+   con gli embeddings dei chunk letti dalla cache (gli stessi calcolati
+   durante l'ingestion, vedi embedding_cache.py)
+2. Unione dei chunk dello stesso file che si sovrappongono (la fine di uno
+   coincide con l'inizio dell'altro) o che sono contenuti in un altro;
+   i testi identici vengono tenuti una sola volta anche tra file diversi
+3. Riempimento di un budget di token, nell'ordine di rilevanza: i chunk che
+   non ci stanno vengono saltati (uno più corto può ancora entrare)
+"""
+
+import math
+from typing import List, Sequence
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+
+# Stima dei token senza tokenizer: ~4 caratteri per token per testi in italiano e inglese
+CHARS_PER_TOKEN = 4
+# Overlap minimo (caratteri) perché due chunk vengano considerati adiacenti
+MIN_MERGE_OVERLAP = 20
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Numero approssimato di token del testo."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(query_vector: Sequence[float],
+               doc_vectors: Sequence[Sequence[float]],
+               k: int,
+               lambda_mult: float = 0.5) -> List[int]:
+    """Indici dei k vettori scelti con la Maximal Marginal Relevance.
+
+    Args:
+        query_vector: Embedding della query
+        doc_vectors: Embeddings dei candidati
+        k: Numero di candidati da scegliere
+        lambda_mult: 1.0 = solo rilevanza, 0.0 = solo diversità
+
+    Returns:
+        Indici dei candidati, nell'ordine in cui sono stati scelti
+    """
+    if len(doc_vectors) == 0 or k <= 0:
+        return []
+    docs = _normalize_rows(np.asarray(doc_vectors, dtype=np.float32))
+    query = _normalize_rows(np.asarray(query_vector, dtype=np.float32))
+    relevance = docs @ query
+    similarity = docs @ docs.T
+
+    selected = [int(np.argmax(relevance))]
+    # Similarità massima di ogni candidato con quelli già scelti
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(docs)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def _overlap(first: str, second: str) -> int:
+    """Lunghezza del suffisso più lungo di `first` che è anche prefisso di `second`."""
+    for size in range(min(len(first), len(second)) - 1, MIN_MERGE_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def merge_adjacent(documents: Sequence[Document]) -> List[Document]:
+    """Unisce i chunk dello stesso file che si sovrappongono o sono contenuti in altri.
+
+    Il chunk risultante prende il posto del primo dei due nella lista
+    (quello più rilevante), con i metadati del chunk che inizia prima.
+    """
+    merged: List[Document] = []
+    for document in documents:
+        text = document.page_content
+        source = document.metadata.get("source")
+        for index, current in enumerate(merged):
+            # Un testo identico è ripetuto anche se viene da un altro file
+            if text == current.page_content:
+                break
+            if current.metadata.get("source") != source:
+                continue
+            if text in current.page_content:
+                break
+            if current.page_content in text:
+                merged[index] = Document(page_content=text, metadata=dict(current.metadata))
+                break
+            overlap = _overlap(current.page_content, text)
+            if overlap:
+                merged[index] = Document(page_content=current.page_content + text[overlap:], metadata=dict(current.metadata))
+                break
+            overlap = _overlap(text, current.page_content)
+            if overlap:
+                merged[index] = Document(page_content=text + current.page_content[overlap:], metadata=dict(document.metadata))
+                break
+        else:
+            merged.append(document)
+    return merged
+
+
+def pack_documents(documents: Sequence[Document], max_tokens: int, separator: str = CONTEXT_SEPARATOR) -> List[Document]:
+    """Chunk che stanno nel budget di token (separatori compresi), nell'ordine ricevuto."""
+    separator_tokens = estimate_tokens(separator)
+    packed: List[Document] = []
+    used = 0
+    for document in documents:
+        cost = estimate_tokens(document.page_content) + (separator_tokens if packed else 0)
+        if used + cost > max_tokens:
+            continue
+        packed.append(document)
+        used += cost
+    return packed
+
+
+def build_context(query: str,
+                  documents: Sequence[Document],
+                  embeddings: Embeddings,
+                  top_k: int,
+                  max_tokens: int,
+                  lambda_mult: float = 0.5,
+                  separator: str = CONTEXT_SEPARATOR) -> str:
+    """Testo del contesto per il prompt: MMR, unione dei chunk adiacenti e budget di token.
+
+    Args:
+        query: Query usata per il retrieval
+        documents: Candidati restituiti dal retriever, in ordine di rilevanza
+        embeddings: Embeddings del vector store (la query e i chunk sono di norma in cache)
+        top_k: Numero massimo di chunk scelti con la MMR
+        max_tokens: Budget di token del contesto
+        lambda_mult: Peso della rilevanza rispetto alla diversità nella MMR
+
+    Returns:
+        Chunk scelti separati da `separator` (stringa vuota se non ci sono candidati)
+    """
+    documents = list(documents)
+    if not documents:
+        return ""
+    selected = documents
+    if len(documents) > top_k:
+        query_vector = embeddings.embed_query(query)
+        doc_vectors = embeddings.embed_documents([doc.page_content for doc in documents])
+        # Riordinati per rilevanza originale: la MMR decide quali chunk, non l'ordine
+        selected = [documents[index] for index in sorted(mmr_select(query_vector, doc_vectors, top_k, lambda_mult))]
+    packed = pack_documents(merge_adjacent(selected), max_tokens, separator)
+    return separator.join(doc.page_content for doc in packed)
@@ -0,0 +1,197 @@
+"""Parser deterministico per le tabelle delle destinazioni Erasmus.
+
+I file `destinazioni_*_LLM_ready.txt` contengono, per ogni dipartimento:
+1. Una riga di intestazione del tipo "Dipartimento di Fisica | ... | n° borse: 49"
+2. La riga con i nomi delle colonne (CODICE EUROPEO | NOME ISTITUZIONE | ...)
+3. Una riga per ogni accordo, con le celle separate da " | "
+
+Questo modulo trasforma quelle righe in record DestinationUniversity senza
+passare da un modello AI.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from ..schemas.student import DestinationUniversity
+
+
+# Colonne della tabella delle destinazioni, nell'ordine in cui compaiono nel bando
+DESTINATION_COLUMNS = (
+    "CODICE EUROPEO",
+    "NOME ISTITUZIONE",
+    "CODICE AREA",
+    "DESCRIZIONE AREA ISCED",
+    "POSTI",
+    "DURATA PER POSTO",
+    "LIVELLO",
+    "DETTAGLI LIVELLO",
+    "REQUISITI LINGUISTICI",
+    "BLENDED",
+    "SHORT MOBILITY",
+    "BIP",
+    "CIRCLE U",
+    "SOTTO CONDIZIONE",
+    "NOTE PER GLI STUDENTI",
+)
+
+# Mappa colonna del bando -> campo di DestinationUniversity
+COLUMN_TO_FIELD = {
+    "CODICE EUROPEO": "codice_europeo",
+    "NOME ISTITUZIONE": "nome_istituzione",
+    "CODICE AREA": "codice_area",
+    "DESCRIZIONE AREA ISCED": "descrizione_area",
+    "POSTI": "posti",
+    "DURATA PER POSTO": "durata_per_posto",
+    "LIVELLO": "livello",
+    "DETTAGLI LIVELLO": "dettagli_livello",
+    "REQUISITI LINGUISTICI": "requisiti_linguistici",
+    "BLENDED": "blended",
+    "SHORT MOBILITY": "short_mobility",
+    "BIP": "bip",
+    "CIRCLE U": "circle_u",
+    "SOTTO CONDIZIONE": "sotto_condizione",
+    "NOTE PER GLI STUDENTI": "note",
+}
+
+# Intestazione di sezione: "<nome dipartimento> | | ... | n° borse: 391"
+DEPARTMENT_HEADER_PATTERN = re.compile(r'n°\s*borse:\s*(\d+)', re.IGNORECASE)
+
+# Numero minimo di celle perché una riga venga considerata una riga della tabella
+MIN_ROW_CELLS = 9
+
+
+@dataclass
+class DepartmentTable:
+    """Sezione del bando relativa a un singolo dipartimento.
+
+    Attributes:
+        name: Nome del dipartimento come riportato nell'intestazione
+        borse: Numero di borse dichiarato nell'intestazione (se presente)
+        rows: Righe della tabella, come dizionari colonna -> valore
+    """
+    name: str
+    borse: Optional[int] = None
+    rows: List[Dict[str, str]] = field(default_factory=list)
+
+
+def split_row(line: str) -> List[str]:
+    """Divide una riga della tabella nelle sue celle, ripulite dagli spazi."""
+    return [cell.strip() for cell in line.split('|')]
+
+
+def _is_column_header(cells: List[str]) -> bool:
+    return len(cells) >= 2 and cells[0].upper() == DESTINATION_COLUMNS[0] and cells[1].upper() == DESTINATION_COLUMNS[1]
+
+
+def parse_destinations_text(text: str) -> Dict[str, DepartmentTable]:
+    """Estrae tutte le sezioni dei dipartimenti dal testo delle destinazioni.
+
+    Le righe che non appartengono a una tabella (testo libero della pagina,
+    intestazioni ripetute a ogni cambio pagina, righe vuote) vengono ignorate.
+
+    Args:
+        text: Contenuto del file `destinazioni_*_LLM_ready.txt`
+
+    Returns:
+        Dizionario ordinato nome dipartimento -> DepartmentTable
+    """
+    departments: Dict[str, DepartmentTable] = {}
+    current: Optional[DepartmentTable] = None
+
+    for line in text.splitlines():
+        if '|' not in line:
+            continue
+
+        cells = split_row(line)
+
+        # Intestazione di un nuovo dipartimento
+        header_match = DEPARTMENT_HEADER_PATTERN.search(line)
+        if header_match and cells[0]:
+            name = cells[0]
+            current = departments.get(name)
+            if current is None:
+                current = DepartmentTable(name=name, borse=int(header_match.group(1)))
+                departments[name] = current
+            continue
+
+        if current is None or _is_column_header(cells):
+            continue
+
+        # Riga dati: serve almeno il codice europeo e il nome dell'istituzione
+        if len(cells) < MIN_ROW_CELLS or not cells[0] or not cells[1]:
+            continue
+
+        # Le celle finali vuote a volte vengono perse: completa fino al numero di colonne
+        cells = (cells + [""] * len(DESTINATION_COLUMNS))[:len(DESTINATION_COLUMNS)]
+        current.rows.append(dict(zip(DESTINATION_COLUMNS, cells)))
+
+    return departments
+
+
+def find_department(departments: Dict[str, DepartmentTable], department: str) -> Optional[DepartmentTable]:
+    """Cerca un dipartimento per nome.
+
+    Ha la precedenza la corrispondenza esatta (case-insensitive); in mancanza
+    viene restituita la prima sezione che contiene il nome cercato, come fa
+    `extract_department_section`.
+    """
+    name = match_department_name(departments, department)
+    return departments[name] if name is not None else None
+
+
+def match_department_name(names: Iterable[str], department: str) -> Optional[str]:
+    """Sceglie tra `names` il dipartimento cercato (stesse regole di find_department)."""
+    names = list(names)
+    wanted = department.strip().casefold()
+    for name in names:
+        if name.casefold() == wanted:
+            return name
+    for name in names:
+        if wanted in name.casefold():
+            return name
+    return None
+
+
+def build_default_description(destination: DestinationUniversity) -> str:
+    """Descrizione sintetica costruita solo con i dati della tabella."""
+    parts = []
+    if destination.descrizione_area:
+        parts.append(f"Area {destination.descrizione_area}")
+    if destination.posti:
+        seats = f"{destination.posti} posti"
+        if destination.durata_per_posto:
+            seats += f" da {destination.durata_per_posto}"
+        parts.append(seats)
+    if destination.requisiti_linguistici:
+        parts.append(f"requisiti linguistici: {destination.requisiti_linguistici}")
+    return "; ".join(parts) + "." if parts else ""
+
+
+def destination_from_fields(values: Dict[str, Optional[str]]) -> DestinationUniversity:
+    """Crea un DestinationUniversity dai campi già rinominati (vedi COLUMN_TO_FIELD)."""
+    destination = DestinationUniversity(name=values["nome_istituzione"], description="", **values)
+    destination.description = build_default_description(destination)
+    return destination
+
+
+def row_to_destination(row: Dict[str, str]) -> DestinationUniversity:
+    """Converte una riga della tabella in un record DestinationUniversity."""
+    return destination_from_fields({COLUMN_TO_FIELD[column]: value for column, value in row.items()})
+
+
+def parse_department_destinations(text: str, department: str) -> List[DestinationUniversity]:
+    """Restituisce le destinazioni di un dipartimento come record tipizzati.
+
+    Args:
+        text: Contenuto del file `destinazioni_*_LLM_ready.txt`
+        department: Nome del dipartimento
+
+    Returns:
+        Lista di DestinationUniversity, vuota se il dipartimento non è presente
+        o se il testo non ha la struttura a righe attesa
+    """
+    table = find_department(parse_destinations_text(text), department)
+    if table is None:
+        return []
+    return [row_to_destination(row) for row in table.rows]
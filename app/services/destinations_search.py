@@ -0,0 +1,242 @@
+"""Ricerca a faccette sulle destinazioni Erasmus.
+
+Per ogni università di provenienza viene costruito, a partire dallo store
+delle destinazioni, un indice invertito in memoria:
+
+    (campo, valore) -> insieme delle righe che hanno quel valore
+
+Gli insiemi sono rappresentati come bitmap (interi Python, un bit per riga):
+AND/OR dei filtri e conteggi delle faccette sono operazioni bit a bit su
+poche centinaia di byte, quindi una ricerca su migliaia di righe richiede
+molto meno di un millisecondo e nessuna chiamata al modello.
+
+Faccette disponibili:
+- department: dipartimento di provenienza
+- language: requisito linguistico (es. "English B2"); nei filtri si può
+  indicare anche solo la lingua (es. "English")
+- area: codice ISCED (es. "0612")
+- level: livello di studio (es. "2")
+- blended, short_mobility, bip: flag SI/NO
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional
+
+from .destinations_parser import match_department_name
+from .destinations_store import DestinationsStore, destinations_store, split_multi_value
+from ..schemas.student import DestinationUniversity
+
+
+# Requisito linguistico: lingua seguita dal livello QCER (es. "German B1")
+LANGUAGE_PATTERN = re.compile(r"([^\W\d_]+)\s+([ABC][12])\b")
+
+# Campi multi-valore indicizzati (nome della faccetta)
+VALUE_FACETS = ("department", "language", "area", "level")
+
+# Flag SI/NO indicizzati (nome del campo di DestinationUniversity)
+FLAG_FACETS = ("blended", "short_mobility", "bip")
+
+# Ordinamenti supportati
+SORT_OPTIONS = ("bando", "posti_desc", "posti_asc")
+
+
+def parse_language_requirements(value: Optional[str]) -> List[str]:
+    """Divide i requisiti linguistici (es. "German B1 English B1") in singoli requisiti."""
+    if not value:
+        return []
+    return [f"{language.capitalize()} {level}" for language, level in LANGUAGE_PATTERN.findall(value)]
+
+
+def is_flag_set(value: Optional[str]) -> bool:
+    """Le celle dei flag valgono "SI" (eventualmente seguito da note) o sono vuote."""
+    return bool(value) and value.strip().upper().startswith("SI")
+
+
+def bits_to_ids(bitmap: int) -> List[int]:
+    """Indici dei bit a 1 di una bitmap, in ordine crescente."""
+    # La stringa binaria costa O(n); isolare un bit alla volta costerebbe O(n) per bit
+    return [index for index, bit in enumerate(reversed(bin(bitmap)[2:])) if bit == "1"]
+
+
+class DestinationSearchIndex:
+    """Indice invertito delle destinazioni di una università di provenienza.
+
+    Attributes:
+        university: Università di provenienza indicizzata
+        destinations: Righe indicizzate, nell'ordine del bando
+        seats: Posti numerici di ogni riga (0 se non numerici)
+        departments: Dipartimenti nell'ordine del bando
+        area_labels: Descrizione ISCED di ogni codice area
+    """
+
+    def __init__(self, university: str, rows: List[dict]):
+        """Costruisce l'indice dalle righe dello store.
+
+        Args:
+            university: Università di provenienza
+            rows: Righe restituite da DestinationsStore.get_university_rows
+        """
+        self.university = university
+        self.destinations: List[DestinationUniversity] = []
+        self.seats: List[int] = []
+        self.departments: List[str] = []
+        self.area_labels: Dict[str, str] = {}
+        self._postings: Dict[str, Dict[str, int]] = {facet: {} for facet in VALUE_FACETS + FLAG_FACETS}
+        # Requisiti e sole lingue, in minuscolo, per i filtri (es. "english b2", "english")
+        self._language_terms: Dict[str, int] = {}
+
+        for row_id, row in enumerate(rows):
+            destination = row["destination"]
+            bit = 1 << row_id
+            self.destinations.append(destination)
+            self.seats.append(row["posti_num"] or 0)
+            if row["department"] not in self.departments:
+                self.departments.append(row["department"])
+
+            self._add("department", [row["department"]], bit)
+            languages = parse_language_requirements(destination.requisiti_linguistici)
+            self._add("language", languages, bit)
+            for language in languages:
+                for term in (language.casefold(), language.split()[0].casefold()):
+                    self._language_terms[term] = self._language_terms.get(term, 0) | bit
+            self._add("area", split_multi_value(destination.codice_area), bit)
+            self._add("level", split_multi_value(destination.livello), bit)
+            for flag in FLAG_FACETS:
+                self._add(flag, ["true" if is_flag_set(getattr(destination, flag)) else "false"], bit)
+
+            for description in split_multi_value(destination.descrizione_area):
+                code, _, label = description.partition(" - ")
+                if label:
+                    self.area_labels.setdefault(code.strip(), label.strip())
+
+        self._all = (1 << len(self.destinations)) - 1
+
+    def _add(self, facet: str, values: List[str], bit: int) -> None:
+        postings = self._postings[facet]
+        for value in values:
+            postings[value] = postings.get(value, 0) | bit
+
+    def _filter_bitmap(self, facet: str, values: List[str]) -> int:
+        """Righe che hanno almeno uno dei valori richiesti (OR all'interno del campo)."""
+        postings = self._postings[facet]
+        bitmap = 0
+        for value in values:
+            value = " ".join(value.split())
+            if facet == "language":
+                bitmap |= self._language_terms.get(value.casefold(), 0)
+                continue
+            if facet == "department":
+                value = match_department_name(self.departments, value) or value
+            bitmap |= postings.get(value, 0)
+        return bitmap
+
+    def search(self,
+               filters: Optional[Dict[str, List[str]]] = None,
+               flags: Optional[Dict[str, Optional[bool]]] = None,
+               sort: str = "bando",
+               limit: int = 50,
+               offset: int = 0) -> dict:
+        """Filtra le destinazioni e calcola i conteggi delle faccette.
+
+        I valori dello stesso campo sono in OR, i campi diversi in AND. Il
+        conteggio di ogni faccetta considera tutti i filtri tranne quello
+        della faccetta stessa, così il client può mostrare quante righe
+        otterrebbe aggiungendo un altro valore.
+
+        Args:
+            filters: Valori richiesti per ogni faccetta di VALUE_FACETS
+            flags: True/False per i flag di FLAG_FACETS (None = indifferente)
+            sort: Uno di SORT_OPTIONS
+            limit: Numero massimo di destinazioni restituite
+            offset: Numero di destinazioni da saltare
+
+        Returns:
+            Dizionario con total, destinations (pagina richiesta) e facets
+
+        Raises:
+            ValueError: Se la faccetta o l'ordinamento non esistono
+        """
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"Ordinamento '{sort}' non valido. Disponibili: {', '.join(SORT_OPTIONS)}")
+
+        constraints: Dict[str, int] = {}
+        for facet, values in (filters or {}).items():
+            if facet not in VALUE_FACETS:
+                raise ValueError(f"Faccetta '{facet}' non valida. Disponibili: {', '.join(VALUE_FACETS)}")
+            if values:
+                constraints[facet] = self._filter_bitmap(facet, values)
+        for flag, wanted in (flags or {}).items():
+            if flag not in FLAG_FACETS:
+                raise ValueError(f"Flag '{flag}' non valido. Disponibili: {', '.join(FLAG_FACETS)}")
+            if wanted is not None:
+                constraints[flag] = self._postings[flag].get("true" if wanted else "false", 0)
+
+        matches = self._all
+        for bitmap in constraints.values():
+            matches &= bitmap
+
+        row_ids = bits_to_ids(matches)
+        if sort == "posti_desc":
+            row_ids.sort(key=lambda row_id: -self.seats[row_id])
+        elif sort == "posti_asc":
+            row_ids.sort(key=lambda row_id: self.seats[row_id])
+
+        return {
+            "total": len(row_ids),
+            "destinations": [self.destinations[row_id] for row_id in row_ids[offset:offset + limit]],
+            "facets": self._facet_counts(constraints),
+        }
+
+    def _facet_counts(self, constraints: Dict[str, int]) -> Dict[str, List[dict]]:
+        facets = {}
+        for facet, postings in self._postings.items():
+            base = self._all
+            for other, bitmap in constraints.items():
+                if other != facet:
+                    base &= bitmap
+            counts = []
+            for value, bitmap in postings.items():
+                count = (bitmap & base).bit_count()
+                if count:
+                    counts.append({"value": value, "count": count, "label": self.area_labels.get(value) if facet == "area" else None})
+            counts.sort(key=lambda item: (-item["count"], item["value"]))
+            facets[facet] = counts
+        return facets
+
+
+class DestinationsSearchService:
+    """Mantiene un indice per università, ricostruito quando lo store cambia."""
+
+    def __init__(self, store: DestinationsStore = destinations_store):
+        """Inizializza il servizio (gli indici sono costruiti alla prima ricerca).
+
+        Args:
+            store: Store delle destinazioni da cui costruire gli indici
+        """
+        self.store = store
+        self._indexes: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, university: str) -> DestinationSearchIndex:
+        """Restituisce l'indice dell'università, costruendolo se manca o è vecchio."""
+        # Stato letto da SQLite: vale anche se lo store è stato ricaricato da un altro worker
+        state = self.store.source_state(university)
+        with self._lock:
+            entry = self._indexes.get(university)
+            if entry is not None and entry[0] == state:
+                return entry[1]
+        index = DestinationSearchIndex(university, self.store.get_university_rows(university))
+        with self._lock:
+            self._indexes[university] = (state, index)
+        print(f"🔎 Indice di ricerca destinazioni costruito per {university}: {len(index.destinations)} righe")
+        return index
+
+    def clear(self) -> None:
+        """Elimina gli indici costruiti (verranno ricostruiti alla prossima ricerca)."""
+        with self._lock:
+            self._indexes.clear()
+
+
+# Istanza globale del servizio di ricerca
+destinations_search = DestinationsSearchService()
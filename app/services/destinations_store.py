@@ -0,0 +1,357 @@
+"""Archivio indicizzato delle destinazioni Erasmus.
+
+Le righe delle tabelle delle destinazioni (vedi destinations_parser) vengono
+caricate una sola volta in un database SQLite, indicizzato per:
+1. Università di provenienza e dipartimento
+2. Codice europeo dell'istituzione partner
+3. Codice area ISCED e livello (una riga per ogni valore)
+4. Requisiti linguistici
+
+In questo modo /departments e /step2 diventano semplici lookup sugli indici
+invece di rileggere e riscandire il file di testo a ogni richiesta.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from .destinations_parser import (
+    COLUMN_TO_FIELD,
+    destination_from_fields,
+    match_department_name,
+    parse_destinations_text,
+)
+from ..core.config import settings
+from ..schemas.student import DestinationUniversity
+
+
+# Campi di DestinationUniversity salvati come colonne della tabella destinations
+DESTINATION_FIELDS = tuple(COLUMN_TO_FIELD.values())
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sources (
+    university TEXT PRIMARY KEY,
+    source_path TEXT,
+    source_signature TEXT,
+    built_at TEXT
+);
+CREATE TABLE IF NOT EXISTS departments (
+    university TEXT NOT NULL,
+    name TEXT NOT NULL,
+    borse INTEGER,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (university, name)
+);
+CREATE TABLE IF NOT EXISTS destinations (
+    id INTEGER PRIMARY KEY,
+    university TEXT NOT NULL,
+    department TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    posti_num INTEGER,
+    {", ".join(f"{name} TEXT" for name in DESTINATION_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS idx_destinations_department
+    ON destinations (university, department, position);
+CREATE INDEX IF NOT EXISTS idx_destinations_codice
+    ON destinations (codice_europeo, university, department);
+CREATE INDEX IF NOT EXISTS idx_destinations_language
+    ON destinations (requisiti_linguistici);
+CREATE TABLE IF NOT EXISTS destination_areas (
+    codice_area TEXT NOT NULL,
+    destination_id INTEGER NOT NULL,
+    PRIMARY KEY (codice_area, destination_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS destination_levels (
+    livello TEXT NOT NULL,
+    destination_id INTEGER NOT NULL,
+    PRIMARY KEY (livello, destination_id)
+) WITHOUT ROWID;
+"""
+
+
+def split_multi_value(value: Optional[str]) -> List[str]:
+    """Divide le celle con più valori (es. "0913, 0915" o "1, 2, 3")."""
+    if not value:
+        return []
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def source_signature(path: Path) -> str:
+    """Firma economica di un file sorgente (dimensione e data di modifica)."""
+    stat = Path(path).stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def parse_seats(value: Optional[str]) -> Optional[int]:
+    """Converte il campo POSTI in intero, se possibile."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class DestinationsStore:
+    """Database SQLite con le destinazioni di tutte le università di provenienza.
+
+    Attributes:
+        db_path: Path del file SQLite
+    """
+
+    def __init__(self, db_path: str = settings.DESTINATIONS_DB_PATH):
+        """Inizializza lo store creando lo schema se necessario.
+
+        Args:
+            db_path: Path del file SQLite
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Apre una connessione dedicata (sicuro da usare da più thread)."""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def is_current(self, university: str, source_signature: str) -> bool:
+        """Verifica se l'università è già caricata a partire dalla stessa sorgente."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT source_signature FROM sources WHERE university = ?",
+                (university,)
+            ).fetchone()
+        return row is not None and row["source_signature"] == source_signature
+
+    def source_state(self, university: str) -> Optional[Tuple[str, str]]:
+        """Firma della sorgente e istante dell'ultimo caricamento dell'università.
+
+        Letto dal database, quindi vede anche i caricamenti fatti da altri
+        processi (es. altri worker): chi mantiene strutture derivate (come
+        l'indice di ricerca) lo usa per capire se sono ancora valide.
+
+        Returns:
+            (source_signature, built_at) o None se l'università non è caricata
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT source_signature, built_at FROM sources WHERE university = ?",
+                (university,)
+            ).fetchone()
+        return None if row is None else (row["source_signature"], row["built_at"])
+
+    def load_university(self,
+                        university: str,
+                        text: str,
+                        source_path: Optional[str] = None,
+                        source_signature: Optional[str] = None) -> int:
+        """Carica (o ricarica) tutte le destinazioni di un'università.
+
+        Le righe precedenti dell'università vengono sostituite in un'unica
+        transazione, quindi le letture concorrenti non vedono mai dati parziali.
+
+        Args:
+            university: Università di provenienza (chiave dello store)
+            text: Contenuto del file `destinazioni_*_LLM_ready.txt`
+            source_path: File da cui proviene il testo
+            source_signature: Firma della sorgente, usata da is_current
+
+        Returns:
+            Numero di destinazioni caricate
+        """
+        departments = parse_destinations_text(text)
+        loaded = 0
+
+        with self._connect() as conn:
+            self._delete_university(conn, university)
+
+            for dept_position, table in enumerate(departments.values()):
+                conn.execute(
+                    "INSERT INTO departments (university, name, borse, position) VALUES (?, ?, ?, ?)",
+                    (university, table.name, table.borse, dept_position)
+                )
+                for position, row in enumerate(table.rows):
+                    values = {COLUMN_TO_FIELD[column]: value for column, value in row.items()}
+                    cursor = conn.execute(
+                        f"INSERT INTO destinations (university, department, position, posti_num, "
+                        f"{', '.join(DESTINATION_FIELDS)}) "
+                        f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in DESTINATION_FIELDS)})",
+                        (university, table.name, position, parse_seats(values["posti"]),
+                         *(values[name] for name in DESTINATION_FIELDS))
+                    )
+                    destination_id = cursor.lastrowid
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO destination_areas (codice_area, destination_id) VALUES (?, ?)",
+                        [(code, destination_id) for code in split_multi_value(values["codice_area"])]
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO destination_levels (livello, destination_id) VALUES (?, ?)",
+                        [(level, destination_id) for level in split_multi_value(values["livello"])]
+                    )
+                    loaded += 1
+
+            conn.execute(
+                "INSERT INTO sources (university, source_path, source_signature, built_at) VALUES (?, ?, ?, ?)",
+                (university, source_path, source_signature, datetime.now().isoformat(timespec="seconds"))
+            )
+
+        print(f"✅ Store destinazioni: caricate {loaded} righe per {university}")
+        return loaded
+
+    def _delete_university(self, conn: sqlite3.Connection, university: str) -> None:
+        ids = "SELECT id FROM destinations WHERE university = ?"
+        conn.execute(f"DELETE FROM destination_areas WHERE destination_id IN ({ids})", (university,))
+        conn.execute(f"DELETE FROM destination_levels WHERE destination_id IN ({ids})", (university,))
+        conn.execute("DELETE FROM destinations WHERE university = ?", (university,))
+        conn.execute("DELETE FROM departments WHERE university = ?", (university,))
+        conn.execute("DELETE FROM sources WHERE university = ?", (university,))
+
+    def get_universities(self) -> List[str]:
+        """Restituisce le università di provenienza caricate nello store."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT university FROM sources ORDER BY university").fetchall()
+        return [row["university"] for row in rows]
+
+    def get_departments(self, university: str) -> List[str]:
+        """Restituisce i dipartimenti di un'università in ordine alfabetico."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name FROM departments WHERE university = ? ORDER BY name",
+                (university,)
+            ).fetchall()
+        return [row["name"] for row in rows]
+
+    def resolve_department(self, university: str, department: str) -> Optional[str]:
+        """Trova il nome esatto del dipartimento.
+
+        Come destinations_parser.find_department: prima la corrispondenza
+        esatta (case-insensitive), poi la prima sezione che contiene il nome.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name FROM departments WHERE university = ? ORDER BY position",
+                (university,)
+            ).fetchall()
+        return match_department_name((row["name"] for row in rows), department)
+
+    def get_destinations(self, university: str, department: str) -> List[DestinationUniversity]:
+        """Restituisce le destinazioni di un dipartimento, nell'ordine del bando.
+
+        Returns:
+            Lista di DestinationUniversity, vuota se il dipartimento non esiste
+        """
+        name = self.resolve_department(university, department)
+        if name is None:
+            return []
+        return self.find_destinations(university=university, department=name)
+
+    def find_destinations(self,
+                          university: Optional[str] = None,
+                          department: Optional[str] = None,
+                          codice_europeo: Optional[str] = None,
+                          codice_area: Optional[str] = None,
+                          livello: Optional[str] = None,
+                          requisiti_linguistici: Optional[str] = None) -> List[DestinationUniversity]:
+        """Ricerca le destinazioni combinando i filtri indicizzati.
+
+        Tutti i filtri sono opzionali e vengono messi in AND; quelli su
+        codice area e livello usano le tabelle di indice multi-valore.
+
+        Args:
+            university: Università di provenienza
+            department: Nome esatto del dipartimento
+            codice_europeo: Codice europeo dell'istituzione (es. "E BARCELO01")
+            codice_area: Codice ISCED (es. "0612")
+            livello: Livello di studio (es. "2")
+            requisiti_linguistici: Requisito linguistico esatto (es. "English B2")
+
+        Returns:
+            Lista di DestinationUniversity
+        """
+        clauses, params = [], []
+        for column, value in (("university", university),
+                              ("department", department),
+                              ("codice_europeo", codice_europeo),
+                              ("requisiti_linguistici", requisiti_linguistici)):
+            if value is not None:
+                clauses.append(f"d.{column} = ?")
+                params.append(value)
+        if codice_area is not None:
+            clauses.append("d.id IN (SELECT destination_id FROM destination_areas WHERE codice_area = ?)")
+            params.append(codice_area)
+        if livello is not None:
+            clauses.append("d.id IN (SELECT destination_id FROM destination_levels WHERE livello = ?)")
+            params.append(livello)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT d.* FROM destinations d {where} "
+                f"ORDER BY d.university, d.department, d.position",
+                params
+            ).fetchall()
+        return [self._row_to_destination(row) for row in rows]
+
+    def get_university_rows(self, university: str) -> List[dict]:
+        """Restituisce tutte le righe di un'università con dipartimento e posti numerici.
+
+        Returns:
+            Lista di dizionari con department, posti_num e destination,
+            nell'ordine dei dipartimenti e del bando
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT d.* FROM destinations d "
+                "JOIN departments p ON p.university = d.university AND p.name = d.department "
+                "WHERE d.university = ? ORDER BY p.position, d.position",
+                (university,)
+            ).fetchall()
+        return [
+            {
+                "department": row["department"],
+                "posti_num": row["posti_num"],
+                "destination": self._row_to_destination(row),
+            }
+            for row in rows
+        ]
+
+    def find_departments_with_seats_at(self,
+                                       codice_europeo: str,
+                                       university: Optional[str] = None) -> List[dict]:
+        """Elenca i dipartimenti che hanno posti presso un'istituzione partner.
+
+        Args:
+            codice_europeo: Codice europeo dell'istituzione (es. "E BARCELO01")
+            university: Se indicato, limita la ricerca a un'università di provenienza
+
+        Returns:
+            Lista di dizionari con university, department e posti totali
+        """
+        params = [codice_europeo]
+        university_clause = ""
+        if university is not None:
+            university_clause = "AND university = ?"
+            params.append(university)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT university, department, SUM(COALESCE(posti_num, 0)) AS posti "
+                f"FROM destinations WHERE codice_europeo = ? {university_clause} "
+                f"GROUP BY university, department ORDER BY university, department",
+                params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_destination(row: sqlite3.Row) -> DestinationUniversity:
+        return destination_from_fields({name: row[name] for name in DESTINATION_FIELDS})
+
+
+# Istanza globale dello store
+destinations_store = DestinationsStore()
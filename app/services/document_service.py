@@ -3,61 +3,180 @@
 Questo modulo si occupa di:
 1. Caricare i PDF da una directory
 2. Dividerli in chunk di testo gestibili per il vector store
+
+I PDF di una cartella vengono elaborati in parallelo sul pool di processi
+dell'estrazione e i chunk restituiti da un generatore, un file alla volta:
+in memoria ci sono al massimo i chunk dei file in elaborazione, qualunque
+sia la dimensione del corpus (vedi iter_split_pdfs).
+
+I chunk quasi duplicati (vedi near_duplicates.py) vengono eliminati prima
+di arrivare al vector store: all'interno di ogni file e, quando si
+indicizza un'intera cartella, anche tra file diversi.
 """
 
+from collections import deque
 from pathlib import Path
-from typing import List
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 from langchain.schema import Document
 
+from .near_duplicates import NearDuplicateFilter, deduplicate
+from .pdf_extraction import get_engine, get_process_pool, get_worker_count
+from .structured_splitter import StructuredTextSplitter
+from ..core.config import settings
+
+
+def create_text_splitter() -> StructuredTextSplitter:
+    """Splitter usato per tutti i documenti indicizzati (vedi structured_splitter.py)."""
+    return StructuredTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        fallback_overlap=settings.CHUNK_FALLBACK_OVERLAP,
+    )
 
-def load_and_split_documents(data_path: str) -> List[Document]:
-    """Carica e divide i PDF in chunks.
+
+def load_and_split_pdf(pdf_path: Path,
+                       text_splitter: Optional[StructuredTextSplitter] = None,
+                       workers: Optional[int] = None) -> List[Document]:
+    """Estrae il testo di un singolo PDF e lo divide in chunks.
 
     Args:
-        data_path: percorso alla cartella con i PDF
+        pdf_path: percorso al file PDF
+        text_splitter: splitter da usare (default: create_text_splitter())
+        workers: processi per l'estrazione delle pagine (default: settings.PDF_WORKERS)
 
     Returns:
-        Lista di Document con il testo diviso in chunks
+        Lista di Document con metadata "source" (nome del file), "page",
+        "section" se il chunk appartiene a un articolo o a una sezione e
+        "duplicates" se ha sostituito dei chunk quasi duplicati
+    """
+    pdf_path = Path(pdf_path)
+    text_splitter = text_splitter or create_text_splitter()
+
+    # Estrai il testo pagina per pagina (in parallelo per i PDF grandi)
+    page_texts = get_engine().extract_pages(str(pdf_path), mode="text", workers=workers)
+
+    # Aggiungi solo il nome del file e il numero di pagina come metadata
+    pages = [
+        Document(page_content=text, metadata={"source": pdf_path.name, "page": page_number})
+        for page_number, text in enumerate(page_texts)
+        if text.strip()
+    ]
+
+    # Dividi in chunk, senza i quasi duplicati (intestazioni, righe ripetute)
+    chunks = text_splitter.split_documents(pages)
+    if settings.DEDUP_ENABLED:
+        chunks = deduplicate(chunks, settings.DEDUP_THRESHOLD)
+    return chunks
+
+
+def count_duplicates(chunks: Iterable[Document]) -> int:
+    """Chunk quasi duplicati eliminati da load_and_split_pdf (metadata "duplicates")."""
+    return sum(chunk.metadata.get("duplicates", 0) for chunk in chunks)
+
+
+def _split_pdf_in_worker(pdf_path: str) -> List[Document]:
+    """Funzione eseguita nei processi del pool (deve essere importabile).
+
+    Le pagine vengono estratte nel processo stesso: il parallelismo è già tra i file.
+    """
+    return load_and_split_pdf(Path(pdf_path), workers=1)
+
+
+def iter_split_pdfs(pdf_paths: Iterable[Path],
+                    workers: Optional[int] = None) -> Iterator[Tuple[Path, Union[List[Document], Exception]]]:
+    """Divide in chunk più PDF in parallelo, restituendoli nell'ordine dei file.
+
+    Al massimo 2 * workers file sono in elaborazione (o in attesa di essere
+    consumati) alla volta, quindi la memoria non dipende dal numero di file.
+
+    Args:
+        pdf_paths: PDF da elaborare
+        workers: Numero di processi (default: settings.PDF_WORKERS)
+
+    Yields:
+        (pdf_path, chunks) oppure (pdf_path, eccezione) se il file non è leggibile
+    """
+    workers = get_worker_count(workers)
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            try:
+                yield pdf_path, load_and_split_pdf(pdf_path, workers=1)
+            except Exception as e:
+                yield pdf_path, e
+        return
+
+    pool = get_process_pool(workers)
+    pending = deque()
+    paths = iter(pdf_paths)
+    while True:
+        while len(pending) < 2 * workers:
+            pdf_path = next(paths, None)
+            if pdf_path is None:
+                break
+            pending.append((pdf_path, pool.submit(_split_pdf_in_worker, str(pdf_path))))
+        if not pending:
+            return
+        pdf_path, future = pending.popleft()
+        try:
+            yield pdf_path, future.result()
+        except Exception as e:
+            yield pdf_path, e
+
+
+def iter_split_documents(data_path: str, workers: Optional[int] = None) -> Iterator[Document]:
+    """Generatore dei chunk di tutti i PDF di una cartella.
+
+    Args:
+        data_path: percorso alla cartella con i PDF
+        workers: Numero di processi (default: settings.PDF_WORKERS)
+
+    Yields:
+        Document con il testo diviso in chunks, un file dopo l'altro
+
+    Raises:
+        ValueError: se la cartella non esiste
     """
     data_dir = Path(data_path)
     if not data_dir.exists():
         raise ValueError(f"Directory {data_path} non trovata")
 
-    documents = []
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,        # caratteri per chunk
-        chunk_overlap=200,      # overlap tra chunk
-    )
-    
-    pdf_files = list(data_dir.glob("*.pdf"))
+    pdf_files = sorted(data_dir.glob("*.pdf"))
     if not pdf_files:
         print(f"Nessun PDF trovato nella cartella {data_path}")
-        return []
+        return
 
-    # Processa ogni PDF nella directory
-    for pdf_path in pdf_files:
-        try:
-            # Carica il PDF
-            loader = PyPDFLoader(str(pdf_path))
-            pages = loader.load()
-            
-            # Aggiungi solo il nome del file come metadata
-            for page in pages:
-                page.metadata["source"] = pdf_path.name
-            
-            # Dividi in chunk
-            chunks = text_splitter.split_documents(pages)
-            documents.extend(chunks)
-            
-            print(f"Processato {pdf_path.name}: {len(chunks)} chunks creati")
-            
-        except Exception as e:
-            print(f"Errore nel processare {pdf_path.name}: {str(e)}")
+    # Duplicati tra file diversi: il filtro tiene solo le firme, i chunk vanno subito allo store
+    duplicates = NearDuplicateFilter(settings.DEDUP_THRESHOLD, annotate=False) if settings.DEDUP_ENABLED else None
+    removed_in_files = 0
+    for pdf_path, result in iter_split_pdfs(pdf_files, workers):
+        if isinstance(result, Exception):
+            print(f"Errore nel processare {pdf_path.name}: {str(result)}")
             continue
-    
-    return documents
+        removed = count_duplicates(result)
+        removed_in_files += removed
+        if duplicates is not None:
+            before = duplicates.removed
+            result = list(duplicates.filter(result))
+            removed += duplicates.removed - before
+        print(f"Processato {pdf_path.name}: {len(result)} chunks creati ({removed} quasi duplicati rimossi)")
+        yield from result
+
+    if duplicates is not None:
+        print(f"Deduplicazione: {removed_in_files} chunk rimossi all'interno dei file, {duplicates.summary()} tra file diversi")
+
+
+def load_and_split_documents(data_path: str) -> List[Document]:
+    """Carica e divide i PDF in chunks.
+
+    Per corpus grandi è preferibile passare iter_split_documents direttamente
+    a create_vector_store, senza costruire la lista.
+
+    Args:
+        data_path: percorso alla cartella con i PDF
+
+    Returns:
+        Lista di Document con il testo diviso in chunks
+    """
+    return list(iter_split_documents(data_path))
 
 
 def process_calls(calls_dir: str = "data/calls") -> List[Document]:
@@ -0,0 +1,301 @@
+"""Cache persistente degli embeddings.
+
+Ricalcolare gli embeddings di chunk già visti (reindicizzazione dopo una
+modifica ai parametri di chunking, ingestion su un'altra macchina, query
+ripetute) costa un passaggio completo del modello. Questa cache li conserva
+su disco, con chiave (nome del modello, hash del testo normalizzato):
+
+- `vectors.bin`: matrice N x dim di float16 (o float32) letta con np.memmap,
+  quindi senza caricarla in memoria
+- `index.sqlite3`: hash del testo -> riga della matrice
+
+Ogni modello ha la propria directory. Le scritture avvengono dentro una
+transazione SQLite esclusiva: i vettori vengono scritti nella matrice prima
+di rendere visibili le chiavi, così un altro processo non legge mai righe
+incomplete.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.embeddings.base import Embeddings
+
+from ..core.config import settings
+
+
+# Numero massimo di parametri in una singola query SQLite
+SQLITE_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vectors (
+    text_hash TEXT PRIMARY KEY,
+    row INTEGER NOT NULL
+);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Normalizza gli spazi, così chunk che differiscono solo per a capo condividono l'embedding."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str, kind: str = "document") -> str:
+    """Hash SHA-256 del testo normalizzato.
+
+    `kind` separa embeddings di documenti e di query: per alcuni modelli
+    (es. con istruzioni diverse per le query) non coincidono.
+    """
+    return hashlib.sha256(f"{kind}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Embeddings di più query con il minor numero di passaggi del modello.
+
+    Usa `embed_queries` dei wrapper di questo progetto, se disponibile. Per
+    SentenceTransformers query e documenti sono codificati allo stesso modo,
+    quindi basta un solo embed_documents; gli altri modelli ricevono una
+    query alla volta.
+    """
+    if not texts:
+        return []
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    if isinstance(embeddings, HuggingFaceEmbeddings):
+        return embeddings.embed_documents(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def model_slug(model_name: str) -> str:
+    """Nome di directory sicuro per un modello (es. "sentence-transformers__all-MiniLM-L6-v2")."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+
+
+class EmbeddingStore:
+    """Archivio su disco degli embeddings di un modello.
+
+    Attributes:
+        directory: Directory dell'archivio del modello
+        dtype: Tipo dei vettori salvati (float16 o float32)
+        dim: Dimensione dei vettori (nota dopo il primo inserimento)
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dtype: str = "float16"):
+        """Inizializza l'archivio creando lo schema se necessario.
+
+        Args:
+            cache_dir: Directory base della cache
+            model_name: Nome del modello di embeddings
+            dtype: "float16" (metà spazio) o "float32"
+        """
+        self.directory = Path(cache_dir) / model_slug(model_name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / "index.sqlite3"
+        self.vectors_path = self.directory / "vectors.bin"
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.memmap] = None
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            meta = dict(conn.execute("SELECT name, value FROM meta").fetchall())
+        # Il tipo dei vettori già salvati prevale sulla configurazione
+        self.dtype = np.dtype(meta.get("dtype", dtype))
+        self.dim: Optional[int] = int(meta["dim"]) if "dim" in meta else None
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _rows_capacity(self) -> int:
+        if self.dim is None or not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize)
+
+    def _get_matrix(self, min_rows: int) -> np.memmap:
+        """Mappa in memoria il file dei vettori, rimappandolo se è cresciuto."""
+        if self._matrix is None or self._matrix.shape[0] < min_rows:
+            rows = self._rows_capacity()
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(rows, self.dim))
+        return self._matrix
+
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Restituisce i vettori presenti in archivio (hash -> vettore float32)."""
+        if self.dim is None or not hashes:
+            return {}
+        rows: Dict[str, int] = {}
+        with self._connect() as conn:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), SQLITE_BATCH_SIZE):
+                batch = unique[start:start + SQLITE_BATCH_SIZE]
+                rows.update(conn.execute(
+                    f"SELECT text_hash, row FROM vectors WHERE text_hash IN ({', '.join('?' for _ in batch)})",
+                    batch
+                ).fetchall())
+        if not rows:
+            return {}
+        with self._lock:
+            matrix = self._get_matrix(max(rows.values()) + 1)
+            return {key: np.asarray(matrix[row], dtype=np.float32) for key, row in rows.items()}
+
+    def put_many(self, vectors: Dict[str, Sequence[float]]) -> None:
+        """Aggiunge i vettori non ancora presenti in archivio."""
+        if not vectors:
+            return
+        with self._lock, self._connect() as conn:
+            # Transazione esclusiva: un solo processo alla volta assegna le nuove righe
+            conn.execute("BEGIN IMMEDIATE")
+            if self.dim is None:
+                stored_dim = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+                self.dim = int(stored_dim[0]) if stored_dim else len(next(iter(vectors.values())))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO meta (name, value) VALUES (?, ?)",
+                    [("dim", str(self.dim)), ("dtype", self.dtype.name)]
+                )
+
+            existing = set()
+            keys = list(vectors)
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[start:start + SQLITE_BATCH_SIZE]
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT text_hash FROM vectors WHERE text_hash IN ({', '.join('?' for _ in batch)})",
+                    batch
+                ))
+            new_keys = [key for key in keys if key not in existing]
+            if not new_keys:
+                return
+
+            next_row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+            needed_rows = next_row + len(new_keys)
+            if self._rows_capacity() < needed_rows:
+                # Crescita geometrica del file per evitare di rimapparlo a ogni inserimento
+                capacity = max(needed_rows, 2 * self._rows_capacity(), 1024)
+                with open(self.vectors_path, "ab") as f:
+                    f.truncate(capacity * self.dim * self.dtype.itemsize)
+                self._matrix = None
+
+            matrix = self._get_matrix(needed_rows)
+            matrix[next_row:needed_rows] = np.asarray([vectors[key] for key in new_keys], dtype=self.dtype)
+            matrix.flush()
+            conn.executemany(
+                "INSERT INTO vectors (text_hash, row) VALUES (?, ?)",
+                [(key, next_row + offset) for offset, key in enumerate(new_keys)]
+            )
+
+    def count(self) -> int:
+        """Numero di vettori in archivio."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings LangChain che consultano l'archivio prima di eseguire il modello.
+
+    Attributes:
+        base: Embeddings originali (es. HuggingFaceEmbeddings)
+        store: Archivio persistente dei vettori
+        hits: Testi il cui vettore era in archivio
+        misses: Testi passati al modello
+    """
+
+    def __init__(self, base: Embeddings, store: EmbeddingStore):
+        """Inizializza il wrapper.
+
+        Args:
+            base: Embeddings originali
+            store: Archivio del modello di `base`
+        """
+        self.base = base
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings dei documenti; solo i testi mai visti passano dal modello."""
+        hashes = [text_hash(text) for text in texts]
+        found = self.store.get_many(hashes)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(key, text)
+
+        if missing:
+            computed = self.base.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing, computed))
+            self.store.put_many(new_vectors)
+            found.update({key: self._as_stored(vector) for key, vector in new_vectors.items()})
+
+        return [found[key].tolist() for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embedding di una query, dall'archivio se già calcolato."""
+        key = text_hash(text, kind="query")
+        found = self.store.get_many([key])
+        if key in found:
+            self.hits += 1
+            return found[key].tolist()
+
+        self.misses += 1
+        vector = self.base.embed_query(text)
+        self.store.put_many({key: vector})
+        return self._as_stored(vector).tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings di più query; quelle mai viste passano dal modello in un solo batch."""
+        hashes = [text_hash(text, kind="query") for text in texts]
+        found = self.store.get_many(hashes)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(key, text)
+
+        if missing:
+            computed = embed_queries(self.base, list(missing.values()))
+            new_vectors = dict(zip(missing, computed))
+            self.store.put_many(new_vectors)
+            found.update({key: self._as_stored(vector) for key, vector in new_vectors.items()})
+
+        return [found[key].tolist() for key in hashes]
+
+    def _as_stored(self, vector: Sequence[float]) -> np.ndarray:
+        """Arrotonda al tipo dell'archivio: lo stesso testo dà sempre lo stesso vettore."""
+        return np.asarray(vector, dtype=self.store.dtype).astype(np.float32)
+
+    def metrics(self) -> dict:
+        """Contatori della cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored_vectors": self.store.count(),
+            "dtype": self.store.dtype.name,
+        }
+
+
+def with_embedding_cache(base: Embeddings, model_name: str) -> Embeddings:
+    """Aggiunge la cache persistente agli embeddings, se abilitata in configurazione."""
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return base
+    store = EmbeddingStore(settings.EMBEDDING_CACHE_DIR, model_name, settings.EMBEDDING_CACHE_DTYPE)
+    return CachedEmbeddings(base, store)
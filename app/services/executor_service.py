@@ -0,0 +1,147 @@
+"""Esecuzione del lavoro bloccante fuori dall'event loop.
+
+Gli endpoint sono `async def`: qualsiasi chiamata sincrona lenta (parsing dei
+PDF, ricerche nel database vettoriale, letture da disco) eseguita
+direttamente blocca tutte le altre richieste servite dallo stesso worker.
+
+Questo modulo mette a disposizione due pool di thread limitati:
+1. "io": operazioni bloccanti su disco/database (molti thread, poco CPU)
+2. "cpu": parsing dei PDF e calcolo degli embeddings (pochi thread)
+
+Per ogni pool vengono raccolte metriche su task in coda, in esecuzione e
+completati, esposte da get_executor_metrics().
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from ..core.config import settings
+
+
+class BoundedExecutor:
+    """Pool di thread con concorrenza limitata e metriche sulla coda.
+
+    Attributes:
+        name: Nome del pool (usato nelle metriche)
+        max_workers: Numero massimo di task eseguiti contemporaneamente
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        """Inizializza il pool.
+
+        Args:
+            name: Nome del pool
+            max_workers: Numero massimo di task eseguiti contemporaneamente
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._max_queued = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Esegue `fn(*args, **kwargs)` nel pool e ne attende il risultato.
+
+        Se tutti i thread sono occupati il task resta in coda: la profondità
+        della coda è visibile nelle metriche.
+        """
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait += started_at - submitted_at
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._total_run += time.perf_counter() - started_at
+                    if failed:
+                        self._failed += 1
+                    else:
+                        self._completed += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), task)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        """Crea il pool alla prima richiesta (anche dopo uno shutdown)."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-worker")
+            return self._pool
+
+    def metrics(self) -> Dict[str, Any]:
+        """Fotografia delle metriche del pool."""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "max_queued": self._max_queued,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 3) if finished else 0.0,
+                "avg_run_ms": round(self._total_run / finished * 1000, 3) if finished else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        """Chiude il pool attendendo i task in corso."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def _cpu_workers() -> int:
+    if settings.EXECUTOR_CPU_WORKERS > 0:
+        return settings.EXECUTOR_CPU_WORKERS
+    return os.cpu_count() or 1
+
+
+# Pool globali
+io_executor = BoundedExecutor("io", settings.EXECUTOR_IO_WORKERS)
+cpu_executor = BoundedExecutor("cpu", _cpu_workers())
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Esegue una funzione bloccante di I/O nel pool "io"."""
+    return await io_executor.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Esegue una funzione CPU-bound (parsing PDF, embeddings) nel pool "cpu"."""
+    return await cpu_executor.run(fn, *args, **kwargs)
+
+
+def get_executor_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metriche di tutti i pool, per nome."""
+    return {executor.name: executor.metrics() for executor in (io_executor, cpu_executor)}
+
+
+def shutdown_executors() -> None:
+    """Chiude tutti i pool (allo spegnimento dell'applicazione)."""
+    io_executor.shutdown()
+    cpu_executor.shutdown()
@@ -0,0 +1,177 @@
+"""Cache dei testi estratti dai PDF.
+
+Ogni estrazione viene salvata con una chiave composta da:
+1. Hash SHA-256 del contenuto del PDF (non dal nome del file)
+2. Nome e versione dell'estrattore usato
+
+La cache ha due livelli:
+1. Una LRU in memoria, per le richieste ripetute sullo stesso processo
+2. Un archivio su disco, scritto in modo atomico (file temporaneo + rename)
+
+Se il PDF cambia, cambia l'hash e la vecchia estrazione non viene più usata;
+se cambia la logica di estrazione basta incrementarne la versione.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+from ..core.config import settings
+
+
+# Numero massimo di hash di file memorizzati (chiave: path, dimensione, mtime)
+FILE_HASH_MEMO_SIZE = 1024
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """Scrive un file di testo in modo atomico.
+
+    Il contenuto viene scritto in un file temporaneo nella stessa directory e
+    poi rinominato: i lettori vedono sempre il file vecchio o quello completo.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class ExtractionCache:
+    """Cache a due livelli (memoria + disco) dei testi estratti dai PDF.
+
+    Attributes:
+        cache_dir: Directory dell'archivio su disco
+        max_entries: Numero massimo di estrazioni tenute in memoria
+        hits: Estrazioni servite dalla memoria o dal disco
+        misses: Estrazioni che hanno richiesto il parsing del PDF
+    """
+
+    def __init__(self,
+                 cache_dir: str = settings.EXTRACTION_CACHE_DIR,
+                 max_entries: int = settings.EXTRACTION_CACHE_MAX_ENTRIES):
+        """Inizializza la cache.
+
+        Args:
+            cache_dir: Directory dell'archivio su disco
+            max_entries: Numero massimo di estrazioni tenute in memoria
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._file_hashes: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def file_hash(self, pdf_path: str) -> str:
+        """Calcola l'hash SHA-256 del contenuto di un file.
+
+        Il risultato viene memorizzato per (path, dimensione, mtime), così le
+        richieste successive sullo stesso file non lo rileggono.
+        """
+        stat = os.stat(pdf_path)
+        memo_key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._file_hashes.get(memo_key)
+            if cached is not None:
+                self._file_hashes.move_to_end(memo_key)
+                return cached
+
+        digest = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        file_hash = digest.hexdigest()
+
+        with self._lock:
+            self._file_hashes[memo_key] = file_hash
+            while len(self._file_hashes) > FILE_HASH_MEMO_SIZE:
+                self._file_hashes.popitem(last=False)
+        return file_hash
+
+    @staticmethod
+    def make_key(file_hash: str, extractor: str, version: int) -> str:
+        """Chiave di cache per un'estrazione."""
+        return f"{extractor}-v{version}-{file_hash}"
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        """Cerca un'estrazione prima in memoria e poi su disco."""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                return text
+
+        disk_path = self._disk_path(key)
+        if not disk_path.exists():
+            return None
+        text = disk_path.read_text(encoding='utf-8')
+        self._remember(key, text)
+        return text
+
+    def put(self, key: str, text: str, persist: bool = True) -> None:
+        """Salva un'estrazione in memoria e, se richiesto, su disco."""
+        self._remember(key, text)
+        if persist:
+            atomic_write_text(self._disk_path(key), text)
+
+    def _remember(self, key: str, text: str) -> None:
+        with self._lock:
+            self._memory[key] = text
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_or_extract(self,
+                       pdf_path: str,
+                       extractor: str,
+                       version: int,
+                       extract_fn: Callable[[str], str],
+                       persist: bool = True) -> str:
+        """Restituisce il testo estratto dal PDF, eseguendo l'estrazione solo se serve.
+
+        Args:
+            pdf_path: Percorso al file PDF
+            extractor: Nome dell'estrattore (fa parte della chiave)
+            version: Versione dell'estrattore (fa parte della chiave)
+            extract_fn: Funzione che estrae il testo dato il path del PDF
+            persist: Se False il risultato resta solo in memoria (es. file caricati dagli utenti)
+
+        Returns:
+            Testo estratto
+        """
+        key = self.make_key(self.file_hash(pdf_path), extractor, version)
+        text = self.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+
+        self.misses += 1
+        text = extract_fn(pdf_path)
+        self.put(key, text, persist=persist)
+        return text
+
+    def clear_memory(self) -> None:
+        """Svuota il livello in memoria (l'archivio su disco resta valido)."""
+        with self._lock:
+            self._memory.clear()
+            self._file_hashes.clear()
+
+
+# Istanza globale della cache
+extraction_cache = ExtractionCache()
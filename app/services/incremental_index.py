@@ -0,0 +1,305 @@
+"""Aggiornamento incrementale del database vettoriale.
+
+Invece di ricreare una categoria da zero con tutti i documenti, l'indicizzatore
+confronta i PDF della cartella sorgente con un manifest salvato accanto al
+database (`index_manifest.json` nella directory della categoria) che registra, per ogni
+file: firma (dimensione e data di modifica), hash SHA-256 del contenuto e id
+dei chunk inseriti.
+
+Per ogni file:
+1. Invariato (stessa firma o stesso hash): nessun lavoro
+2. Nuovo o modificato: i vecchi chunk vengono eliminati e quelli nuovi
+   inseriti (upsert con id deterministici)
+3. Non più presente nella cartella: i suoi chunk vengono eliminati
+
+Se il manifest non esiste (database creato con create_vector_store), i chunk
+già presenti vengono attribuiti al loro file tramite il metadata "source",
+così la prima esecuzione sostituisce i duplicati invece di aggiungerne altri.
+
+Il manifest viene salvato dopo ogni file (checkpoint): se l'indicizzazione
+si interrompe, l'esecuzione successiva riparte dai file non ancora elaborati.
+
+Dopo ogni modifica viene ricostruito anche l'indice BM25 della categoria
+(vedi lexical_index.py). Se la categoria è partizionata, i chunk vengono
+scritti anche nella partizione del loro file (il manifest ne registra i
+valori) e le partizioni mancanti vengono create dallo store completo.
+"""
+
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .document_service import count_duplicates, iter_split_pdfs
+from .destinations_store import source_signature
+from .extraction_cache import atomic_write_text, extraction_cache
+from .lexical_index import LEXICAL_INDEX_FILENAME
+from .vector_db_service import MANIFEST_FILENAME, VectorStoreService, vector_store_service
+
+
+# Versione della logica di chunking: se cambia, tutti i file vengono reindicizzati
+CHUNKING_VERSION = 4
+
+
+@dataclass
+class IndexReport:
+    """Riepilogo di un aggiornamento incrementale.
+
+    Attributes:
+        added: Chunk inseriti
+        removed: Chunk eliminati (file modificati o rimossi)
+        skipped: Chunk lasciati invariati (file non modificati)
+        files_indexed: File nuovi o modificati
+        files_removed: File non più presenti nella cartella
+        files_unchanged: File non modificati
+        files_failed: File che non è stato possibile processare
+        duplicates: Chunk quasi duplicati eliminati dai file indicizzati
+        seconds: Durata della divisione in chunk e della scrittura dei file indicizzati
+        timings: Durata in secondi di ogni fase (scan, split, write, lexical, partitions)
+    """
+    added: int = 0
+    removed: int = 0
+    skipped: int = 0
+    files_indexed: int = 0
+    files_removed: int = 0
+    files_unchanged: int = 0
+    files_failed: int = 0
+    duplicates: int = 0
+    seconds: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.added / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        """Riepilogo leggibile per i log degli script."""
+        return (
+            f"chunk: +{self.added} -{self.removed} ={self.skipped} ({self.duplicates} quasi duplicati scartati) | "
+            f"file: {self.files_indexed} indicizzati, {self.files_removed} rimossi, "
+            f"{self.files_unchanged} invariati, {self.files_failed} falliti | "
+            f"{self.chunks_per_second:.1f} chunk/s"
+        )
+
+    def timings_summary(self) -> str:
+        """Durata delle fasi per i log degli script (es. "scan 0.1 s, split 3.2 s")."""
+        return ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in self.timings.items())
+
+
+def chunk_ids(source: str, content_hash: str, count: int) -> List[str]:
+    """Id deterministici dei chunk di un file (stesso contenuto, stessi id)."""
+    return [f"{source}:{content_hash[:16]}:{index}" for index in range(count)]
+
+
+class IncrementalIndexer:
+    """Mantiene una categoria del database vettoriale allineata a una cartella di PDF.
+
+    Attributes:
+        category: Categoria del database vettoriale (es. 'calls')
+        service: Servizio che gestisce gli store
+        manifest_path: Path del manifest della categoria
+    """
+
+    def __init__(self, category: str, service: VectorStoreService = vector_store_service):
+        """Inizializza l'indicizzatore.
+
+        Args:
+            category: Categoria del database vettoriale
+            service: Servizio che gestisce gli store (default: istanza globale)
+        """
+        self.category = category
+        self.service = service
+        self.manifest_path = service.category_path(category) / MANIFEST_FILENAME
+
+    def load_manifest(self) -> Dict[str, dict]:
+        """Legge il manifest (sorgente -> firma, hash, id dei chunk)."""
+        if not self.manifest_path.exists():
+            return {}
+        data = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+        if data.get("chunking_version") != CHUNKING_VERSION:
+            # Chunking cambiato: le voci non valgono più, ma gli id servono per eliminarle
+            return {source: {**entry, "hash": None, "signature": None}
+                    for source, entry in data.get("files", {}).items()}
+        return data.get("files", {})
+
+    def save_manifest(self, files: Dict[str, dict]) -> None:
+        """Salva il manifest in modo atomico."""
+        data = {"chunking_version": CHUNKING_VERSION, "files": files}
+        atomic_write_text(self.manifest_path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def _manifest_from_collection(self) -> Dict[str, dict]:
+        """Ricostruisce un manifest dai chunk già presenti (database senza manifest)."""
+        store = self.service.get_store(self.category, create=True)
+        existing = store.get(include=["metadatas"])
+        files: Dict[str, dict] = {}
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            source = (metadata or {}).get("source")
+            if source is None:
+                continue
+            entry = files.setdefault(source, {"signature": None, "hash": None, "chunk_ids": []})
+            entry["chunk_ids"].append(chunk_id)
+        return files
+
+    def update(self, source_dir: str, dry_run: bool = False) -> IndexReport:
+        """Allinea la categoria ai PDF di una cartella.
+
+        Args:
+            source_dir: Cartella con i PDF da indicizzare
+            dry_run: Se True calcola solo il riepilogo, senza modificare nulla
+
+        Returns:
+            IndexReport con i conteggi di chunk e file
+
+        Raises:
+            ValueError: se la cartella non esiste
+        """
+        source_path = Path(source_dir)
+        if not source_path.exists():
+            raise ValueError(f"Directory {source_dir} non trovata")
+
+        db_exists = self.service.exists(self.category)
+        if self.manifest_path.exists():
+            manifest = self.load_manifest()
+        elif db_exists:
+            manifest = self._manifest_from_collection()
+        else:
+            manifest = {}
+        store = None if dry_run else self.service.get_store(self.category, create=True)
+        # Voci senza partizioni: categoria indicizzata prima del partizionamento
+        build_partitions = (self.service.partition_key(self.category) is not None
+                            and any("partitions" not in entry for entry in manifest.values()))
+        report = IndexReport()
+        updated: Dict[str, dict] = {}
+        # Stato salvato dopo ogni file: le voci non ancora elaborate restano quelle precedenti
+        checkpoint: Dict[str, dict] = dict(manifest)
+        # Sorgente -> (voce precedente del manifest, firma, hash) dei file da indicizzare
+        to_index: Dict[str, Tuple[Optional[dict], str, str]] = {}
+
+        pdf_files = {pdf_path.name: pdf_path for pdf_path in sorted(source_path.glob("*.pdf"))}
+
+        # File non più presenti: elimina i loro chunk
+        for source, entry in manifest.items():
+            if source in pdf_files:
+                continue
+            report.files_removed += 1
+            report.removed += len(entry["chunk_ids"])
+            if store is not None:
+                if entry["chunk_ids"]:
+                    self.service.delete_documents(self.category, entry["chunk_ids"], entry.get("partitions", []))
+                del checkpoint[source]
+                self.save_manifest(checkpoint)
+            print(f"🗑️  {source}: rimosso ({len(entry['chunk_ids'])} chunk)")
+
+        stage_start = time.perf_counter()
+        for source, pdf_path in pdf_files.items():
+            previous: Optional[dict] = manifest.get(source)
+            signature = source_signature(pdf_path)
+
+            # Stessa firma: il file non è cambiato, non serve nemmeno l'hash
+            if previous is not None and previous.get("hash") and previous.get("signature") == signature:
+                updated[source] = previous
+                report.files_unchanged += 1
+                report.skipped += len(previous["chunk_ids"])
+                continue
+
+            content_hash = extraction_cache.file_hash(str(pdf_path))
+            if previous is not None and previous.get("hash") == content_hash:
+                updated[source] = {**previous, "signature": signature}
+                report.files_unchanged += 1
+                report.skipped += len(previous["chunk_ids"])
+                continue
+
+            to_index[source] = (previous, signature, content_hash)
+        report.timings["scan"] = time.perf_counter() - stage_start
+
+        # File nuovi o modificati: divisi in chunk in parallelo e scritti un file alla volta
+        start = time.perf_counter()
+        report.timings["split"] = report.timings["write"] = 0.0
+        split_files = iter_split_pdfs([pdf_files[source] for source in to_index])
+        while True:
+            # Tempo di attesa dei chunk dal pool (la divisione prosegue durante la scrittura)
+            stage_start = time.perf_counter()
+            pdf_path, chunks = next(split_files, (None, None))
+            report.timings["split"] += time.perf_counter() - stage_start
+            if pdf_path is None:
+                break
+            source = pdf_path.name
+            previous, signature, content_hash = to_index[source]
+            if isinstance(chunks, Exception):
+                print(f"❌ Errore nel processare {source}: {chunks}")
+                report.files_failed += 1
+                if previous is not None:
+                    updated[source] = previous
+                continue
+
+            ids = chunk_ids(source, content_hash, len(chunks))
+            old_ids = previous["chunk_ids"] if previous is not None else []
+            partitions = []
+            stage_start = time.perf_counter()
+            if store is not None:
+                if old_ids:
+                    self.service.delete_documents(self.category, old_ids, previous.get("partitions", []))
+                partitions = self.service.add_documents(self.category, chunks, ids)
+            updated[source] = {
+                "signature": signature,
+                "hash": content_hash,
+                "chunk_ids": ids,
+                "partitions": partitions,
+                "indexed_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            if store is not None:
+                checkpoint[source] = updated[source]
+                self.save_manifest(checkpoint)
+            report.timings["write"] += time.perf_counter() - stage_start
+            report.files_indexed += 1
+            report.added += len(chunks)
+            report.duplicates += count_duplicates(chunks)
+            report.removed += len(old_ids)
+            print(f"📄 {source}: {len(chunks)} chunk indicizzati" + (f" ({len(old_ids)} sostituiti)" if old_ids else ""))
+        report.seconds = time.perf_counter() - start
+
+        if not dry_run:
+            if build_partitions:
+                # Categoria indicizzata prima del partizionamento
+                stage_start = time.perf_counter()
+                created = self.service.build_partitions(self.category)
+                partition_of = {chunk_id: value for value, ids in created.items() for chunk_id in ids}
+                for entry in updated.values():
+                    values = {partition_of[chunk_id] for chunk_id in entry["chunk_ids"] if chunk_id in partition_of}
+                    entry["partitions"] = sorted(set(entry.get("partitions", [])) | values, key=str)
+                print(f"🧩 {len(created)} partizioni create per '{self.category}'")
+                report.timings["partitions"] = time.perf_counter() - stage_start
+            self.save_manifest(updated)
+            lexical_index_path = self.service.category_path(self.category) / LEXICAL_INDEX_FILENAME
+            if report.added or report.removed or not lexical_index_path.exists():
+                stage_start = time.perf_counter()
+                self.service.build_lexical_index(self.category)
+                report.timings["lexical"] = time.perf_counter() - stage_start
+        return report
+
+
+def update_vector_store(source_dir: str, category: str, dry_run: bool = False) -> IndexReport:
+    """Aggiorna in modo incrementale una categoria con i PDF di una cartella."""
+    return IncrementalIndexer(category).update(source_dir, dry_run=dry_run)
+
+
+def load_ingestion_manifest(manifest_path: str) -> Dict[str, Path]:
+    """Legge il manifest dell'ingestion (categoria -> cartella dei PDF).
+
+    Formato:
+        {"categories": {"calls": {"source_dir": "calls"}, ...}}
+
+    Le cartelle relative sono risolte rispetto alla directory del manifest.
+
+    Raises:
+        ValueError: se il manifest non esiste o non ha categorie
+    """
+    path = Path(manifest_path)
+    if not path.exists():
+        raise ValueError(f"Manifest {manifest_path} non trovato")
+    categories = json.loads(path.read_text(encoding='utf-8')).get("categories") or {}
+    if not categories:
+        raise ValueError(f"Nessuna categoria nel manifest {manifest_path}")
+    return {category: path.parent / entry["source_dir"] for category, entry in categories.items()}
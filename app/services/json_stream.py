@@ -0,0 +1,82 @@
+"""Parsing incrementale di array JSON generati in streaming.
+
+Quando Gemini restituisce la risposta a pezzi, l'array completo arriva solo
+alla fine. JsonArrayStreamParser riceve il testo man mano che arriva e
+restituisce ogni oggetto dell'array appena la sua parentesi di chiusura è
+stata letta, così il chiamante può inoltrarlo subito al client.
+
+Il testo prima della "[" iniziale (es. i marcatori ```json) viene ignorato.
+"""
+
+import json
+from typing import Any, Dict, List
+
+
+class JsonArrayStreamParser:
+    """Estrae gli oggetti di primo livello di un array JSON ricevuto a pezzi.
+
+    Attributes:
+        finished: True quando è stata letta la "]" di chiusura dell'array
+        skipped: Oggetti scartati perché non erano JSON valido
+    """
+
+    def __init__(self):
+        """Inizializza il parser in attesa della "[" iniziale."""
+        self.finished = False
+        self.skipped = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Aggiunge un pezzo di testo e restituisce gli oggetti completati.
+
+        Args:
+            text: Nuovo testo della risposta
+
+        Returns:
+            Gli oggetti dell'array chiusi in questo pezzo, nell'ordine
+        """
+        completed = []
+        for char in text:
+            if self.finished:
+                break
+            if not self._started:
+                self._started = char == "["
+                continue
+            if self._depth == 0:
+                # Tra un oggetto e l'altro contano solo "{" e "]"
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == "]":
+                    self.finished = True
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit("".join(self._buffer), completed)
+                    self._buffer = []
+        return completed
+
+    def _emit(self, raw_object: str, completed: List[Dict[str, Any]]) -> None:
+        try:
+            completed.append(json.loads(raw_object))
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            print(f"⚠️ Oggetto JSON non valido nella risposta in streaming: {e}")
@@ -0,0 +1,201 @@
+"""Indice lessicale BM25 delle categorie del database vettoriale.
+
+I bandi contengono molti token esatti che il modello di embeddings
+rappresenta male: codici Erasmus (es. "E  BARCELO01"), date, livelli QCER
+(es. "B2"). Accanto a ogni categoria Chroma viene quindi salvato un indice
+BM25 (`vector_db/<categoria>/bm25_index.json`) costruito durante
+l'ingestion con gli stessi chunk del database vettoriale.
+
+Nella ricerca ibrida le due classifiche (vettoriale e BM25) vengono unite
+con la reciprocal rank fusion:
+
+    score(d) = somma su ogni classifica di 1 / (RRF_K + posizione di d)
+
+che non richiede di rendere confrontabili i punteggi dei due metodi.
+"""
+
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+from .extraction_cache import atomic_write_text
+
+
+LEXICAL_INDEX_FILENAME = "bm25_index.json"
+
+# Versione del formato e della tokenizzazione: se cambia, l'indice va ricostruito
+LEXICAL_INDEX_VERSION = 1
+
+# Parametri standard di BM25 (saturazione dei termini e normalizzazione per lunghezza)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Costante della reciprocal rank fusion (valore usato nell'articolo originale)
+RRF_K = 60
+
+# Codice Erasmus (es. "E  BARCELO01"): indicizzato anche come token unico "e_barcelo01"
+ERASMUS_CODE_PATTERN = re.compile(r'\b([A-Z]{1,3})\s{1,2}([A-Z][A-Z\-]{1,8}\d{2})\b')
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Token in minuscolo del testo, con i codici Erasmus anche come token unico."""
+    tokens = [token.casefold() for token in TOKEN_PATTERN.findall(text)]
+    tokens.extend(f"{country}_{code}".casefold() for country, code in ERASMUS_CODE_PATTERN.findall(text))
+    return tokens
+
+
+def matches_filter(metadata: Optional[dict], filter_metadata: Optional[dict]) -> bool:
+    """Applica un filtro in stile Chroma ai metadati di un chunk.
+
+    Supporta l'uguaglianza ({"source": "unipi.pdf"}), gli operatori "$eq"
+    e "$in" e la combinazione "$and".
+    """
+    if not filter_metadata:
+        return True
+    metadata = metadata or {}
+    for key, condition in filter_metadata.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub_filter) for sub_filter in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def document_key(document: Document) -> Tuple:
+    """Identità di un chunk, uguale per i risultati di Chroma e di BM25."""
+    metadata = document.metadata or {}
+    return (metadata.get("source"), metadata.get("page"), document.page_content)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Hashable]:
+    """Unisce più classifiche in una sola, ordinata per punteggio RRF decrescente."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for position, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + position + 1)
+    # A parità di punteggio vince l'ordine di prima apparizione (sorted è stabile)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+def fuse_documents(rankings: Sequence[Sequence[Document]], top_k: int) -> List[Document]:
+    """Reciprocal rank fusion di più liste di Document, deduplicate per chunk."""
+    documents: Dict[Tuple, Document] = {}
+    key_rankings = []
+    for ranking in rankings:
+        keys = []
+        for document in ranking:
+            key = document_key(document)
+            documents.setdefault(key, document)
+            keys.append(key)
+        key_rankings.append(keys)
+    return [documents[key] for key in reciprocal_rank_fusion(key_rankings)[:top_k]]
+
+
+class BM25Index:
+    """Indice BM25 in memoria dei chunk di una categoria.
+
+    Attributes:
+        documents: Testi dei chunk
+        metadatas: Metadati dei chunk
+        doc_lengths: Numero di token di ogni chunk
+        avg_length: Lunghezza media dei chunk
+    """
+
+    def __init__(self, documents: List[str], metadatas: List[dict]):
+        """Costruisce l'indice.
+
+        Args:
+            documents: Testi dei chunk
+            metadatas: Metadati dei chunk (stesso ordine dei testi)
+        """
+        self.documents = documents
+        self.metadatas = metadatas
+        self.doc_lengths: List[int] = []
+        # termine -> [(chunk, frequenza nel chunk)]
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        for doc_id, text in enumerate(documents):
+            frequencies = Counter(tokenize(text))
+            self.doc_lengths.append(sum(frequencies.values()))
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, []).append((doc_id, frequency))
+
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        count = len(documents)
+        self._idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """Punteggio BM25 dei chunk che contengono almeno un termine della query."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for doc_id, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 5, filter_metadata: Optional[dict] = None) -> List[Document]:
+        """Chunk più rilevanti per la query secondo BM25.
+
+        Args:
+            query: Testo della query
+            top_k: Numero massimo di risultati
+            filter_metadata: Filtro sui metadati in stile Chroma (es. {"source": "unipi.pdf"})
+
+        Returns:
+            Lista di Document ordinata per punteggio decrescente
+        """
+        scores = self.scores(query)
+        ranked = sorted(
+            (doc_id for doc_id in scores if matches_filter(self.metadatas[doc_id], filter_metadata)),
+            key=lambda doc_id: (-scores[doc_id], doc_id)
+        )
+        return [
+            Document(page_content=self.documents[doc_id], metadata=dict(self.metadatas[doc_id] or {}))
+            for doc_id in ranked[:top_k]
+        ]
+
+    def save(self, path: Path) -> None:
+        """Salva i chunk su disco in modo atomico (l'indice viene ricostruito al caricamento)."""
+        data = {"version": LEXICAL_INDEX_VERSION, "documents": self.documents, "metadatas": self.metadatas}
+        atomic_write_text(Path(path), json.dumps(data, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BM25Index"]:
+        """Carica l'indice salvato con save (None se manca o ha un formato diverso)."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != LEXICAL_INDEX_VERSION:
+            return None
+        return cls(data["documents"], data["metadatas"])
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document]) -> "BM25Index":
+        """Costruisce l'indice da Document LangChain."""
+        documents = list(documents)
+        return cls([doc.page_content for doc in documents], [dict(doc.metadata or {}) for doc in documents])
@@ -0,0 +1,136 @@
+"""Eliminazione dei chunk quasi duplicati (MinHash + LSH).
+
+Bandi e cataloghi ripetono intestazioni, note legali e righe identiche per
+ogni livello di studio (es. le righe di SOUTH-WEST UNIVERSITY "NEOFIT
+RILSKI" nel file delle destinazioni). Questi duplicati occupano i primi
+posti del retrieval e gonfiano i prompt.
+
+Per ogni chunk si calcola una firma MinHash (NUM_PERMUTATIONS minimi degli
+hash dei trigrammi di parole). La firma è divisa in LSH_BANDS bande: due
+chunk sono candidati se coincidono in almeno una banda, e sono duplicati se
+la similarità di Jaccard stimata dalle firme supera la soglia. Il primo
+chunk viene tenuto e conta i duplicati eliminati nel metadata "duplicates".
+"""
+
+import re
+import zlib
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+
+NUM_PERMUTATIONS = 64
+# 8 bande da 8 righe: coppie con Jaccard ~0.77 hanno il 50% di probabilità di essere candidate
+LSH_BANDS = 8
+SHINGLE_SIZE = 3
+
+# Primo maggiore di 2^32: gli hash dei trigrammi (crc32) sono minori del modulo
+HASH_PRIME = np.uint64(4294967311)
+_random = np.random.RandomState(42)
+# Coefficienti minori di 2^31: a * x + b resta sotto 2^64 senza overflow
+_PERM_A = _random.randint(1, 2 ** 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _random.randint(0, 2 ** 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """Trigrammi di parole del testo normalizzato (le parole stesse se il testo è più corto)."""
+    words = [word.casefold() for word in WORD_PATTERN.findall(text)]
+    if len(words) < size:
+        return words
+    return [" ".join(words[index:index + size]) for index in range(len(words) - size + 1)]
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """Firma MinHash del testo (NUM_PERMUTATIONS valori uint64)."""
+    tokens = shingles(text) or [text]
+    # crc32 è deterministico tra processi, a differenza di hash()
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in set(tokens)), dtype=np.uint64)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % HASH_PRIME
+    return permuted.min(axis=0)
+
+
+def estimated_jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    """Similarità di Jaccard stimata da due firme MinHash."""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateFilter:
+    """Filtro incrementale dei chunk quasi duplicati.
+
+    Attributes:
+        threshold: Similarità di Jaccard stimata oltre la quale un chunk è un duplicato
+        kept: Chunk tenuti
+        removed: Chunk eliminati
+        removed_chars: Caratteri eliminati
+    """
+
+    def __init__(self, threshold: float = 0.85, annotate: bool = True):
+        """Inizializza il filtro.
+
+        Args:
+            threshold: Soglia di similarità (1.0 = solo duplicati esatti a meno di spazi e maiuscole)
+            annotate: Se True conta i duplicati nel metadata del chunk tenuto. Richiede di
+                tenere i chunk in memoria: da disattivare quando i chunk vengono scritti
+                nello store man mano (restano solo le firme, 512 byte per chunk)
+        """
+        self.threshold = threshold
+        self.annotate = annotate
+        self.kept = 0
+        self.removed = 0
+        self.removed_chars = 0
+        self._rows = NUM_PERMUTATIONS // LSH_BANDS
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self._signatures: List[np.ndarray] = []
+        self._documents: List[Document] = []
+
+    def add(self, document: Document) -> bool:
+        """Registra un chunk.
+
+        Returns:
+            True se il chunk è nuovo, False se è un duplicato di uno già visto
+            (in tal caso il metadata "duplicates" del primo viene incrementato)
+        """
+        signature = minhash_signature(document.page_content)
+        bands = [
+            (band, signature[band * self._rows:(band + 1) * self._rows].tobytes())
+            for band in range(LSH_BANDS)
+        ]
+
+        candidates = {index for key in bands for index in self._buckets.get(key, ())}
+        for index in sorted(candidates):
+            if estimated_jaccard(signature, self._signatures[index]) >= self.threshold:
+                if self.annotate:
+                    original = self._documents[index]
+                    original.metadata["duplicates"] = original.metadata.get("duplicates", 0) + 1
+                self.removed += 1
+                self.removed_chars += len(document.page_content)
+                return False
+
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        if self.annotate:
+            self._documents.append(document)
+        for key in bands:
+            self._buckets.setdefault(key, []).append(position)
+        self.kept += 1
+        return True
+
+    def filter(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Restituisce solo i chunk nuovi, nell'ordine ricevuto."""
+        for document in documents:
+            if self.add(document):
+                yield document
+
+    def summary(self) -> str:
+        """Riepilogo leggibile per i log."""
+        total = self.kept + self.removed
+        share = 100 * self.removed / total if total else 0.0
+        return f"{self.removed} chunk quasi duplicati rimossi su {total} ({share:.1f}%, {self.removed_chars} caratteri)"
+
+
+def deduplicate(documents: Iterable[Document], threshold: float = 0.85) -> List[Document]:
+    """Elimina i chunk quasi duplicati di una lista (il primo di ogni gruppo viene tenuto)."""
+    return list(NearDuplicateFilter(threshold).filter(documents))
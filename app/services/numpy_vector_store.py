@@ -0,0 +1,307 @@
+"""Vector store NumPy a forza bruta per categorie piccole.
+
+Con poche migliaia di chunk (es. 'calls', 'lista_università') una ricerca
+esatta su tutta la matrice degli embeddings costa meno dell'indice HNSW di
+Chroma, e non richiede SQLite, thread in background o file aperti. Lo store
+salva nella directory della categoria:
+
+- `vectors.npy`: matrice N x dim degli embeddings normalizzati (float32 o
+  float16), letta con np.load(mmap_mode="r"), quindi senza caricarla in memoria
+- `records.json`: id, testi e metadati dei chunk, questi ultimi per colonne
+  (nome del metadato -> valori) così i filtri diventano confronti vettoriali
+
+Una ricerca è un solo prodotto matrice-vettore (similarità coseno) seguito
+da np.argpartition sui primi k risultati; più query insieme diventano un
+solo prodotto matrice-matrice. Le modifiche riscrivono entrambi
+i file in modo atomico: lo store è pensato per corpus piccoli, aggiornati
+di rado.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+
+from .extraction_cache import atomic_write_text
+
+
+VECTORS_FILENAME = "vectors.npy"
+RECORDS_FILENAME = "records.json"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normalizza le righe a norma 1 (il prodotto scalare diventa la similarità coseno)."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def atomic_save_array(path: Path, array: np.ndarray) -> None:
+    """Salva un array .npy con un file temporaneo rinominato (come atomic_write_text)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class NumpyVectorStore(VectorStore):
+    """VectorStore LangChain su una matrice NumPy mappata in memoria.
+
+    Espone i metodi di Chroma usati dal progetto (similarity_search con
+    filtro, add_documents con id, delete, get, as_retriever, persist).
+
+    Attributes:
+        directory: Directory dello store
+        dtype: Tipo dei vettori salvati (float32 o float16)
+    """
+
+    def __init__(self, directory: str, embedding_function: Embeddings, dtype: str = "float32"):
+        """Apre lo store, se esiste già su disco.
+
+        Args:
+            directory: Directory dello store
+            embedding_function: Embeddings usati per documenti e query
+            dtype: Tipo dei nuovi vettori ("float32" o "float16")
+        """
+        self.directory = Path(directory)
+        self.dtype = np.dtype(dtype)
+        self._embedding = embedding_function
+        self._lock = threading.Lock()
+        # Stato immutabile sostituito in blocco a ogni modifica: le ricerche
+        # in corso continuano a usare la versione che hanno letto
+        self._state = self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """True se nella directory c'è uno store salvato."""
+        return (Path(directory) / RECORDS_FILENAME).exists()
+
+    def _load(self) -> dict:
+        records_path = self.directory / RECORDS_FILENAME
+        if not records_path.exists():
+            return self._build_state([], [], [], None)
+        records = json.loads(records_path.read_text(encoding="utf-8"))
+        matrix = np.load(self.directory / VECTORS_FILENAME, mmap_mode="r")
+        count = len(records["ids"])
+        metadatas = [
+            {key: column[row] for key, column in records["columns"].items() if column[row] is not None}
+            for row in range(count)
+        ]
+        return self._build_state(records["ids"], records["documents"], metadatas, matrix)
+
+    @staticmethod
+    def _build_state(ids: List[str], documents: List[str], metadatas: List[dict], matrix: Optional[np.ndarray]) -> dict:
+        keys = sorted({key for metadata in metadatas for key in metadata})
+        columns = {key: np.array([metadata.get(key) for metadata in metadatas], dtype=object) for key in keys}
+        return {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "columns": columns,
+            "matrix": matrix,
+        }
+
+    def _save(self, ids: List[str], documents: List[str], metadatas: List[dict], matrix: np.ndarray) -> None:
+        """Scrive lo store su disco e lo rimappa in memoria."""
+        state = self._build_state(ids, documents, metadatas, None)
+        atomic_save_array(self.directory / VECTORS_FILENAME, matrix.astype(self.dtype, copy=False))
+        records = {
+            "ids": ids,
+            "documents": documents,
+            "columns": {key: column.tolist() for key, column in state["columns"].items()},
+        }
+        atomic_write_text(self.directory / RECORDS_FILENAME, json.dumps(records, ensure_ascii=False))
+        state["matrix"] = np.load(self.directory / VECTORS_FILENAME, mmap_mode="r")
+        self._state = state
+
+    def __len__(self) -> int:
+        return len(self._state["ids"])
+
+    # --- Scrittura ---
+
+    def add_texts(self,
+                  texts: Iterable[str],
+                  metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None,
+                  **kwargs: Any) -> List[str]:
+        """Calcola gli embeddings dei testi e li aggiunge (o sostituisce, a parità di id)."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = [dict(metadata or {}) for metadata in (metadatas or [{} for _ in texts])]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        vectors = normalize_rows(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+
+        with self._lock:
+            state = self._state
+            replaced = set(ids)
+            keep = [row for row, chunk_id in enumerate(state["ids"]) if chunk_id not in replaced]
+            old_matrix = state["matrix"] if state["matrix"] is not None else np.empty((0, vectors.shape[1]), dtype=self.dtype)
+            self._save(
+                [state["ids"][row] for row in keep] + ids,
+                [state["documents"][row] for row in keep] + texts,
+                [state["metadatas"][row] for row in keep] + metadatas,
+                np.concatenate([np.asarray(old_matrix[keep], dtype=self.dtype), vectors.astype(self.dtype)]),
+            )
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        """Elimina i chunk con gli id indicati."""
+        if not ids:
+            return
+        removed = set(ids)
+        with self._lock:
+            state = self._state
+            keep = [row for row, chunk_id in enumerate(state["ids"]) if chunk_id not in removed]
+            if len(keep) == len(state["ids"]):
+                return
+            self._save(
+                [state["ids"][row] for row in keep],
+                [state["documents"][row] for row in keep],
+                [state["metadatas"][row] for row in keep],
+                np.asarray(state["matrix"][keep], dtype=self.dtype),
+            )
+
+    def persist(self) -> None:
+        """Le modifiche sono già su disco (compatibilità con Chroma)."""
+
+    # --- Lettura ---
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> dict:
+        """Chunk salvati, nello stesso formato di Chroma.get (id, documents, metadatas)."""
+        state = self._state
+        rows = range(len(state["ids"]))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row in rows if state["ids"][row] in wanted]
+        include = include or ["documents", "metadatas"]
+        return {
+            "ids": [state["ids"][row] for row in rows],
+            "documents": [state["documents"][row] for row in rows] if "documents" in include else None,
+            "metadatas": [state["metadatas"][row] for row in rows] if "metadatas" in include else None,
+        }
+
+    def _filter_mask(self, columns: Dict[str, np.ndarray], count: int, filter_metadata: Optional[dict]) -> np.ndarray:
+        """Maschera booleana delle righe che soddisfano un filtro in stile Chroma."""
+        mask = np.ones(count, dtype=bool)
+        for key, condition in (filter_metadata or {}).items():
+            if key == "$and":
+                for sub_filter in condition:
+                    mask &= self._filter_mask(columns, count, sub_filter)
+                continue
+            column = columns.get(key)
+            if column is None:
+                return np.zeros(count, dtype=bool)
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    mask &= column == condition["$eq"]
+                if "$in" in condition:
+                    mask &= np.isin(column, list(condition["$in"]))
+            else:
+                mask &= column == condition
+        return mask
+
+    def similarity_search_with_score_by_vectors(self,
+                                                embeddings: List[List[float]],
+                                                k: int = 4,
+                                                filter: Optional[dict] = None) -> List[List[Tuple[Document, float]]]:
+        """Primi k chunk per ognuno dei vettori, con un solo prodotto matrice-matrice.
+
+        Args:
+            embeddings: Vettori delle query
+            k: Numero massimo di risultati per query
+            filter: Filtro sui metadati, comune a tutte le query
+
+        Returns:
+            Per ogni vettore, lista di (Document, similarità coseno) in ordine decrescente
+        """
+        state = self._state
+        matrix = state["matrix"]
+        if matrix is None or not len(state["ids"]) or k <= 0 or not len(embeddings):
+            return [[] for _ in embeddings]
+
+        queries = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if filter:
+            candidates = np.flatnonzero(self._filter_mask(state["columns"], len(state["ids"]), filter))
+            matrix = matrix[candidates]
+        else:
+            candidates = np.arange(len(state["ids"]))
+        k = min(k, len(candidates))
+        if k == 0:
+            return [[] for _ in embeddings]
+
+        # I float16 non hanno un prodotto BLAS: vengono convertiti in float32 per il calcolo
+        scores = (matrix if matrix.dtype == np.float32 else np.asarray(matrix, dtype=np.float32)) @ queries.T
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for column in range(queries.shape[0]):
+            column_top = top[:, column]
+            column_top = column_top[np.argsort(-scores[column_top, column], kind="stable")]
+            results.append([
+                (Document(page_content=state["documents"][row], metadata=dict(state["metadatas"][row])),
+                 float(scores[index, column]))
+                for index, row in zip(column_top, candidates[column_top])
+            ])
+        return results
+
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 4, filter: Optional[dict] = None) -> List[List[Document]]:
+        """Come similarity_search_with_score_by_vectors, senza punteggi."""
+        return [[doc for doc, _ in results] for results in self.similarity_search_with_score_by_vectors(embeddings, k, filter)]
+
+    def similarity_search_with_score_by_vector(self,
+                                               embedding: List[float],
+                                               k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Primi k chunk per similarità coseno con il vettore, con il punteggio."""
+        return self.similarity_search_with_score_by_vectors([embedding], k, filter)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k, filter)
+
+    def _select_relevance_score_fn(self):
+        # I punteggi sono già similarità coseno in [-1, 1]: li riporta in [0, 1]
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls,
+                   texts: List[str],
+                   embedding: Embeddings,
+                   metadatas: Optional[List[dict]] = None,
+                   persist_directory: Optional[str] = None,
+                   ids: Optional[List[str]] = None,
+                   dtype: str = "float32",
+                   **kwargs: Any) -> "NumpyVectorStore":
+        """Crea lo store da zero con i testi indicati."""
+        if persist_directory is None:
+            raise ValueError("NumpyVectorStore richiede persist_directory")
+        store = cls(persist_directory, embedding, dtype=dtype)
+        # I chunk già presenti vengono sostituiti alla prima scrittura
+        store._state = store._build_state([], [], [], None)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,295 @@
+"""Motori di estrazione del testo dai PDF.
+
+Sono disponibili due motori intercambiabili (vedi settings.PDF_ENGINE):
+1. "pymupdf": testo con PyMuPDF; pdfplumber viene usato solo per le tabelle,
+   e solo sulle pagine che contengono una griglia di linee
+2. "pdfplumber": estrazione storica, tutto con pdfplumber
+
+Entrambi scrivono il risultato in un buffer (io.StringIO) invece di
+concatenare stringhe pagina per pagina. I PDF grandi vengono divisi in
+intervalli di pagine estratti in parallelo su un pool di processi.
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Type
+
+import fitz  # PyMuPDF
+import pdfplumber
+
+from ..core.config import settings
+
+
+# Modalità di estrazione supportate
+EXTRACTION_MODES = ("text", "tables", "tables_and_text")
+
+# Numero minimo di linee orizzontali e verticali perché una pagina
+# venga considerata come contenente una tabella
+MIN_TABLE_RULES = 2
+
+
+def format_table_row(row: List[Optional[str]]) -> str:
+    """Converte una riga di tabella di pdfplumber in celle separate da " | "."""
+    cleaned_row = [
+        cell.replace('\n', ' ').strip() if cell is not None else ""
+        for cell in row
+    ]
+    return " | ".join(cleaned_row)
+
+
+def write_tables(buffer: io.StringIO, tables: List[List[List[Optional[str]]]]) -> None:
+    """Scrive nel buffer le tabelle estratte da una pagina, una riga per riga."""
+    for table in tables:
+        for row in table:
+            buffer.write(format_table_row(row))
+            buffer.write("\n")
+
+
+def page_has_table_rules(page: "fitz.Page") -> bool:
+    """Stima, dai tracciati vettoriali, se una pagina contiene una tabella.
+
+    pdfplumber individua le tabelle a partire dalle linee disegnate: se la
+    pagina non ha almeno qualche linea orizzontale e verticale non c'è nulla
+    da estrarre e il costoso extract_tables() può essere evitato.
+    """
+    horizontal = vertical = 0
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) < 1 and abs(start.x - end.x) > 5:
+                    horizontal += 1
+                elif abs(start.x - end.x) < 1 and abs(start.y - end.y) > 5:
+                    vertical += 1
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height < 3 and rect.width > 5:
+                    horizontal += 1
+                elif rect.width < 3 and rect.height > 5:
+                    vertical += 1
+            if horizontal >= MIN_TABLE_RULES and vertical >= MIN_TABLE_RULES:
+                return True
+    return False
+
+
+class PdfExtractionEngine:
+    """Interfaccia comune dei motori di estrazione.
+
+    Un motore deve solo implementare extract_page_range: la suddivisione in
+    intervalli di pagine e l'esecuzione in parallelo sono gestite qui.
+
+    Attributes:
+        name: Nome del motore (usato in settings.PDF_ENGINE)
+        version: Versione della logica di estrazione, da incrementare quando
+            cambia l'output (fa parte della chiave della cache delle estrazioni)
+    """
+    name = "base"
+    version = 1
+
+    @property
+    def cache_id(self) -> str:
+        """Identificativo del motore per le chiavi di cache."""
+        return f"{self.name}{self.version}"
+
+    def extract_page_range(self, pdf_path: str, mode: str, start: int, end: int) -> List[str]:
+        """Estrae le pagine [start, end) e restituisce un testo per pagina.
+
+        Args:
+            pdf_path: Percorso al file PDF
+            mode: "text", "tables" oppure "tables_and_text"
+            start: Prima pagina (inclusa, da 0)
+            end: Ultima pagina (esclusa)
+        """
+        raise NotImplementedError
+
+    def extract_pages(self, pdf_path: str, mode: str = "text", workers: Optional[int] = None) -> List[str]:
+        """Estrae tutte le pagine, in parallelo se il PDF è abbastanza grande.
+
+        Returns:
+            Lista con il testo di ogni pagina, nell'ordine del documento
+        """
+        if mode not in EXTRACTION_MODES:
+            raise ValueError(f"Modalità di estrazione '{mode}' non valida. Disponibili: {', '.join(EXTRACTION_MODES)}")
+        return extract_pages_parallel(self, pdf_path, mode, workers)
+
+    def extract_text(self, pdf_path: str, workers: Optional[int] = None) -> str:
+        """Estrae il testo semplice di tutte le pagine."""
+        return "".join(self.extract_pages(pdf_path, "text", workers))
+
+    def extract_tables(self, pdf_path: str, workers: Optional[int] = None) -> str:
+        """Estrae solo le righe delle tabelle di tutte le pagine."""
+        return "".join(self.extract_pages(pdf_path, "tables", workers))
+
+    def extract_tables_and_text(self, pdf_path: str, workers: Optional[int] = None) -> str:
+        """Estrae, pagina per pagina, le righe delle tabelle seguite dal testo."""
+        return "".join(self.extract_pages(pdf_path, "tables_and_text", workers))
+
+
+class PdfPlumberEngine(PdfExtractionEngine):
+    """Estrazione interamente con pdfplumber (più lenta, usata come riferimento)."""
+    name = "pdfplumber"
+
+    def extract_page_range(self, pdf_path: str, mode: str, start: int, end: int) -> List[str]:
+        pages = []
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages[start:end]:
+                buffer = io.StringIO()
+                if mode != "text":
+                    write_tables(buffer, page.extract_tables())
+                if mode != "tables":
+                    page_text = page.extract_text()
+                    if page_text:
+                        buffer.write(page_text)
+                        buffer.write("\n")
+                pages.append(buffer.getvalue())
+        return pages
+
+
+class PyMuPdfEngine(PdfExtractionEngine):
+    """Testo con PyMuPDF, tabelle con pdfplumber solo dove servono."""
+    name = "pymupdf"
+
+    def extract_page_range(self, pdf_path: str, mode: str, start: int, end: int) -> List[str]:
+        pages = []
+        with fitz.open(pdf_path) as doc:
+            # pdfplumber viene aperto solo se serve davvero una tabella
+            pdf = None
+            try:
+                for page_number in range(start, end):
+                    page = doc[page_number]
+                    buffer = io.StringIO()
+                    if mode != "text" and page_has_table_rules(page):
+                        if pdf is None:
+                            pdf = pdfplumber.open(pdf_path)
+                        write_tables(buffer, pdf.pages[page_number].extract_tables())
+                    if mode != "tables":
+                        buffer.write(page.get_text())
+                        buffer.write("\n")
+                    pages.append(buffer.getvalue())
+            finally:
+                if pdf is not None:
+                    pdf.close()
+        return pages
+
+
+ENGINES: Dict[str, Type[PdfExtractionEngine]] = {
+    PyMuPdfEngine.name: PyMuPdfEngine,
+    PdfPlumberEngine.name: PdfPlumberEngine,
+}
+
+
+def get_engine(name: Optional[str] = None) -> PdfExtractionEngine:
+    """Restituisce il motore di estrazione richiesto (default: settings.PDF_ENGINE).
+
+    Raises:
+        ValueError: se il motore non esiste
+    """
+    name = name or settings.PDF_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Motore di estrazione '{name}' non valido. Disponibili: {', '.join(ENGINES)}")
+    return ENGINES[name]()
+
+
+# --- ESTRAZIONE PARALLELA PER INTERVALLI DI PAGINE ---
+
+# Pool di processi condivisi, uno per numero di worker richiesto
+_process_pools: Dict[int, ProcessPoolExecutor] = {}
+_process_pool_lock = threading.Lock()
+
+
+def get_worker_count(workers: Optional[int] = None) -> int:
+    """Numero di processi da usare (settings.PDF_WORKERS, 0 = numero di CPU)."""
+    if workers is None:
+        workers = settings.PDF_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Restituisce il pool di processi condiviso, creandolo alla prima richiesta.
+
+    I processi vengono avviati con "spawn": il server ha thread attivi e un
+    fork potrebbe ereditare lock in stato inconsistente.
+    """
+    with _process_pool_lock:
+        pool = _process_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _process_pools[workers] = pool
+        return pool
+
+
+def shutdown_process_pool() -> None:
+    """Chiude i pool di processi (es. allo spegnimento dell'applicazione)."""
+    with _process_pool_lock:
+        for pool in _process_pools.values():
+            pool.shutdown()
+        _process_pools.clear()
+
+
+def count_pages(pdf_path: str) -> int:
+    """Numero di pagine del PDF."""
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def split_page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    """Divide le pagine in al massimo `parts` intervalli contigui [start, end)."""
+    parts = max(1, min(parts, page_count))
+    size, remainder = divmod(page_count, parts)
+    ranges, start = [], 0
+    for index in range(parts):
+        end = start + size + (1 if index < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _extract_range_in_worker(engine_name: str, pdf_path: str, mode: str, start: int, end: int) -> List[str]:
+    """Funzione eseguita nei processi del pool (deve essere importabile)."""
+    return get_engine(engine_name).extract_page_range(pdf_path, mode, start, end)
+
+
+def extract_pages_parallel(engine: PdfExtractionEngine,
+                           pdf_path: str,
+                           mode: str,
+                           workers: Optional[int] = None) -> List[str]:
+    """Estrae le pagine di un PDF dividendole tra i processi del pool.
+
+    I PDF con meno di settings.PDF_PARALLEL_MIN_PAGES pagine (o con un solo
+    worker configurato) vengono estratti nel processo corrente, dove il costo
+    di avvio dei processi non sarebbe ripagato.
+
+    Args:
+        engine: Motore di estrazione
+        pdf_path: Percorso al file PDF
+        mode: "text", "tables" oppure "tables_and_text"
+        workers: Numero di processi (default: settings.PDF_WORKERS)
+
+    Returns:
+        Lista con il testo di ogni pagina, nell'ordine del documento
+    """
+    page_count = count_pages(pdf_path)
+    workers = get_worker_count(workers)
+    if workers <= 1 or page_count < settings.PDF_PARALLEL_MIN_PAGES:
+        return engine.extract_page_range(pdf_path, mode, 0, page_count)
+
+    ranges = split_page_ranges(page_count, workers)
+    pool = get_process_pool(workers)
+    futures = [
+        pool.submit(_extract_range_in_worker, engine.name, pdf_path, mode, start, end)
+        for start, end in ranges
+    ]
+
+    # Riassembla nell'ordine degli intervalli, indipendentemente da quale finisce prima
+    pages: List[str] = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
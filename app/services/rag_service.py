@@ -1,13 +1,22 @@
 # app/services/rag_service.py
 import os
 import json
+import asyncio
 import google.generativeai as genai
-import fitz  # PyMuPDF
-import pdfplumber
 import re
 from pathlib import Path
+from typing import AsyncIterator
+from pydantic import ValidationError
 
-from .vector_db_service import get_retriever
+from .vector_db_service import build_context, get_retriever
+from .destinations_store import destinations_store, source_signature
+from .extraction_cache import extraction_cache
+from .pdf_extraction import get_engine
+from .executor_service import run_cpu, run_io
+from .single_flight import SingleFlight, hash_key
+from .result_cache import result_cache
+from .json_stream import JsonArrayStreamParser
+from ..schemas.student import DestinationUniversity
 from ..core.config import settings
 
 def clean_and_parse_json_response(response_text: str, expected_type: str = "array") -> any:
@@ -64,6 +73,16 @@ def clean_and_parse_json_response(response_text: str, expected_type: str = "arra
     except json.JSONDecodeError as e:
         raise ValueError(f"Errore nel parsing JSON: {e}. Testo: {json_match.group(0)[:200]}...")
 
+def normalize_extracted_text(full_text: str) -> str:
+    """
+    Compatta gli spazi di ogni riga mantenendo gli a capo.
+    
+    Il parser delle destinazioni lavora riga per riga: collassare anche i
+    newline renderebbe il testo illeggibile senza un modello AI.
+    """
+    lines = (re.sub(r'[ \t\r\f\v]+', ' ', line).strip() for line in full_text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
 def extract_department_section(full_text: str, department: str) -> str:
     """
     Estrae solo la sezione specifica del dipartimento dal testo completo del bando.
@@ -78,6 +97,9 @@ def extract_department_section(full_text: str, department: str) -> str:
     Raises:
         ValueError: Se il dipartimento non viene trovato
     """
+    if '\n' not in full_text.strip():
+        return _extract_department_section_single_line(full_text, department)
+
     lines = full_text.split('\n')
     department_start_line = None
     department_end_line = None
@@ -124,6 +146,96 @@ def extract_department_section(full_text: str, department: str) -> str:
     print(f"✅ Estratta sezione per '{department}': {len(department_section)} caratteri")
     return department_section.strip()
 
+# Intestazione di un dipartimento (es. "Dipartimento di Fisica | ... | n° borse: 49"),
+# cercata nel testo quando l'estrazione ha perso gli a capo
+DEPARTMENT_HEADER_PATTERN = re.compile(r'Dipartiment[^|\n]*?(?:\s*\|)*\s*n°\s*borse:\s*\d+', re.IGNORECASE)
+
+def _extract_department_section_single_line(full_text: str, department: str) -> str:
+    """
+    Variante di extract_department_section per il testo senza a capo.
+    
+    La sezione va dall'intestazione del dipartimento ("... n° borse: N")
+    all'intestazione successiva, così split_department_section ripete in
+    ogni blocco l'intestazione del dipartimento richiesto.
+    """
+    headers = list(DEPARTMENT_HEADER_PATTERN.finditer(full_text))
+    for i, header in enumerate(headers):
+        if department.lower() in header.group(0).lower():
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(full_text)
+            department_section = full_text[header.start():end].strip()
+            print(f"✅ Estratta sezione per '{department}': {len(department_section)} caratteri")
+            return department_section
+    raise ValueError(f"Dipartimento '{department}' non trovato nel file delle destinazioni")
+
+# Codice Erasmus di un'istituzione (es. "E BARCELO01"), usato per dividere le
+# righe quando il testo estratto ha perso gli a capo
+ERASMUS_CODE_PATTERN = re.compile(r'\b[A-Z]{1,3}\s{1,2}[A-Z][A-Z\-]{1,8}\d{2}\b')
+
+def split_department_section(department_section: str, max_chars: int) -> list[str]:
+    """
+    Divide la sezione di un dipartimento in blocchi di righe intere.
+    
+    Ogni blocco ripete l'intestazione della sezione (riga del dipartimento e,
+    se presente, la riga con i nomi delle colonne), così Gemini può
+    interpretare ogni blocco da solo. Le righe più lunghe di max_chars (testo
+    senza a capo) vengono spezzate prima di un codice Erasmus.
+    
+    Args:
+        department_section: Sezione estratta con extract_department_section
+        max_chars: Dimensione massima indicativa di un blocco
+        
+    Returns:
+        Lista di blocchi (uno solo se la sezione è già abbastanza piccola)
+    """
+    if len(department_section) <= max_chars:
+        return [department_section]
+
+    lines = department_section.split('\n')
+    if len(lines) == 1:
+        # Testo senza a capo (sezione tagliata da extract_department_section
+        # sull'intestazione del dipartimento): l'intestazione termina al primo codice Erasmus
+        first_code = ERASMUS_CODE_PATTERN.search(department_section)
+        if first_code is not None and first_code.start() > 0:
+            lines = [department_section[:first_code.start()].strip(), department_section[first_code.start():]]
+    header_end = 1
+    for i, line in enumerate(lines[:5]):
+        if "CODICE EUROPEO" in line.upper():
+            header_end = i + 1
+            break
+    header = '\n'.join(lines[:header_end])
+    budget = max(1, max_chars - len(header))
+
+    rows = []
+    for line in lines[header_end:]:
+        if line.strip():
+            rows.extend(_split_long_line(line, budget))
+
+    chunks, current, current_size = [], [], 0
+    for row in rows:
+        if current and current_size + len(row) + 1 > budget:
+            chunks.append(header + '\n' + '\n'.join(current))
+            current, current_size = [], 0
+        current.append(row)
+        current_size += len(row) + 1
+    if current:
+        chunks.append(header + '\n' + '\n'.join(current))
+    return chunks or [department_section]
+
+def _split_long_line(line: str, max_chars: int) -> list[str]:
+    """Spezza una riga troppo lunga prima di un codice Erasmus (o a max_chars)."""
+    pieces = []
+    while len(line) > max_chars:
+        cut = None
+        for match in ERASMUS_CODE_PATTERN.finditer(line, 1, max_chars):
+            cut = match.start()
+        if cut is None:
+            cut = max_chars
+        pieces.append(line[:cut].strip())
+        line = line[cut:]
+    if line.strip():
+        pieces.append(line.strip())
+    return pieces
+
 # --- CONFIGURAZIONE DI GOOGLE AI ---
 # Questa parte viene eseguita una sola volta quando il servizio viene importato.
 # Configura la libreria con la chiave API caricata da .env
@@ -135,6 +247,54 @@ except Exception as e:
     print(f"ATTENZIONE: Errore durante la configurazione di Google AI: {e}")
     pass
 
+# --- DEDUPLICAZIONE DELLE ELABORAZIONI CONCORRENTI ---
+# Richieste simultanee che chiedono lo stesso lavoro ne condividono una sola esecuzione
+extraction_flight = SingleFlight("extraction")
+retrieval_flight = SingleFlight("retrieval")
+llm_flight = SingleFlight("llm")
+# Destinazioni dello step 2 (chiave: quella della cache dei risultati), condivise
+# tra /step2 e la sua variante in streaming
+step2_flight = SingleFlight("step2")
+
+# Namespace della cache dei risultati per le destinazioni dello step 2
+STEP2_CACHE_NAMESPACE = "step2_destinations"
+
+async def generate_text(prompt: str, model_name: str = "gemini-2.0-flash") -> str:
+    """
+    Genera una risposta con Gemini e ne restituisce il testo.
+    
+    Prompt identici inviati in contemporanea producono una sola chiamata API.
+    """
+    async def call_model() -> str:
+        model = genai.GenerativeModel(model_name)
+        response = await model.generate_content_async(prompt)
+        return response.text
+
+    return await llm_flight.do(hash_key(model_name, prompt), call_model)
+
+async def stream_text(prompt: str, model_name: str = "gemini-2.0-flash") -> AsyncIterator[str]:
+    """
+    Genera una risposta con Gemini restituendo il testo man mano che arriva.
+    
+    Le risposte in streaming non passano dal single flight: ogni chiamante
+    riceve il proprio stream.
+    """
+    model = genai.GenerativeModel(model_name)
+    response = await model.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        if chunk.parts:
+            yield chunk.text
+
+async def retrieve_documents(retriever, query: str, category: str) -> list:
+    """
+    Esegue il retrieval (embedding della query + ricerca) nel pool "cpu".
+    
+    Query identiche sulla stessa configurazione del retriever in contemporanea
+    calcolano l'embedding e la ricerca una sola volta.
+    """
+    key = hash_key(category, query, sorted(retriever.search_kwargs.items(), key=str))
+    return await retrieval_flight.do(key, lambda: run_cpu(retriever.get_relevant_documents, query))
+
 async def get_call_summary(university_name: str) -> dict:
     """
     Identifica il bando, recupera i dati e genera un riassunto
@@ -156,12 +316,16 @@ async def get_call_summary(university_name: str) -> dict:
 
         # --- 2. RECUPERA I CHUNK SOLO DA QUEL FILE ---
         K_VALUE = 5
-        retriever = get_retriever(settings.DB_PATH, category='calls', top_k=K_VALUE)
-        
-        retriever.search_kwargs = {'filter': {'source': target_filename}}
+        retriever = await run_io(
+            get_retriever,
+            settings.DB_PATH,
+            category='calls',
+            top_k=K_VALUE * settings.CONTEXT_CANDIDATES_FACTOR,
+            filter_metadata={'source': target_filename}
+        )
 
         query = "riassunto completo del bando erasmus: requisiti, scadenze e procedura"
-        docs = retriever.get_relevant_documents(query)
+        docs = await retrieve_documents(retriever, query, category='calls')
         
         if not docs:
             return {
@@ -170,7 +334,7 @@ async def get_call_summary(university_name: str) -> dict:
             }
 
         # --- 3. GENERA IL RIASSUNTO CON GEMINI (Google AI SDK) ---
-        full_context = "\n\n---\n\n".join([doc.page_content for doc in docs])
+        full_context = await run_cpu(build_context, query, docs, K_VALUE)
         
         template = f"""
         Sei un assistente specializzato in programmi Erasmus. 
@@ -197,6 +361,111 @@ async def get_call_summary(university_name: str) -> dict:
         print(f"Errore in get_call_summary: {e}")
         raise e
 
+# Estrattori usati con la cache delle estrazioni: incrementare la versione
+# quando cambia la logica di estrazione invalida le estrazioni salvate
+DESTINATIONS_EXTRACTOR = "destinations_tables"
+DESTINATIONS_EXTRACTOR_VERSION = 1
+PLAIN_TEXT_EXTRACTOR = "plain_text"
+PLAIN_TEXT_EXTRACTOR_VERSION = 1
+
+def destinations_extractor_id() -> str:
+    """Identificativo dell'estrattore delle destinazioni (dipende dal motore PDF)."""
+    return f"{DESTINATIONS_EXTRACTOR}-{get_engine().cache_id}"
+
+def plain_text_extractor_id() -> str:
+    """Identificativo dell'estrattore di testo semplice (dipende dal motore PDF)."""
+    return f"{PLAIN_TEXT_EXTRACTOR}-{get_engine().cache_id}"
+
+def get_destinations_paths(home_university: str) -> tuple[str, Path]:
+    """
+    Restituisce il path del PDF delle destinazioni e del relativo file .txt processato.
+    """
+    pdf_path = os.path.join("data/destinazioni", f"destinazioni_bando_{home_university}")
+    txt_file = Path(f"data/destinazioni/processed/destinazioni_{home_university}_LLM_ready.txt")
+    return pdf_path, txt_file
+
+def _extract_destinations_text(pdf_path: str) -> str:
+    """
+    Estrae tabelle strutturate e testo normale dal PDF delle destinazioni.
+    
+    Raises:
+        ValueError: Se dal PDF non è possibile estrarre testo
+    """
+    full_text = get_engine().extract_tables_and_text(pdf_path)
+
+    if not full_text.strip():
+        raise ValueError("Il PDF è vuoto o non è stato possibile estrarre il testo.")
+
+    # Una riga per riga di tabella
+    return normalize_extracted_text(full_text)
+
+def load_destinations_text(home_university: str) -> str:
+    """
+    Restituisce il testo delle destinazioni di un'università.
+    
+    Se il PDF è disponibile il testo passa dalla cache delle estrazioni
+    (chiave: hash del PDF), altrimenti viene letto il file .txt processato
+    offline (es. con pdfreader.py).
+    
+    Raises:
+        FileNotFoundError: Se non esistono né il PDF né il file .txt delle destinazioni
+        ValueError: Se dal PDF non è possibile estrarre testo
+    """
+    pdf_path, txt_file = get_destinations_paths(home_university)
+    if os.path.exists(pdf_path):
+        return extraction_cache.get_or_extract(
+            pdf_path, destinations_extractor_id(), DESTINATIONS_EXTRACTOR_VERSION, _extract_destinations_text
+        )
+    if txt_file.exists():
+        with open(txt_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    raise FileNotFoundError(f"Il file delle destinazioni non è stato trovato: {pdf_path}")
+
+def get_destinations_signature(home_university: str) -> tuple[str, str]:
+    """
+    Restituisce la sorgente delle destinazioni e la sua firma.
+    
+    Per i PDF la firma è l'hash del contenuto più la versione dell'estrattore;
+    per i file .txt processati offline sono dimensione e data di modifica.
+    
+    Raises:
+        FileNotFoundError: Se non esistono né il PDF né il file .txt delle destinazioni
+    """
+    pdf_path, txt_file = get_destinations_paths(home_university)
+    if os.path.exists(pdf_path):
+        file_hash = extraction_cache.file_hash(pdf_path)
+        return pdf_path, extraction_cache.make_key(file_hash, destinations_extractor_id(), DESTINATIONS_EXTRACTOR_VERSION)
+    if txt_file.exists():
+        return str(txt_file), source_signature(txt_file)
+    raise FileNotFoundError(f"Il file delle destinazioni non è stato trovato: {pdf_path}")
+
+def ensure_destinations_loaded(home_university: str) -> None:
+    """
+    Carica le destinazioni dell'università nello store, se non sono già aggiornate.
+    
+    Lo store viene ricaricato solo quando cambia la firma della sorgente,
+    quindi le richieste successive non rileggono né il PDF né il testo.
+    """
+    source_path, signature = get_destinations_signature(home_university)
+    if destinations_store.is_current(home_university, signature):
+        return
+
+    text = load_destinations_text(home_university)
+    destinations_store.load_university(home_university, text, source_path, signature)
+
+async def ensure_destinations_loaded_async(home_university: str) -> None:
+    """
+    Versione asincrona di ensure_destinations_loaded.
+    
+    Il lavoro gira nel pool "cpu"; richieste concorrenti per la stessa
+    sorgente (stesso hash del PDF) attendono un'unica estrazione.
+    """
+    _, signature = await run_io(get_destinations_signature, home_university)
+    await extraction_flight.do(
+        ("destinations", home_university, signature),
+        lambda: run_cpu(ensure_destinations_loaded, home_university)
+    )
+
 async def get_available_departments(home_university: str) -> list[str]:
     """
     Estrae tutti i dipartimenti disponibili dal file delle destinazioni dell'università.
@@ -212,57 +481,18 @@ async def get_available_departments(home_university: str) -> list[str]:
         ValueError: Se non è possibile estrarre i dipartimenti
     """
     try:
-        # --- 1. IDENTIFICA IL FILE PDF DELLE DESTINAZIONI ---
-        pdf_dir = "data/destinazioni"
-        target_filename = f"destinazioni_bando_{home_university}"
-        pdf_path = os.path.join(pdf_dir, target_filename)
-
-        if not os.path.exists(pdf_path):
-            raise FileNotFoundError(f"Il file delle destinazioni non è stato trovato: {pdf_path}")
-
-        # --- 2. VERIFICA SE ESISTE GIÀ IL FILE TXT PROCESSATO ---
-        txt_file = Path(f"data/destinazioni/processed/destinazioni_{home_university}_LLM_ready.txt")
-        
-        if not txt_file.exists():
-            # Se non esiste, lo creiamo processando il PDF
-            full_text = ""
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    # Estrai tabelle strutturate
-                    tables = page.extract_tables()
-                    for table in tables:
-                        for row in table:
-                            cleaned_row = [
-                                cell.replace('\n', ' ').strip() if cell is not None else "" 
-                                for cell in row
-                            ]
-                            line = " | ".join(cleaned_row)
-                            full_text += line + "\n"
-                    
-                    # Estrai anche testo normale (non in tabelle)
-                    page_text = page.extract_text()
-                    if page_text:
-                        full_text += page_text + "\n"
-            
-            if not full_text.strip():
-                raise ValueError("Il PDF è vuoto o non è stato possibile estrarre il testo.")
+        # --- 1. CARICA LE DESTINAZIONI NELLO STORE (solo alla prima richiesta) ---
+        await ensure_destinations_loaded_async(home_university)
 
-            # Pulisci e salva il testo
-            cleaned_text = re.sub(r'\s+', ' ', full_text).strip()
-            
-            output_dir = Path("data/destinazioni/processed/")
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            with open(txt_file, 'w', encoding='utf-8') as f:
-                f.write(cleaned_text)
-            
-            print(f"✅ Testo estratto e salvato in: {txt_file}")
+        # --- 2. LOOKUP INDICIZZATO DEI DIPARTIMENTI ---
+        departments = await run_io(destinations_store.get_departments, home_university)
+        if departments:
+            print(f"✅ Trovati {len(departments)} dipartimenti per {home_university}")
+            return departments
 
-        # --- 3. LEGGI IL FILE TXT ---
-        with open(txt_file, 'r', encoding='utf-8') as f:
-            llm_ready_text = f.read()
+        # --- 3. FALLBACK: TESTO SENZA STRUTTURA A RIGHE, CERCA I DIPARTIMENTI CON REGEX ---
+        llm_ready_text = await run_cpu(load_destinations_text, home_university)
 
-        # --- 4. ESTRAI I DIPARTIMENTI CON REGEX ---
         # Cerca tutte le linee che contengono "n° borse:" che indicano l'inizio di una sezione dipartimento
         department_pattern = r'([^|]+)\s*\|\s*n°\s*borse:'
         matches = re.findall(department_pattern, llm_ready_text, re.IGNORECASE)
@@ -296,16 +526,23 @@ async def get_available_departments(home_university: str) -> list[str]:
         print(f"Errore generico in get_available_departments: {e}")
         raise e
 
-def get_erasmus_suggestions(course: str, preferences: str) -> list:
+async def get_erasmus_suggestions(course: str, preferences: str) -> list:
     """
     Orchestra il processo RAG per generare i suggerimenti.
     """
     # 1. Recupero (Retrieval)
-    retriever = get_retriever(settings.DB_PATH, category='calls')
+    K_VALUE = 5
+    retriever = await run_io(
+        get_retriever,
+        settings.DB_PATH,
+        category='calls',
+        top_k=K_VALUE * settings.CONTEXT_CANDIDATES_FACTOR
+    )
     
     # 2. Prompt
-    context_docs = retriever.get_relevant_documents(f"Corso: {course}, Preferenze: {preferences}")
-    context = "\n\n---\n\n".join([doc.page_content for doc in context_docs])
+    query = f"Corso: {course}, Preferenze: {preferences}"
+    context_docs = await retrieve_documents(retriever, query, category='calls')
+    context = await run_cpu(build_context, query, context_docs, K_VALUE)
 
     template = f"""
     Sei un assistente esperto per studenti che devono scegliere una meta Erasmus.
@@ -365,139 +602,384 @@ def get_available_universities() -> list[str]:
                 
     return sorted(list(set(universities)))
 
-async def analyze_destinations_for_department(home_university: str, department: str, period: str) -> list:
+async def fill_destination_descriptions(destinations: list[DestinationUniversity], department: str) -> bool:
     """
-    Analizza il PDF delle destinazioni per un'università specifica:
-    1. Estrae il testo con pdfplumber
-    2. Pulisce e salva il testo in un file .txt
-    3. Estrae solo la sezione del dipartimento specificato
-    4. Usa Gemini per analizzare solo quella sezione e trovare le destinazioni
+    Usa Gemini per generare una breve descrizione di ogni istituzione.
+    
+    Viene fatta una sola chiamata con l'elenco dei nomi (senza duplicati).
+    In caso di errore restano le descrizioni costruite dal parser.
+    
+    Args:
+        destinations: Destinazioni prodotte dal parser, aggiornate in place
+        department: Dipartimento di provenienza, usato come contesto
+        
+    Returns:
+        False se Gemini non ha risposto (restano le descrizioni del parser)
+    """
+    names = sorted({d.name for d in destinations})
+    template = f"""
+    Sei un assistente universitario esperto di programmi Erasmus.
+    Per ciascuna delle seguenti università partner del dipartimento "{department}",
+    scrivi una breve descrizione accattivante di 1-2 frasi.
+
+    Restituisci ESCLUSIVAMENTE un oggetto JSON valido che associa il nome
+    dell'università (esattamente come scritto sotto) alla sua descrizione.
+
+    --- UNIVERSITÀ ---
+    {chr(10).join(names)}
     """
+
     try:
-        # --- 1. IDENTIFICA IL FILE PDF DELLE DESTINAZIONI ---
-        # Converte "University of Pisa" in "unipi" per matchare il nome del file
-        pdf_dir = "data/destinazioni"
-        target_filename = f"destinazioni_bando_{home_university}"
-        pdf_path = os.path.join(pdf_dir, target_filename)
-
-        if not os.path.exists(pdf_path):
-            raise FileNotFoundError(f"Il file delle destinazioni non è stato trovato: {pdf_path}")
-
-        if Path(f"data/destinazioni/processed/destinazioni_{home_university}_LLM_ready.txt").exists():
-            txt_file = Path(f"data/destinazioni/processed/destinazioni_{home_university}_LLM_ready.txt")
-            # Salta l'estrazione se il file esiste già
-            print(f"✅ File di testo già esistente per {home_university}, salto l'estrazione.")
-        else:
-            # --- 2. ESTRAI IL TESTO DAL PDF USANDO PDFPLUMBER ---
-            full_text = ""
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    # Estrai tabelle strutturate
-                    tables = page.extract_tables()
-                    for table in tables:
-                        for row in table:
-                            cleaned_row = [
-                                cell.replace('\n', ' ').strip() if cell is not None else "" 
-                                for cell in row
-                            ]
-                            line = " | ".join(cleaned_row)
-                            full_text += line + "\n"
-                    
-                    # Estrai anche testo normale (non in tabelle)
-                    page_text = page.extract_text()
-                    if page_text:
-                        full_text += page_text + "\n"
-            
-            if not full_text.strip():
-                raise ValueError("Il PDF è vuoto o non è stato possibile estrarre il testo.")
+        response_text = await generate_text(template)
+        descriptions = clean_and_parse_json_response(response_text, "object")
+    except Exception as e:
+        print(f"⚠️ Descrizioni Gemini non disponibili, uso quelle del parser: {e}")
+        return False
 
-            # --- 3. PULISCI IL TESTO ---
-            cleaned_text = re.sub(r'\s+', ' ', full_text).strip()
-            
-            # --- 4. SALVA IL TESTO PULITO IN UN FILE .TXT ---
-            output_dir = Path("data/destinazioni/processed/")
-            output_dir.mkdir(parents=True, exist_ok=True)
-            txt_file = output_dir / f"destinazioni_{home_university}_LLM_ready.txt"
-            
-            with open(txt_file, 'w', encoding='utf-8') as f:
-                f.write(cleaned_text)
-            
-            print(f"✅ Testo estratto e salvato in: {txt_file}")
+    for destination in destinations:
+        description = descriptions.get(destination.name)
+        if isinstance(description, str) and description.strip():
+            destination.description = description.strip()
+    return True
 
-        # --- 5. LEGGI IL FILE TXT PER PASSARLO ALL'LLM ---
-        with open(txt_file, 'r', encoding='utf-8') as f:
-            llm_ready_text = f.read()
+def build_destinations_prompt(section_chunk: str, department: str, period: str) -> str:
+    """Prompt per estrarre con Gemini le destinazioni da (un blocco di) una sezione."""
+    template = f"""
+    Sei un assistente universitario esperto nell'analisi di bandi Erasmus.
+    Il tuo compito è analizzare la sezione specifica del dipartimento "{department}" fornita di seguito.
+    Considera il periodo "{period}" per filtrare le destinazioni. Se non ci sono info sul periodo ignoralo.
+    
+    Estrai TUTTE le università partner elencate nella sezione, mantenendo ESATTAMENTE i campi come sono scritti nel file originale.
+
+    Per ogni università partner trovata, crea un oggetto JSON con i seguenti campi:
+    - "name": il nome dell'università estratto dal campo "NOME ISTITUZIONE"
+    - "codice_europeo": valore del campo "CODICE EUROPEO"
+    - "nome_istituzione": valore del campo "NOME ISTITUZIONE"
+    - "codice_area": valore del campo "CODICE AREA"
+    - "posti": valore del campo "POSTI"
+    - "durata_per_posto": valore del campo "DURATA PER POSTO"
+    - "livello": valore del campo "LIVELLO"
+    - "dettagli_livello": valore del campo "DETTAGLI LIVELLO"
+    - "requisiti_linguistici": valore del campo "REQUISITI LINGUISTICI"
+    - "description": una breve descrizione accattivante di 1-2 frasi sull'università
+
+    IMPORTANTE: 
+    - Restituisci ESCLUSIVAMENTE un array JSON valido
+    - Non aggiungere testo, spiegazioni o commenti prima o dopo l'array
+    - Se un campo è vuoto nel file, inserisci una stringa vuota "" o null
+    - Se non trovi destinazioni per il dipartimento, restituisci un array vuoto: []
+    - Assicurati che il JSON sia sintatticamente corretto
+    - Mantieni i valori dei campi esattamente come appaiono nel file
+    - I campi devono corrispondere esattamente a quelli del file: CODICE EUROPEO | NOME ISTITUZIONE | CODICE AREA | DESCRIZIONE AREA ISCED | POSTI | DURATA PER POSTO | LIVELLO | DETTAGLI LIVELLO | REQUISITI LINGUISTICI | BLENDED | SHORT MOBILITY | BIP | CIRCLE U | SOTTO CONDIZIONE | NOTE PER GLI STUDENTI
+
+    Esempio di formato richiesto:
+    [
+      {{
+        "name": "UNIVERSIDAD DE BARCELONA",
+        "codice_europeo": "E BARCELO01",
+        "nome_istituzione": "UNIVERSIDAD DE BARCELONA",
+        "codice_area": "0732",
+        "posti": "2",
+        "durata_per_posto": "5",
+        "livello": "U",
+        "dettagli_livello": "",
+        "requisiti_linguistici": "Spanish B2",
+        "description": "Prestigiosa università catalana con forti programmi in ingegneria civile."
+      }}
+    ]
+
+    --- SEZIONE DEL DIPARTIMENTO "{department}" ---
+    {section_chunk}
+    """
+    return template
+
+async def extract_destinations_with_llm(department_section: str, department: str, period: str) -> list[dict]:
+    """
+    Estrae con Gemini le destinazioni di una sezione, in modalità map-reduce.
+    
+    Le sezioni grandi (es. centinaia di borse) vengono divise in blocchi di
+    righe intere (vedi split_department_section); i blocchi sono inviati a
+    Gemini in parallelo, con al massimo settings.DESTINATIONS_LLM_CONCURRENCY
+    chiamate contemporanee. Gli array restituiti vengono uniti eliminando i
+    duplicati (vedi merge_destination_lists).
+    
+    Raises:
+        ValueError: Se la risposta di Gemini per un blocco non è JSON valido
+    """
+    chunks = split_department_section(department_section, settings.DESTINATIONS_LLM_CHUNK_CHARS)
+    print(f"🧩 Sezione divisa in {len(chunks)} blocchi per Gemini")
+    semaphore = asyncio.Semaphore(max(1, settings.DESTINATIONS_LLM_CONCURRENCY))
 
-        # --- 6. ESTRAI SOLO LA SEZIONE DEL DIPARTIMENTO SPECIFICO ---
+    async def extract_chunk(index: int, chunk: str) -> list:
+        async with semaphore:
+            response_text = await generate_text(build_destinations_prompt(chunk, department, period))
+        print(f"🔍 Risposta di Gemini per il blocco {index + 1}/{len(chunks)} (primi 500 caratteri): {response_text[:500]}")
         try:
-            department_section = extract_department_section(llm_ready_text, department)
-            print(f"📋 Sezione del dipartimento estratta: {len(department_section)} caratteri")
+            return clean_and_parse_json_response(response_text, "array")
         except ValueError as e:
-            print(f"❌ Errore nell'estrazione della sezione del dipartimento: {e}")
+            print(f"❌ Errore nel parsing della risposta di Gemini (blocco {index + 1}): {e}")
             raise e
 
-        # --- 7. GENERA L'ANALISI CON GEMINI USANDO SOLO LA SEZIONE SPECIFICA ---
-        template = f"""
-        Sei un assistente universitario esperto nell'analisi di bandi Erasmus.
-        Il tuo compito è analizzare la sezione specifica del dipartimento "{department}" fornita di seguito.
-        Considera il periodo "{period}" per filtrare le destinazioni. Se non ci sono info sul periodo ignoralo.
-        
-        Estrai TUTTE le università partner elencate nella sezione, mantenendo ESATTAMENTE i campi come sono scritti nel file originale.
-
-        Per ogni università partner trovata, crea un oggetto JSON con i seguenti campi:
-        - "name": il nome dell'università estratto dal campo "NOME ISTITUZIONE"
-        - "codice_europeo": valore del campo "CODICE EUROPEO"
-        - "nome_istituzione": valore del campo "NOME ISTITUZIONE"
-        - "codice_area": valore del campo "CODICE AREA"
-        - "posti": valore del campo "POSTI"
-        - "durata_per_posto": valore del campo "DURATA PER POSTO"
-        - "livello": valore del campo "LIVELLO"
-        - "dettagli_livello": valore del campo "DETTAGLI LIVELLO"
-        - "requisiti_linguistici": valore del campo "REQUISITI LINGUISTICI"
-        - "description": una breve descrizione accattivante di 1-2 frasi sull'università
+    results = await asyncio.gather(*(extract_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+    return merge_destination_lists(results)
 
-        IMPORTANTE: 
-        - Restituisci ESCLUSIVAMENTE un array JSON valido
-        - Non aggiungere testo, spiegazioni o commenti prima o dopo l'array
-        - Se un campo è vuoto nel file, inserisci una stringa vuota "" o null
-        - Se non trovi destinazioni per il dipartimento, restituisci un array vuoto: []
-        - Assicurati che il JSON sia sintatticamente corretto
-        - Mantieni i valori dei campi esattamente come appaiono nel file
-        - I campi devono corrispondere esattamente a quelli del file: CODICE EUROPEO | NOME ISTITUZIONE | CODICE AREA | DESCRIZIONE AREA ISCED | POSTI | DURATA PER POSTO | LIVELLO | DETTAGLI LIVELLO | REQUISITI LINGUISTICI | BLENDED | SHORT MOBILITY | BIP | CIRCLE U | SOTTO CONDIZIONE | NOTE PER GLI STUDENTI
-
-        Esempio di formato richiesto:
-        [
-          {{
-            "name": "UNIVERSIDAD DE BARCELONA",
-            "codice_europeo": "E BARCELO01",
-            "nome_istituzione": "UNIVERSIDAD DE BARCELONA",
-            "codice_area": "0732",
-            "posti": "2",
-            "durata_per_posto": "5",
-            "livello": "U",
-            "dettagli_livello": "",
-            "requisiti_linguistici": "Spanish B2",
-            "description": "Prestigiosa università catalana con forti programmi in ingegneria civile."
-          }}
-        ]
-
-        --- SEZIONE DEL DIPARTIMENTO "{department}" ---
-        {department_section}
-        """
+# Campi che, insieme al codice_europeo, distinguono due righe della stessa istituzione
+ROW_IDENTITY_FIELDS = ("codice_area", "posti", "durata_per_posto", "livello", "dettagli_livello", "requisiti_linguistici")
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = await model.generate_content_async(template)
-        
-        print(f"🔍 Risposta di Gemini (primi 500 caratteri): {response.text[:500]}")
-        
+def merge_destination_lists(destination_lists: list[list]) -> list[dict]:
+    """
+    Unisce gli array di destinazioni dei singoli blocchi, nell'ordine dei blocchi.
+    
+    I duplicati (stesso codice_europeo e stessi valori della riga, vedi
+    ROW_IDENTITY_FIELDS) vengono scartati; righe diverse della stessa istituzione restano
+    distinte come nel file originale. Gli elementi che non sono oggetti
+    vengono ignorati.
+    """
+    merged = []
+    seen = set()
+    for destinations in destination_lists:
+        for destination in destinations:
+            if not isinstance(destination, dict):
+                continue
+            key = destination_identity(destination)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(destination)
+    return merged
+
+def destination_identity(destination: dict) -> tuple:
+    """Chiave di deduplicazione di una destinazione estratta da Gemini."""
+    code = str(destination.get("codice_europeo") or "").strip().upper()
+    if not code:
+        return ("", str(destination.get("name") or destination.get("nome_istituzione") or "").strip().casefold())
+    return (code,) + tuple(
+        str(destination.get(field) or "").strip().casefold()
+        for field in ROW_IDENTITY_FIELDS
+    )
+
+async def stream_destinations_with_llm(department_section: str, department: str, period: str) -> AsyncIterator[dict]:
+    """
+    Variante in streaming di extract_destinations_with_llm.
+    
+    I blocchi della sezione vengono elaborati in parallelo (stesso limite di
+    concorrenza) con risposte di Gemini in streaming: ogni destinazione viene
+    restituita appena il suo oggetto JSON è completo, nell'ordine di arrivo
+    e senza duplicati.
+    
+    Raises:
+        Qualsiasi errore di uno dei blocchi; gli altri vengono annullati
+    """
+    chunks = split_department_section(department_section, settings.DESTINATIONS_LLM_CHUNK_CHARS)
+    print(f"🧩 Sezione divisa in {len(chunks)} blocchi per Gemini (streaming)")
+    semaphore = asyncio.Semaphore(max(1, settings.DESTINATIONS_LLM_CONCURRENCY))
+    queue: asyncio.Queue = asyncio.Queue()
+    chunk_done = object()
+
+    async def stream_chunk(chunk: str) -> None:
+        try:
+            async with semaphore:
+                parser = JsonArrayStreamParser()
+                async for text in stream_text(build_destinations_prompt(chunk, department, period)):
+                    for destination in parser.feed(text):
+                        await queue.put(destination)
+                if not parser.finished:
+                    # Stream interrotto o risposta senza array: il risultato sarebbe parziale
+                    raise ValueError("La risposta di Gemini non contiene un array JSON completo")
+            await queue.put(chunk_done)
+        except Exception as e:
+            await queue.put(e)
+
+    tasks = [asyncio.create_task(stream_chunk(chunk)) for chunk in chunks]
+    try:
+        seen = set()
+        pending = len(tasks)
+        while pending:
+            item = await queue.get()
+            if item is chunk_done:
+                pending -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            if not isinstance(item, dict):
+                continue
+            key = destination_identity(item)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def analyze_destinations_for_department(home_university: str, department: str, period: str) -> list[DestinationUniversity]:
+    """
+    Restituisce le destinazioni di un dipartimento, passando dalla cache dei risultati.
+    
+    Il risultato dipende solo da (università, dipartimento, periodo, sorgente):
+    la chiave di cache include l'hash del PDF delle destinazioni, quindi un
+    nuovo bando invalida automaticamente i risultati precedenti. Le richieste
+    ripetute non fanno chiamate API e, se il risultato è in memoria, non
+    toccano nemmeno il disco.
+    """
+    # --- 0. CACHE DEI RISULTATI ---
+    signature, cache_key = await get_step2_cache_key(home_university, department, period)
+    cached = await get_cached_destinations(cache_key)
+    if cached is not None:
+        return cached
+
+    async def analyze() -> list[DestinationUniversity]:
+        destinations_data, complete = await _analyze_destinations_uncached(home_university, department, period)
+        destinations = [DestinationUniversity.model_validate(destination) for destination in destinations_data]
+        # Descrizioni di ripiego dopo un errore di Gemini: non in cache, la prossima richiesta riprova
+        if complete:
+            await cache_destinations(cache_key, destinations, home_university, signature)
+        return destinations
+
+    return await step2_flight.do(cache_key, analyze)
+
+async def stream_destinations_for_department(home_university: str, department: str, period: str) -> AsyncIterator[DestinationUniversity]:
+    """
+    Variante in streaming di analyze_destinations_for_department.
+    
+    I risultati in cache e quelli dello store locale (già completi in pochi
+    millisecondi) vengono restituiti subito uno alla volta. Nel fallback con
+    Gemini ogni destinazione viene restituita appena il modello ha finito di
+    generarla; a fine stream l'elenco completo viene salvato in cache, solo se
+    tutti i blocchi sono terminati correttamente e nessuna destinazione è stata
+    scartata (altrimenti /step2 servirebbe un elenco che non avrebbe mai salvato).
+    
+    L'elaborazione condivide la chiave di single flight di /step2: le richieste
+    concorrenti identiche attendono l'elenco completo invece di ripetere le
+    chiamate a Gemini.
+    """
+    signature, cache_key = await get_step2_cache_key(home_university, department, period)
+    cached = await get_cached_destinations(cache_key)
+    if cached is None:
+        await ensure_destinations_loaded_async(home_university)
+        if await run_io(destinations_store.get_destinations, home_university, department):
+            cached = await analyze_destinations_for_department(home_university, department, period)
+    if cached is not None:
+        for destination in cached:
+            yield destination
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+    stream_done = object()
+
+    async def analyze_streaming() -> list[DestinationUniversity]:
+        destinations = []
+        dropped = 0
+        try:
+            print(f"⚠️ Nessuna riga nello store per '{department}', uso Gemini in streaming")
+            llm_ready_text = await run_cpu(load_destinations_text, home_university)
+            department_section = extract_department_section(llm_ready_text, department)
+            async for item in stream_destinations_with_llm(department_section, department, period):
+                try:
+                    destination = DestinationUniversity.model_validate(item)
+                except ValidationError as e:
+                    print(f"⚠️ Destinazione scartata (campi non validi): {e}")
+                    dropped += 1
+                    continue
+                destinations.append(destination)
+                queue.put_nowait(destination)
+        finally:
+            queue.put_nowait(stream_done)
+
+        print(f"✅ Trovate {len(destinations)} destinazioni per {department} (streaming, {dropped} scartate)")
+        if not dropped:
+            await cache_destinations(cache_key, destinations, home_university, signature)
+        return destinations
+
+    task, started = step2_flight.join(cache_key, analyze_streaming)
+    if started:
+        # Il task continua anche se il client si disconnette: gli altri chiamanti lo attendono
+        while (item := await queue.get()) is not stream_done:
+            yield item
+    results = await asyncio.shield(task)
+    if not started:
+        for destination in results:
+            yield destination
+
+async def get_step2_cache_key(home_university: str, department: str, period: str) -> tuple[str, str]:
+    """
+    Chiave della cache dei risultati dello step 2.
+    
+    Returns:
+        (firma della sorgente delle destinazioni, chiave di cache)
+    """
+    _, signature = await run_io(get_destinations_signature, home_university)
+    cache_key = hash_key(home_university, department, period, signature, settings.DESTINATIONS_LLM_DESCRIPTIONS)
+    return signature, cache_key
+
+async def get_cached_destinations(cache_key: str) -> list[DestinationUniversity] | None:
+    """Destinazioni in cache (prima in memoria, poi su disco) o None."""
+    cached = result_cache.get_from_memory(STEP2_CACHE_NAMESPACE, cache_key)
+    if cached is None:
+        cached = await run_io(result_cache.get, STEP2_CACHE_NAMESPACE, cache_key)
+    if cached is None:
+        return None
+    return [DestinationUniversity(**destination) for destination in cached]
+
+async def cache_destinations(cache_key: str,
+                             destinations: list[DestinationUniversity],
+                             home_university: str,
+                             signature: str) -> None:
+    """Salva le destinazioni nella cache dei risultati dello step 2."""
+    await run_io(
+        result_cache.put,
+        STEP2_CACHE_NAMESPACE,
+        cache_key,
+        [destination.model_dump() for destination in destinations],
+        home_university,
+        signature
+    )
+
+async def _analyze_destinations_uncached(home_university: str, department: str, period: str) -> tuple[list, bool]:
+    """
+    Analizza il PDF delle destinazioni per un'università specifica:
+    1. Alla prima richiesta estrae il testo, lo salva in un file .txt e carica
+       le righe delle tabelle nello store indicizzato delle destinazioni
+    2. Legge dallo store le righe del dipartimento specificato
+    3. Solo se lo store non ha righe, usa Gemini sulla sezione del dipartimento
+    
+    Gemini può essere usato anche per arricchire il campo "description"
+    (vedi settings.DESTINATIONS_LLM_DESCRIPTIONS).
+    
+    Returns:
+        (destinazioni, True se il risultato è completo e può andare in cache;
+        False se le descrizioni di Gemini non sono state generate)
+    """
+    try:
+        # --- 1. CARICA LE DESTINAZIONI NELLO STORE (solo alla prima richiesta) ---
+        await ensure_destinations_loaded_async(home_university)
+
+        # --- 2. LOOKUP INDICIZZATO DELLE RIGHE DEL DIPARTIMENTO ---
+        destinations = await run_io(destinations_store.get_destinations, home_university, department)
+        if destinations:
+            print(f"✅ Trovate {len(destinations)} destinazioni per {department} (store locale)")
+            complete = True
+            if settings.DESTINATIONS_LLM_DESCRIPTIONS:
+                complete = await fill_destination_descriptions(destinations, department)
+            return destinations, complete
+
+        # Fallback: testo senza struttura a righe, si chiede a Gemini di estrarre la tabella
+        print(f"⚠️ Nessuna riga nello store per '{department}', uso Gemini")
+        llm_ready_text = await run_cpu(load_destinations_text, home_university)
+
+        # --- 3. ESTRAI SOLO LA SEZIONE DEL DIPARTIMENTO SPECIFICO ---
         try:
-            destinations_data = clean_and_parse_json_response(response.text, "array")
-            print(f"✅ Trovate {len(destinations_data)} destinazioni per {department}")
-            return destinations_data
+            department_section = extract_department_section(llm_ready_text, department)
+            print(f"📋 Sezione del dipartimento estratta: {len(department_section)} caratteri")
         except ValueError as e:
-            print(f"❌ Errore nel parsing della risposta di Gemini: {e}")
+            print(f"❌ Errore nell'estrazione della sezione del dipartimento: {e}")
             raise e
 
+        # --- 4. ESTRAZIONE CON GEMINI (MAP-REDUCE SUI BLOCCHI DELLA SEZIONE) ---
+        destinations_data = await extract_destinations_with_llm(department_section, department, period)
+        print(f"✅ Trovate {len(destinations_data)} destinazioni per {department}")
+        return destinations_data, True
+
     except FileNotFoundError as e:
         print(f"Errore file in analyze_destinations: {e}")
         # Restituisce un errore specifico che l'endpoint può gestire
@@ -551,7 +1033,7 @@ async def analyze_exams_compatibility(destination_university_name: str, student_
         exam_pdf_path = os.path.join(exams_dir, target_filename)
         
         # --- 2. ESTRAI IL TESTO DAL PDF DEGLI ESAMI ---
-        exam_text = extract_text_from_pdf(exam_pdf_path)
+        exam_text = await extract_text_from_pdf_async(exam_pdf_path)
 
         print(f"✅ Estratto testo da {target_filename} ({len(exam_text)} caratteri)")
         print(f"🎓 Piano di studi studente ({len(student_study_plan_text)} caratteri)")
@@ -605,13 +1087,12 @@ async def analyze_exams_compatibility(destination_university_name: str, student_
         - Il punteggio deve essere un numero tra 0 e 100
         """
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = await model.generate_content_async(template)
+        response_text = await generate_text(template)
         
-        print(f"🔍 Risposta di Gemini per analisi esami (primi 500 caratteri): {response.text[:500]}")
+        print(f"🔍 Risposta di Gemini per analisi esami (primi 500 caratteri): {response_text[:500]}")
         
         try:
-            analysis_result = clean_and_parse_json_response(response.text, "object")
+            analysis_result = clean_and_parse_json_response(response_text, "object")
             print(f"✅ Analisi completata: {len(analysis_result.get('matched_exams', []))} corrispondenze, score: {analysis_result.get('compatibility_score', 0)}")
             
             # Aggiungi le informazioni del PDF al risultato
@@ -640,12 +1121,23 @@ async def analyze_exams_compatibility(destination_university_name: str, student_
         raise e
         raise e
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+def _extract_plain_text(pdf_path: str) -> str:
+    """
+    Estrae il testo semplice di tutte le pagine di un PDF.
+    """
+    return get_engine().extract_text(pdf_path).strip()
+
+def extract_text_from_pdf(pdf_path: str, persist: bool = True) -> str:
     """
     Utility per estrarre testo da un file PDF.
     
+    Il risultato passa dalla cache delle estrazioni, quindi lo stesso PDF
+    (stesso contenuto) viene analizzato una sola volta.
+    
     Args:
         pdf_path: Percorso al file PDF
+        persist: Se False l'estrazione resta solo nella cache in memoria
+            (da usare per i documenti caricati dagli studenti)
         
     Returns:
         Testo estratto dal PDF
@@ -654,17 +1146,29 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         ValueError: Se il PDF è vuoto o non leggibile
     """
     try:
-        text = ""
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        text = extraction_cache.get_or_extract(
+            pdf_path, plain_text_extractor_id(), PLAIN_TEXT_EXTRACTOR_VERSION, _extract_plain_text, persist=persist
+        )
         
-        if not text.strip():
+        if not text:
             raise ValueError(f"Il PDF '{pdf_path}' è vuoto o non è stato possibile estrarre il testo.")
             
-        return text.strip()
+        return text
         
     except Exception as e:
-        raise ValueError(f"Errore nell'estrazione del testo dal PDF '{pdf_path}': {e}")
\ No newline at end of file
+        raise ValueError(f"Errore nell'estrazione del testo dal PDF '{pdf_path}': {e}")
+
+
+async def extract_text_from_pdf_async(pdf_path: str, persist: bool = True) -> str:
+    """
+    Versione asincrona di extract_text_from_pdf.
+    
+    L'estrazione gira nel pool "cpu"; richieste concorrenti sullo stesso PDF
+    (stesso hash del contenuto) attendono un'unica estrazione.
+    """
+    file_hash = await run_io(extraction_cache.file_hash, pdf_path)
+    key = extraction_cache.make_key(file_hash, plain_text_extractor_id(), PLAIN_TEXT_EXTRACTOR_VERSION)
+    return await extraction_flight.do(
+        key,
+        lambda: run_cpu(extract_text_from_pdf, pdf_path, persist=persist)
+    )
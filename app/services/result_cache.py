@@ -0,0 +1,188 @@
+"""Cache a due livelli dei risultati delle analisi.
+
+Usata per i risultati che dipendono solo dai parametri della richiesta e
+da un file sorgente (es. le destinazioni dello step 2):
+1. LRU in memoria con un limite in byte (dimensione del JSON serializzato)
+2. Archivio persistente in SQLite, condiviso tra processi e riavvii
+
+Ogni voce è associata a uno "scope" (es. l'università) e alla firma della
+sorgente da cui è stata calcolata: quando per uno scope arriva una voce con
+una firma diversa, le voci vecchie di quello scope vengono eliminate.
+"""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from ..core.config import settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    source_signature TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_results_scope ON results (namespace, scope);
+"""
+
+
+class ResultCache:
+    """Cache (memoria + SQLite) di valori serializzabili in JSON.
+
+    Attributes:
+        db_path: Path del database SQLite
+        max_bytes: Budget in byte della LRU in memoria
+        memory_hits: Richieste servite dalla memoria
+        disk_hits: Richieste servite dal database
+        misses: Richieste non presenti in cache
+    """
+
+    def __init__(self,
+                 db_path: str = settings.RESULT_CACHE_PATH,
+                 max_bytes: int = settings.RESULT_CACHE_MAX_BYTES):
+        """Inizializza la cache creando lo schema se necessario.
+
+        Args:
+            db_path: Path del database SQLite
+            max_bytes: Budget in byte della LRU in memoria
+        """
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_from_memory(self, namespace: str, key: str) -> Optional[Any]:
+        """Cerca solo nella LRU in memoria (nessun accesso a disco)."""
+        with self._lock:
+            entry = self._memory.get((namespace, key))
+            if entry is None:
+                return None
+            self._memory.move_to_end((namespace, key))
+            self.memory_hits += 1
+            return entry[0]
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Cerca prima in memoria e poi nel database.
+
+        Returns:
+            Il valore deserializzato, oppure None se non presente
+        """
+        value = self.get_from_memory(namespace, key)
+        if value is not None:
+            return value
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM results WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        value = json.loads(row[0])
+        self._remember(namespace, key, value, len(row[0].encode("utf-8")))
+        return value
+
+    def put(self, namespace: str, key: str, value: Any, scope: str, source_signature: str) -> None:
+        """Salva un valore e invalida le voci dello stesso scope con firma diversa.
+
+        Args:
+            namespace: Tipo di risultato (es. "step2")
+            key: Chiave del risultato
+            value: Valore serializzabile in JSON
+            scope: Raggruppamento per l'invalidazione (es. università)
+            source_signature: Firma della sorgente da cui è calcolato il valore
+        """
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._connect() as conn:
+            stale_keys = [row[0] for row in conn.execute(
+                "SELECT key FROM results WHERE namespace = ? AND scope = ? AND source_signature != ?",
+                (namespace, scope, source_signature)
+            )]
+            conn.execute(
+                "DELETE FROM results WHERE namespace = ? AND scope = ? AND source_signature != ?",
+                (namespace, scope, source_signature)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO results (namespace, key, scope, source_signature, value, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, scope, source_signature, serialized, datetime.now().isoformat(timespec="seconds"))
+            )
+
+        with self._lock:
+            for stale_key in stale_keys:
+                self._forget((namespace, stale_key))
+        self._remember(namespace, key, value, len(serialized.encode("utf-8")))
+
+    def _remember(self, namespace: str, key: str, value: Any, size: int) -> None:
+        # Valori più grandi dell'intero budget restano solo su disco
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._forget((namespace, key))
+            self._memory[(namespace, key)] = (value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _forget(self, memory_key: Tuple[str, str]) -> None:
+        entry = self._memory.pop(memory_key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Elimina le voci (di un namespace o tutte) da memoria e database."""
+        with self._connect() as conn:
+            if namespace is None:
+                conn.execute("DELETE FROM results")
+            else:
+                conn.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+        with self._lock:
+            for memory_key in [k for k in self._memory if namespace is None or k[0] == namespace]:
+                self._forget(memory_key)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Contatori e occupazione della cache."""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+# Istanza globale della cache
+result_cache = ResultCache()
@@ -0,0 +1,99 @@
+"""Deduplicazione delle elaborazioni concorrenti identiche ("single flight").
+
+Quando più richieste arrivano insieme e chiedono lo stesso lavoro costoso
+(estrarre lo stesso PDF, la stessa query di retrieval, lo stesso prompt a
+Gemini), solo la prima lo esegue: le altre attendono il suo risultato
+invece di duplicare CPU e chiamate API.
+
+La chiave identifica il lavoro (es. hash del PDF o del prompt). Terminata
+l'elaborazione la chiave viene liberata: questo modulo non è una cache.
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def hash_key(*parts: Any) -> str:
+    """Chiave compatta (SHA-256) per testi lunghi come i prompt."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Gruppo di elaborazioni in corso, indicizzate per chiave.
+
+    Attributes:
+        name: Nome del gruppo (usato nelle metriche)
+        executed: Elaborazioni effettivamente eseguite
+        shared: Chiamate che hanno riusato un'elaborazione già in corso
+    """
+
+    def __init__(self, name: str):
+        """Inizializza il gruppo.
+
+        Args:
+            name: Nome del gruppo
+        """
+        self.name = name
+        self.executed = 0
+        self.shared = 0
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Esegue `fn()` oppure attende l'esecuzione già in corso con la stessa chiave.
+
+        Args:
+            key: Identificativo del lavoro
+            fn: Funzione che restituisce la coroutine da eseguire
+
+        Returns:
+            Il risultato di `fn()`, condiviso tra tutti i chiamanti concorrenti
+
+        Raises:
+            Qualsiasi eccezione sollevata da `fn()`, propagata a tutti i chiamanti
+        """
+        task, _ = self.join(key, fn)
+        # shield: se questo chiamante viene cancellato, gli altri continuano ad attendere
+        return await asyncio.shield(task)
+
+    def join(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[asyncio.Future, bool]:
+        """Task dell'esecuzione in corso con la chiave, avviandolo con `fn()` se manca.
+
+        Utile a chi deve sapere se ha avviato il lavoro (es. per trasmettere
+        i risultati parziali in streaming) prima di attenderlo.
+
+        Returns:
+            (task condiviso, True se è stato avviato da questa chiamata)
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+            return task, False
+        # Il lavoro gira in un task separato: la cancellazione di un chiamante
+        # (anche del primo, es. client disconnesso) non lo interrompe
+        task = asyncio.ensure_future(fn())
+        self._in_flight[key] = task
+        self.executed += 1
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return task, True
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        """Libera la chiave a lavoro terminato."""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Segna l'eccezione come letta anche se nessuno era più in attesa
+            task.exception()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Contatori del gruppo."""
+        return {
+            "name": self.name,
+            "executed": self.executed,
+            "shared": self.shared,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,254 @@
+"""Divisione in chunk che rispetta la struttura di bandi e cataloghi dei corsi.
+
+Lo splitter a caratteri taglia tabelle ed elenchi di requisiti a metà riga
+e, con l'overlap, duplica una parte del testo in ogni chunk. Qui il testo
+di ogni pagina viene prima diviso in unità:
+
+- titoli: articoli numerati ("Art. 3", "Articolo 5") e sezioni numerate
+  ("2.1 Scadenze")
+- righe di tabella (celle separate da " | ", vedi pdf_extraction.format_table_row)
+- voci di elenco ("-", "•", "a)", "1)") con le righe che le continuano
+- paragrafi (righe consecutive fino a una riga vuota)
+
+Le unità vengono poi accorpate fino a chunk_size caratteri (titoli compresi).
+Titoli, righe di tabella e voci di elenco non vengono mai spezzati; un
+paragrafo che non sta per intero nel chunk lo completa a righe intere e
+prosegue nel successivo, così i chunk restano pieni.
+
+L'inizio di una nuova sezione chiude il chunk se questo è pieno almeno per
+metà, altrimenti le sezioni brevi vengono accorpate alla successiva; allo
+stesso modo un chunk corto a fine pagina prosegue nella pagina successiva
+dello stesso file. Ogni chunk riceve nel metadata "section" il titolo della
+sezione in cui inizia il suo contenuto e i chunk che continuano una tabella
+ripetono la sua riga di intestazione. Solo le unità più lunghe di
+chunk_size vengono divise a caratteri, con un piccolo overlap.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+
+# Lunghezza massima di una riga per essere considerata un titolo
+MAX_HEADING_CHARS = 100
+# Un nuovo titolo o la fine della pagina chiudono il chunk solo se questo ha già
+# raggiunto questa frazione di chunk_size
+MIN_SECTION_FILL = 0.5
+
+ARTICLE_PATTERN = re.compile(r"^(art\.?|articolo|article)\s*\d+\b", re.IGNORECASE)
+NUMBERED_SECTION_PATTERN = re.compile(r"^\d{1,2}(\.\d{1,2})*\.?\s+[A-ZÀ-Ý]")
+LIST_ITEM_PATTERN = re.compile(r"^([-•–*]|[a-z]\)|\d{1,2}\))\s+")
+TABLE_CELL_SEPARATOR = " | "
+
+
+def is_heading(line: str) -> bool:
+    """True se la riga è il titolo di un articolo o di una sezione."""
+    if len(line) > MAX_HEADING_CHARS or TABLE_CELL_SEPARATOR in line:
+        return False
+    if ARTICLE_PATTERN.match(line):
+        return True
+    # Le righe in maiuscolo non bastano: PyMuPDF mette ogni cella di tabella
+    # su una riga, e nomi di istituzioni e codici Erasmus sono in maiuscolo
+    return bool(NUMBERED_SECTION_PATTERN.match(line)) and not line.endswith((".", ";", ","))
+
+
+@dataclass
+class Unit:
+    """Blocco di testo che non viene diviso (titolo, riga di tabella, voce di elenco o paragrafo)."""
+    kind: str
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def split_units(text: str) -> List[Unit]:
+    """Divide il testo di una pagina in unità."""
+    units: List[Unit] = []
+    current: Optional[Unit] = None
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            current = None
+            continue
+        if TABLE_CELL_SEPARATOR in line:
+            current = None
+            units.append(Unit("table", [line]))
+        elif is_heading(line):
+            current = None
+            units.append(Unit("heading", [line]))
+        elif LIST_ITEM_PATTERN.match(line):
+            current = Unit("list", [line])
+            units.append(current)
+        elif current is not None:
+            # Continuazione del paragrafo o della voce di elenco
+            current.lines.append(line)
+        else:
+            current = Unit("paragraph", [line])
+            units.append(current)
+    return units
+
+
+class _ChunkBuilder:
+    """Chunk in costruzione per un file: un chunk corto a fine pagina prosegue nella successiva."""
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.chunks: List[Document] = []
+        # Sezione in corso e sezione in cui inizia il contenuto del chunk (metadata "section")
+        self.section: Optional[str] = None
+        self.chunk_section: Optional[str] = None
+        self.lines: List[str] = []
+        self.size = 0
+        # False finché il chunk in costruzione contiene solo titoli
+        self.has_content = False
+        # Titoli in fondo al chunk, dopo l'ultimo contenuto
+        self.trailing_headings = 0
+        # Metadati della pagina in cui inizia il chunk
+        self.metadata: dict = {}
+
+    def emit(self) -> None:
+        """Chiude il chunk, se contiene qualcosa oltre ai titoli.
+
+        I titoli in fondo al chunk appartengono al contenuto che segue:
+        restano nel chunk successivo.
+        """
+        if self.has_content:
+            split = len(self.lines) - self.trailing_headings
+            metadata = dict(self.metadata)
+            if self.chunk_section:
+                metadata["section"] = self.chunk_section
+            self.chunks.append(Document(page_content="\n".join(self.lines[:split]), metadata=metadata))
+            self.lines = self.lines[split:]
+            self.size = sum(len(line) + 1 for line in self.lines)
+            self.has_content = False
+
+    def make_room(self, length: int) -> None:
+        """Chiude il chunk se un testo di `length` caratteri non ci sta."""
+        if self.lines and self.size + length + 1 > self.chunk_size:
+            self.emit()
+            if self.size + length + 1 > self.chunk_size:
+                # Solo titoli che non stanno insieme al contenuto: restano nel metadata "section"
+                self.lines, self.size = [], 0
+
+    def append(self, text: str, page_metadata: dict, content: bool = True) -> None:
+        """Aggiunge una riga (titolo se content è False) al chunk."""
+        if not self.lines:
+            self.metadata = page_metadata
+        if content and not self.has_content:
+            self.chunk_section = self.section
+            self.has_content = True
+        self.trailing_headings = 0 if content else self.trailing_headings + 1
+        self.lines.append(text)
+        self.size += len(text) + 1
+
+
+class StructuredTextSplitter:
+    """Splitter per documenti LangChain basato sulla struttura del testo.
+
+    Attributes:
+        chunk_size: Lunghezza massima (caratteri) di un chunk
+        fallback_overlap: Overlap usato solo per dividere le unità più lunghe di chunk_size
+    """
+
+    def __init__(self, chunk_size: int = 1000, fallback_overlap: int = 0):
+        """Inizializza lo splitter.
+
+        Args:
+            chunk_size: Lunghezza massima (caratteri) di un chunk
+            fallback_overlap: Overlap per le unità più lunghe di chunk_size
+        """
+        self.chunk_size = chunk_size
+        self.fallback_overlap = fallback_overlap
+        self._fallback = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=fallback_overlap)
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Divide le pagine in chunk, nell'ordine ricevuto.
+
+        Il titolo della sezione corrente e un chunk rimasto corto a fine
+        pagina passano alla pagina successiva dello stesso file (metadata
+        "source"); il metadata "page" è quello della pagina in cui il chunk inizia.
+        """
+        builders: Dict[Optional[str], _ChunkBuilder] = {}
+        chunks: List[Document] = []
+        current: Optional[_ChunkBuilder] = None
+        for document in documents:
+            source = document.metadata.get("source")
+            builder = builders.setdefault(source, _ChunkBuilder(self.chunk_size))
+            if current is not None and current is not builder:
+                # Cambio di file: il chunk in sospeso del file precedente viene chiuso
+                current.emit()
+                chunks.extend(current.chunks)
+                current.chunks = []
+            current = builder
+            self._split_page(document, builder)
+        for builder in builders.values():
+            builder.emit()
+            chunks.extend(builder.chunks)
+            builder.chunks = []
+        return chunks
+
+    def _split_page(self, document: Document, builder: _ChunkBuilder) -> None:
+        """Aggiunge al builder del file le unità di una pagina."""
+        page_metadata = dict(document.metadata)
+        table_header: Optional[str] = None
+
+        for unit in split_units(document.page_content):
+            text = unit.text
+            if unit.kind == "heading":
+                # Una nuova sezione chiude il chunk se è già pieno per metà; le sezioni
+                # brevi vengono accorpate alla successiva. Titoli consecutivi
+                # (es. "ART. 3" seguito dal nome) restano insieme
+                if builder.size >= self.chunk_size * MIN_SECTION_FILL:
+                    builder.emit()
+                builder.make_room(len(text))
+                builder.section = text
+                table_header = None
+                builder.append(text, page_metadata, content=False)
+                continue
+
+            if unit.kind != "table":
+                table_header = None
+            elif table_header is None:
+                table_header = text
+            elif builder.has_content and builder.size + len(text) + 1 > self.chunk_size:
+                # La tabella continua nel chunk successivo: ripete l'intestazione
+                builder.emit()
+                if len(table_header) + len(text) + 1 <= self.chunk_size:
+                    builder.append(table_header, page_metadata)
+
+            if unit.kind == "paragraph":
+                # Un paragrafo che non sta nel chunk lo completa a righe intere, invece
+                # di lasciare spazio vuoto (titoli, tabelle ed elenchi non si dividono)
+                lines = list(unit.lines)
+                while len(lines) > 1 and builder.size + len("\n".join(lines)) + 1 > self.chunk_size:
+                    head: List[str] = []
+                    while len(lines) > 1 and builder.size + len("\n".join(head + lines[:1])) + 1 <= self.chunk_size:
+                        head.append(lines.pop(0))
+                    if head:
+                        builder.append("\n".join(head), page_metadata)
+                    elif not builder.has_content:
+                        # Nemmeno la prima riga sta dopo i titoli: il resto lo gestisce make_room
+                        break
+                    builder.emit()
+                text = "\n".join(lines)
+
+            if len(text) > self.chunk_size:
+                # Unità troppo lunga: l'unico caso in cui il testo viene diviso a caratteri
+                for piece in self._fallback.split_text(text):
+                    builder.make_room(len(piece))
+                    builder.append(piece, page_metadata)
+                    builder.emit()
+                continue
+
+            builder.make_room(len(text))
+            builder.append(text, page_metadata)
+
+        # Un chunk già pieno per metà si chiude con la pagina; quelli più corti
+        # (e i titoli in fondo alla pagina) proseguono nella pagina successiva
+        if builder.size >= self.chunk_size * MIN_SECTION_FILL:
+            builder.emit()
@@ -4,131 +4,890 @@ Questo modulo gestisce:
 1. Creazione del database vettoriale da documenti (create_vector_store)
 2. Caricamento e ricerca nei documenti (get_retriever)
 
-Il database usa Chroma come backend e SentenceTransformers per gli embeddings.
+Il database usa Chroma come backend (oppure, per le categorie piccole, lo
+store NumPy a forza bruta di numpy_vector_store.py, vedi VECTOR_BACKEND) e
+SentenceTransformers per gli embeddings.
+
+Ogni categoria viene aperta una sola volta per processo (registro dei
+vector store): i retriever sono viste leggere sullo store condiviso, con
+k e filtro propri della singola chiamata. Se la categoria viene
+reindicizzata (anche da un altro processo, es. scripts/ingest.py), il
+manifest o l'indice BM25 su disco cambiano e lo store viene riaperto
+all'accesso successivo.
+
+Accanto a ogni categoria può esserci un indice lessicale BM25 (vedi
+lexical_index.py): in modalità "hybrid" le classifiche vettoriale e BM25
+vengono unite con la reciprocal rank fusion.
+
+Una categoria può essere partizionata per un metadato (VECTOR_PARTITION_KEYS,
+es. 'calls' per "source"): oltre allo store completo, ogni valore del
+metadato ha un proprio store in `<categoria>/partitions/`. Le ricerche con
+un filtro di uguaglianza su quel metadato interrogano solo la partizione,
+invece di cercare tra i chunk di tutte le università e poi filtrare.
+
+I chunk recuperati per un prompt passano da build_context (vedi
+context_packing.py): MMR sugli embeddings in cache, unione dei chunk
+adiacenti e budget di token.
 """
 
+import hashlib
+import json
 import os
-from typing import Iterable, List, Optional
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 from langchain.vectorstores import Chroma
+from langchain.vectorstores.base import VectorStore
 from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.schema import Document
+from langchain.embeddings.base import Embeddings
+from langchain.schema import BaseRetriever, Document
 from pathlib import Path
 
+from .executor_service import run_cpu
+from .context_packing import build_context as pack_context
+from .embedding_cache import embed_queries, model_slug, with_embedding_cache
+from .lexical_index import LEXICAL_INDEX_FILENAME, BM25Index, fuse_documents
+from .numpy_vector_store import NumpyVectorStore
+from ..core.config import settings
+
+
+class QueryEmbeddingLRU(Embeddings):
+    """LRU in memoria degli embeddings delle query.
+    
+    Molte query di retrieval sono stringhe fisse o ripetute: quelle più
+    frequenti non passano né dal modello né dalla cache su disco.
+    
+    Attributes:
+        base: Embeddings sottostanti
+        max_entries: Numero massimo di query tenute in memoria
+        hits: Query servite dalla LRU
+        misses: Query passate a `base`
+    """
+
+    def __init__(self, base: Embeddings, max_entries: int):
+        """Inizializza la LRU.
+        
+        Args:
+            base: Embeddings sottostanti
+            max_entries: Numero massimo di query tenute in memoria
+        """
+        self.base = base
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Gli embeddings dei documenti non passano dalla LRU."""
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embedding della query, dalla LRU se già calcolato di recente."""
+        with self._lock:
+            vector = self._entries.get(text)
+            if vector is not None:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+
+        vector = tuple(self.base.embed_query(text))
+        self._store({text: vector})
+        return list(vector)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings di più query; quelle non in memoria passano a `base` in un solo batch."""
+        vectors: Dict[str, Tuple[float, ...]] = {}
+        with self._lock:
+            for text in texts:
+                vector = self._entries.get(text)
+                if vector is not None:
+                    self._entries.move_to_end(text)
+                    self.hits += 1
+                    vectors[text] = vector
+                else:
+                    self.misses += 1
+
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing:
+            computed = {text: tuple(vector) for text, vector in zip(missing, embed_queries(self.base, missing))}
+            self._store(computed)
+            vectors.update(computed)
+        return [list(vectors[text]) for text in texts]
+
+    def _store(self, vectors: Dict[str, Tuple[float, ...]]) -> None:
+        with self._lock:
+            for text, vector in vectors.items():
+                self._entries[text] = vector
+                self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def metrics(self) -> dict:
+        """Contatori della LRU."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Divide un iterabile in liste di al massimo `size` elementi, senza consumarlo tutto."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@dataclass
+class IngestionStats:
+    """Riepilogo di una scrittura a blocchi nel database vettoriale.
+
+    Attributes:
+        chunks: Chunk scritti
+        batches: Blocchi scritti
+        seconds: Durata complessiva (estrazione dei chunk inclusa, se `docs` è un generatore)
+    """
+    chunks: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        """Riepilogo leggibile per i log degli script."""
+        return (
+            f"{self.chunks} chunk in {self.batches} blocchi, "
+            f"{self.seconds:.1f} s ({self.chunks_per_second:.1f} chunk/s)"
+        )
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+PARTITIONS_DIRNAME = "partitions"
+
+# Manifest dell'aggiornamento incrementale (vedi incremental_index.py)
+MANIFEST_FILENAME = "index_manifest.json"
+
+
+def file_mtime(path: Path) -> Optional[int]:
+    """Data di modifica (ns) di un file, o None se non esiste."""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def partition_slug(value: Any) -> str:
+    """Nome di directory sicuro e univoco per il valore di una partizione."""
+    text = str(value)
+    return f"{model_slug(text)[:60]}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]}"
+
+
+def partition_value(filter_metadata: Optional[dict], key: str) -> Optional[Any]:
+    """Valore richiesto per `key` da un filtro di uguaglianza (None se il filtro non lo fissa)."""
+    if not filter_metadata or key not in filter_metadata:
+        return None
+    condition = filter_metadata[key]
+    if isinstance(condition, dict):
+        return condition.get("$eq") if set(condition) == {"$eq"} else None
+    return condition
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever LangChain che esegue la ricerca ibrida (vettoriale + BM25).
+    
+    Come i retriever di Chroma espone `search_kwargs` (k, filter, mode).
+    """
+
+    service: Any
+    category: str
+    search_kwargs: dict
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.service.search(
+            self.category,
+            query,
+            top_k=self.search_kwargs.get("k", 5),
+            filter_metadata=self.search_kwargs.get("filter"),
+            mode=self.search_kwargs.get("mode", "hybrid"),
+        )
+
 
 class VectorStoreService:
     """Gestore del database vettoriale."""
     
-    def __init__(self, base_path: str = "vector_db"):
+    def __init__(self, base_path: str = "vector_db", backend: Optional[str] = None):
         """Inizializza il servizio.
         
         Args:
             base_path: Directory base per i database vettoriali
+            backend: "chroma" o "numpy" (default: settings.VECTOR_BACKEND)
+            
+        Raises:
+            ValueError: se il backend non è valido
         """
         self.base_path = Path(base_path)
+        self.backend = backend or settings.VECTOR_BACKEND
+        if self.backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Backend '{self.backend}' non valido (valori ammessi: {', '.join(VECTOR_BACKENDS)})")
         self._embeddings = None
+        self._embeddings_lock = threading.Lock()
+        # Registro dei vector store aperti, uno per categoria
+        self._stores: Dict[str, VectorStore] = {}
+        self._stores_lock = threading.Lock()
+        # Indici BM25 caricati e categorie di cui è già stata segnalata l'assenza
+        self._lexical: Dict[str, BM25Index] = {}
+        self._lexical_missing: Set[str] = set()
+        # Partizioni aperte, per (categoria, valore)
+        self._partitions: Dict[Tuple[str, Any], VectorStore] = {}
+        # Stato su disco di ogni categoria al momento dell'apertura (vedi _refresh)
+        self._states: Dict[str, Tuple[Optional[int], ...]] = {}
     
     @property
     def embeddings(self):
-        """Lazy loading del modello di embeddings."""
+        """Lazy loading del modello di embeddings (caricato una sola volta anche con più thread)."""
         if self._embeddings is None:
-            self._embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'}  # usa CPU, cambia in 'cuda' se hai GPU
-            )
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    model = HuggingFaceEmbeddings(
+                        model_name=settings.EMBEDDING_MODEL,
+                        model_kwargs={'device': 'cpu'}  # usa CPU, cambia in 'cuda' se hai GPU
+                    )
+                    # I vettori già calcolati (chunk o query) vengono letti da disco
+                    embeddings = with_embedding_cache(model, settings.EMBEDDING_MODEL)
+                    # Le query più frequenti restano in memoria
+                    if settings.QUERY_EMBEDDING_CACHE_SIZE > 0:
+                        embeddings = QueryEmbeddingLRU(embeddings, settings.QUERY_EMBEDDING_CACHE_SIZE)
+                    self._embeddings = embeddings
         return self._embeddings
 
-    def create_vector_store(self, docs: List[Document], category: str) -> None:
-        """Crea un nuovo database vettoriale per una categoria di documenti.
+    def preload(self) -> None:
+        """Carica il modello di embeddings senza eseguirlo.
+        
+        Pensato per il processo master di gunicorn (preload_app): i pesi
+        caricati prima del fork sono condivisi copy-on-write dai worker.
+        Nessuna inferenza né store Chroma qui, perché thread e file aperti
+        non sopravvivono correttamente al fork.
+        """
+        start = time.perf_counter()
+        self.embeddings
+        print(f"🧠 Modello di embeddings precaricato in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def warm_up(self, categories: Iterable[str]) -> Dict[str, float]:
+        """Prepara il servizio per le prime richieste.
+        
+        Carica il modello di embeddings, apre gli store delle categorie ed
+        esegue una ricerca di prova su ciascuno (inizializza i thread di
+        torch e carica gli indici HNSW in memoria). Le categorie che non
+        esistono su disco vengono saltate.
+        
+        Args:
+            categories: Categorie da aprire (es. ['calls'])
+            
+        Returns:
+            Durata in millisecondi di ogni fase
+        """
+        timings = {}
+        start = time.perf_counter()
+        self.embeddings.embed_query("warm-up")
+        timings["embeddings"] = (time.perf_counter() - start) * 1000
+
+        for category in categories:
+            start = time.perf_counter()
+            try:
+                self.search(category, "warm-up", top_k=1)
+            except ValueError as e:
+                print(f"⚠️ Warm-up: {e}")
+                continue
+            timings[category] = (time.perf_counter() - start) * 1000
+
+        print("🔥 Warm-up completato: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in timings.items()))
+        return {name: round(ms, 1) for name, ms in timings.items()}
+
+    def create_vector_store(self,
+                            docs: Iterable[Document],
+                            category: str,
+                            batch_size: Optional[int] = None) -> IngestionStats:
+        """Aggiunge documenti al database vettoriale di una categoria, creandolo se non esiste.
+        
+        I documenti vengono consumati a blocchi di batch_size: per ogni blocco
+        si calcolano gli embeddings e lo si scrive nello store (e nelle
+        partizioni), quindi `docs` può essere un generatore (es.
+        iter_split_documents) e la memoria resta costante.
         
         Args:
-            docs: Lista di Document Langchain con testo e metadati
+            docs: Document Langchain con testo e metadati (lista o generatore)
             category: Categoria dei documenti (es. 'calls', 'courses')
+            batch_size: Chunk per blocco (default: settings.INGEST_BATCH_SIZE)
+            
+        Returns:
+            IngestionStats con chunk scritti e throughput
+        """
+        stats = IngestionStats()
+        start = time.perf_counter()
+        for batch in batched(docs, batch_size or settings.INGEST_BATCH_SIZE):
+            self.add_documents(category, batch)
+            stats.chunks += len(batch)
+            stats.batches += 1
+        stats.seconds = time.perf_counter() - start
+
+        if stats.chunks:
+            # Salva su disco (le versioni recenti di Chroma lo fanno già a ogni scrittura)
+            self.get_store(category).persist()
+            for (partition_category, _), partition in list(self._partitions.items()):
+                if partition_category == category:
+                    partition.persist()
+            # Indice BM25 con gli stessi chunk
+            self.build_lexical_index(category)
+        print(f"📥 '{category}': {stats.summary()}")
+
+        # Le ricerche successive devono vedere i nuovi documenti
+        self.reload(category)
+        return stats
+
+    def build_lexical_index(self, category: str) -> int:
+        """Ricostruisce l'indice BM25 di una categoria dai chunk del database.
+        
+        Da chiamare dopo ogni modifica alla categoria che non passa da
+        create_vector_store (es. aggiornamento incrementale).
+        
+        Returns:
+            Numero di chunk indicizzati
+        """
+        existing = self.get_store(category).get(include=["documents", "metadatas"])
+        index = BM25Index(existing["documents"], [metadata or {} for metadata in existing["metadatas"]])
+        index.save(self.category_path(category) / LEXICAL_INDEX_FILENAME)
+        with self._stores_lock:
+            self._lexical[category] = index
+        return len(index)
+
+    def get_lexical_index(self, category: str) -> Optional[BM25Index]:
+        """Indice BM25 di una categoria, caricato alla prima richiesta (None se non esiste).
+        
+        L'assenza non viene memorizzata: una categoria indicizzata dopo l'avvio
+        passa alla ricerca ibrida senza riavviare l'applicazione.
+        """
+        self._refresh(category)
+        index = self._lexical.get(category)
+        if index is not None:
+            return index
+        with self._stores_lock:
+            index = self._lexical.get(category)
+            if index is None:
+                index = BM25Index.load(self.category_path(category) / LEXICAL_INDEX_FILENAME)
+                if index is not None:
+                    self._lexical[category] = index
+                    self._lexical_missing.discard(category)
+                elif category not in self._lexical_missing:
+                    # Avviso una sola volta, non a ogni ricerca
+                    self._lexical_missing.add(category)
+                    print(f"⚠️ Indice BM25 di '{category}' non trovato: ricerca solo vettoriale")
+            return index
+
+    def partition_key(self, category: str) -> Optional[str]:
+        """Metadato per cui è partizionata la categoria (None se non è partizionata)."""
+        return settings.VECTOR_PARTITION_KEYS.get(category)
+
+    def partition_path(self, category: str, value: Any) -> Path:
+        """Directory della partizione di una categoria per un valore del metadato."""
+        return self.category_path(category) / PARTITIONS_DIRNAME / partition_slug(value)
+
+    def _group_by_partition(self, category: str, docs: Iterable[Document]) -> Dict[Any, List[Document]]:
+        """Raggruppa i chunk per valore del metadato di partizione (vuoto se non partizionata)."""
+        key = self.partition_key(category)
+        groups: Dict[Any, List[Document]] = {}
+        if key is None:
+            return groups
+        for doc in docs:
+            value = (doc.metadata or {}).get(key)
+            if value is not None:
+                groups.setdefault(value, []).append(doc)
+        return groups
+
+    def get_partition_store(self, category: str, value: Any, create: bool = False) -> Optional[VectorStore]:
+        """Store della partizione di una categoria, aperto alla prima richiesta.
+        
+        Args:
+            category: Categoria partizionata
+            value: Valore del metadato di partizione (es. "unipi_2025.pdf")
+            create: Se True, crea la partizione se non esiste ancora
+            
+        Returns:
+            Lo store, o None se la partizione non esiste (e create è False)
         """
-        # Percorso per questa categoria
-        db_path = self.base_path / category
+        self._refresh(category)
+        registry_key = (category, value)
+        store = self._partitions.get(registry_key)
+        if store is not None:
+            return store
+
+        with self._stores_lock:
+            store = self._partitions.get(registry_key)
+            if store is None:
+                # L'assenza non viene memorizzata: la partizione può essere creata
+                # in seguito dall'indicizzatore (anche in un altro processo)
+                db_path = self.partition_path(category, value)
+                if create or self._store_exists(db_path):
+                    store = self._open_store(db_path)
+                    self._partitions[registry_key] = store
+            return store
+
+    def _route(self, category: str, filter_metadata: Optional[dict]) -> VectorStore:
+        """Store da interrogare: la partizione fissata dal filtro, se esiste, altrimenti lo store completo.
+        
+        Il filtro resta invariato anche sulla partizione: è già soddisfatto da
+        tutti i suoi chunk, e così le chiavi del retriever restano distinte.
+        """
+        store = self.get_store(category)
+        key = self.partition_key(category)
+        if key is not None:
+            value = partition_value(filter_metadata, key)
+            if value is not None:
+                partition = self.get_partition_store(category, value)
+                if partition is not None:
+                    return partition
+        return store
+
+    def add_documents(self, category: str, docs: List[Document], ids: Optional[List[str]] = None) -> List[Any]:
+        """Aggiunge chunk alla categoria e alle sue partizioni.
         
-        # Crea database Chroma
-        db = Chroma.from_documents(
-            documents=docs,
-            embedding=self.embeddings,
-            persist_directory=str(db_path)
+        Args:
+            category: Categoria
+            docs: Chunk da aggiungere
+            ids: Id dei chunk (default: generati casualmente)
+            
+        Returns:
+            Valori delle partizioni modificate
+        """
+        if not docs:
+            return []
+        ids = ids or [str(uuid.uuid4()) for _ in docs]
+        self.get_store(category, create=True).add_documents(docs, ids=ids)
+        ids_by_doc = {id(doc): chunk_id for doc, chunk_id in zip(docs, ids)}
+        groups = self._group_by_partition(category, docs)
+        for value, partition_docs in groups.items():
+            self.get_partition_store(category, value, create=True).add_documents(
+                partition_docs, ids=[ids_by_doc[id(doc)] for doc in partition_docs]
+            )
+        return list(groups)
+
+    def delete_documents(self, category: str, ids: List[str], partitions: Iterable[Any] = ()) -> None:
+        """Elimina chunk dalla categoria e dalle partizioni indicate."""
+        if not ids:
+            return
+        self.get_store(category, create=True).delete(ids=ids)
+        for value in partitions:
+            partition = self.get_partition_store(category, value)
+            if partition is not None:
+                partition.delete(ids=ids)
+
+    def build_partitions(self, category: str) -> Dict[Any, List[str]]:
+        """Crea le partizioni mancanti a partire dallo store completo.
+        
+        Serve per partizionare una categoria già indicizzata: gli embeddings
+        dei chunk sono letti dalla cache, quindi il modello non viene rieseguito.
+        
+        Returns:
+            Id dei chunk di ogni partizione creata
+        """
+        existing = self.get_store(category).get(include=["documents", "metadatas"])
+        docs = [Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(existing["documents"], existing["metadatas"])]
+        ids_by_doc = {id(doc): chunk_id for doc, chunk_id in zip(docs, existing["ids"])}
+        created: Dict[Any, List[str]] = {}
+        for value, partition_docs in self._group_by_partition(category, docs).items():
+            if self._store_exists(self.partition_path(category, value)):
+                continue
+            created[value] = [ids_by_doc[id(doc)] for doc in partition_docs]
+            self.get_partition_store(category, value, create=True).add_documents(partition_docs, ids=created[value])
+        return created
+
+    def category_path(self, category: str) -> Path:
+        """Directory di una categoria per il backend in uso.
+        
+        Gli store NumPy stanno in `<categoria>.numpy`, così i due backend
+        (e i loro manifest e indici BM25) possono convivere.
+        """
+        if self.backend == "numpy":
+            return self.base_path / f"{category}.numpy"
+        return self.base_path / category
+
+    def exists(self, category: str) -> bool:
+        """True se la categoria è già stata creata su disco."""
+        return self._store_exists(self.category_path(category))
+
+    def _store_exists(self, db_path: Path) -> bool:
+        if self.backend == "numpy":
+            return NumpyVectorStore.exists(str(db_path))
+        return db_path.exists()
+
+    def _open_store(self, db_path: Path) -> VectorStore:
+        """Apre (o crea) lo store del backend in uso in una directory."""
+        if self.backend == "numpy":
+            return NumpyVectorStore(
+                str(db_path),
+                embedding_function=self.embeddings,
+                dtype=settings.NUMPY_VECTOR_DTYPE
+            )
+        return Chroma(
+            persist_directory=str(db_path),
+            embedding_function=self.embeddings
         )
+
+    def _persisted_state(self, category: str) -> Tuple[Optional[int], ...]:
+        """Date di modifica del manifest e dell'indice BM25, riscritti a ogni indicizzazione."""
+        db_path = self.category_path(category)
+        return file_mtime(db_path / MANIFEST_FILENAME), file_mtime(db_path / LEXICAL_INDEX_FILENAME)
+
+    def _refresh(self, category: str) -> None:
+        """Dimentica store, partizioni e indice BM25 della categoria se è stata reindicizzata.
         
-        # Salva su disco
-        db.persist()
+        Lo stato viene letto da disco, quindi vale anche per le indicizzazioni
+        fatte da un altro processo. Gli store non vengono chiusi: le ricerche
+        in corso li usano fino alla fine, le successive riaprono quelli nuovi.
+        """
+        state = self._persisted_state(category)
+        with self._stores_lock:
+            previous = self._states.setdefault(category, state)
+            if previous == state:
+                return
+            self._states[category] = state
+            reopened = self._stores.pop(category, None) is not None
+            self._lexical.pop(category, None)
+            for registry_key in [key for key in self._partitions if key[0] == category]:
+                del self._partitions[registry_key]
+        if reopened:
+            print(f"🔄 '{category}' reindicizzata: lo store verrà riaperto")
+
+    def get_store(self, category: str, create: bool = False) -> VectorStore:
+        """Restituisce il vector store condiviso di una categoria, aprendolo alla prima richiesta.
+        
+        Lo store viene riaperto se nel frattempo la categoria è stata reindicizzata.
+        
+        Args:
+            category: Categoria (es. 'calls', 'courses')
+            create: Se True, crea il database se non esiste ancora
+            
+        Raises:
+            ValueError: se la categoria non esiste (e create è False)
+        """
+        self._refresh(category)
+        store = self._stores.get(category)
+        if store is not None:
+            return store
+
+        with self._stores_lock:
+            # Un altro thread potrebbe averlo aperto nel frattempo
+            store = self._stores.get(category)
+            if store is None:
+                if not self.exists(category) and not create:
+                    raise ValueError(
+                        f"Database '{category}' non trovato. "
+                        f"Esegui prima create_vector_store per la categoria '{category}'"
+                    )
+                store = self._open_store(self.category_path(category))
+                self._stores[category] = store
+                print(f"📂 Vector store '{category}' aperto")
+            return store
+
+    def get_retriever(self,
+                      category: str,
+                      top_k: int = 5,
+                      filter_metadata: Optional[dict] = None,
+                      mode: Optional[str] = None):
+        """Crea un retriever per una categoria di documenti.
         
-    def get_retriever(self, category: str, top_k: int = 5):
-        """Carica il retriever per una categoria di documenti.
+        Il retriever è una vista sullo store condiviso: k e filtro valgono
+        solo per questo retriever, quindi non vanno modificati in place.
         
         Args:
             category: Categoria (es. 'calls', 'courses')
             top_k: Numero di risultati da restituire per query
+            filter_metadata: Filtro sui metadati (es. {"source": "unipi.pdf"})
+            mode: "vector" o "hybrid" (default: settings.RETRIEVAL_MODE)
             
         Returns:
             Retriever configurato per la categoria
             
         Raises:
-            ValueError: se la categoria non esiste
+            ValueError: se la categoria non esiste o la modalità non è valida
         """
-        db_path = self.base_path / category
-        
-        if not db_path.exists():
-            raise ValueError(
-                f"Database '{category}' non trovato. "
-                f"Esegui prima create_vector_store per la categoria '{category}'"
-            )
+        mode = self._resolve_mode(category, mode)
+        search_kwargs = {"k": top_k}
+        if filter_metadata:
+            search_kwargs["filter"] = filter_metadata
+        if mode == "hybrid":
+            return HybridRetriever(service=self, category=category, search_kwargs={**search_kwargs, "mode": mode})
+        return self._route(category, filter_metadata).as_retriever(search_kwargs=search_kwargs)
+
+    def _resolve_mode(self, category: str, mode: Optional[str]) -> str:
+        """Modalità di ricerca effettiva: "hybrid" solo se la categoria ha un indice BM25."""
+        mode = mode or settings.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modalità di ricerca '{mode}' non valida (valori ammessi: {', '.join(RETRIEVAL_MODES)})")
+        if mode == "hybrid":
+            # Verifica che la categoria esista prima di cercare l'indice
+            self.get_store(category)
+            if self.get_lexical_index(category) is None:
+                return "vector"
+        return mode
+
+    def build_context(self,
+                      query: str,
+                      documents: Sequence[Document],
+                      top_k: int,
+                      max_tokens: Optional[int] = None) -> str:
+        """Contesto del prompt dai chunk recuperati per la query.
         
-        # Carica database esistente
-        db = Chroma(
-            persist_directory=str(db_path),
-            embedding_function=self.embeddings
+        Args:
+            query: Query usata per il retrieval
+            documents: Candidati del retriever (di norma top_k * settings.CONTEXT_CANDIDATES_FACTOR)
+            top_k: Numero massimo di chunk da usare
+            max_tokens: Budget di token (default: settings.CONTEXT_MAX_TOKENS)
+            
+        Returns:
+            Chunk scelti separati da "---"
+        """
+        return pack_context(
+            query,
+            documents,
+            self.embeddings,
+            top_k,
+            max_tokens or settings.CONTEXT_MAX_TOKENS,
+            settings.CONTEXT_MMR_LAMBDA
         )
+
+    def reload(self, category: str) -> None:
+        """Riapre lo store di una categoria (es. dopo una reindicizzazione).
         
-        # Configura e restituisci retriever
-        return db.as_retriever(
-            search_kwargs={
-                "k": top_k,  # numero risultati
-                "include_metadata": True  # include metadati nei risultati
-            }
-        )
+        Lo store viene chiuso subito e riaperto alla prossima richiesta.
+        """
+        self.close(category)
+
+    def close(self, category: Optional[str] = None) -> None:
+        """Chiude lo store di una categoria, o tutti se category è None.
+        
+        Da chiamare quando non ci sono ricerche in corso sulla categoria
+        (reindicizzazione, spegnimento dell'applicazione).
+        """
+        with self._stores_lock:
+            if category is None:
+                stores = list(self._stores.values()) + list(self._partitions.values())
+                self._stores.clear()
+                self._partitions.clear()
+                self._lexical.clear()
+                self._states.clear()
+            else:
+                self._lexical.pop(category, None)
+                self._states.pop(category, None)
+                store = self._stores.pop(category, None)
+                stores = [store] if store is not None else []
+                for registry_key in [key for key in self._partitions if key[0] == category]:
+                    stores.append(self._partitions.pop(registry_key))
+
+        for store in stores:
+            # Client.close() esiste solo nelle versioni recenti di chromadb
+            # (lo store NumPy non ha client né file aperti da chiudere)
+            close_client = getattr(getattr(store, "_client", None), "close", None)
+            if close_client is not None:
+                close_client()
+
+    def embedding_metrics(self) -> dict:
+        """Contatori delle cache degli embeddings (vuoto se il modello non è ancora caricato).
+        
+        Returns:
+            {"query_lru": ..., "cache": ...} per i livelli abilitati
+        """
+        metrics = {}
+        embeddings = self._embeddings
+        while embeddings is not None:
+            if isinstance(embeddings, QueryEmbeddingLRU):
+                metrics["query_lru"] = embeddings.metrics()
+            elif hasattr(embeddings, "metrics"):
+                metrics["cache"] = embeddings.metrics()
+            embeddings = getattr(embeddings, "base", None)
+        return metrics
+
+    def open_categories(self) -> List[str]:
+        """Categorie con uno store attualmente aperto."""
+        with self._stores_lock:
+            return sorted(self._stores)
 
     def search(self, 
                category: str,
                query: str,
                top_k: int = 5,
-               filter_metadata: Optional[dict] = None) -> List[Document]:
+               filter_metadata: Optional[dict] = None,
+               mode: Optional[str] = None) -> List[Document]:
         """Esegue una ricerca diretta nel database.
         
+        In modalità "hybrid" vengono recuperati top_k * HYBRID_CANDIDATES_FACTOR
+        candidati sia dallo store vettoriale sia dall'indice BM25, poi uniti
+        con la reciprocal rank fusion.
+        
         Args:
             category: Categoria in cui cercare
             query: Testo della query
             top_k: Numero massimo di risultati
             filter_metadata: Filtro sui metadati (es. {"type": "call"})
+            mode: "vector" o "hybrid" (default: settings.RETRIEVAL_MODE)
             
         Returns:
             Lista di Document con i risultati più rilevanti
         """
-        retriever = self.get_retriever(category, top_k)
-        return retriever.get_relevant_documents(
-            query,
-            filter=filter_metadata
-        )
+        mode = self._resolve_mode(category, mode)
+        store = self._route(category, filter_metadata)
+        if mode == "vector":
+            return store.similarity_search(query, k=top_k, filter=filter_metadata)
+
+        candidates = top_k * settings.HYBRID_CANDIDATES_FACTOR
+        vector_docs = store.similarity_search(query, k=candidates, filter=filter_metadata)
+        lexical_docs = self.get_lexical_index(category).search(query, candidates, filter_metadata)
+        return fuse_documents([vector_docs, lexical_docs], top_k)
+
+    def search_many(self,
+                    category: str,
+                    queries: Sequence[str],
+                    top_k: int = 5,
+                    filters: Union[None, dict, Sequence[Optional[dict]]] = None,
+                    mode: Optional[str] = None) -> List[List[Document]]:
+        """Esegue più ricerche insieme.
+        
+        Gli embeddings di tutte le query vengono calcolati in un solo batch e
+        le query con lo stesso filtro vengono cercate insieme (un prodotto
+        matrice-matrice con il backend NumPy; con Chroma una ricerca per
+        vettore tramite l'API pubblica).
+        
+        Args:
+            category: Categoria in cui cercare
+            queries: Testi delle query
+            top_k: Numero massimo di risultati per query
+            filters: Filtro comune a tutte le query, oppure uno per query
+            mode: "vector" o "hybrid" (default: settings.RETRIEVAL_MODE)
+            
+        Returns:
+            Per ogni query, lista di Document come quella di search
+            
+        Raises:
+            ValueError: se la categoria non esiste o i filtri non sono uno per query
+        """
+        queries = list(queries)
+        if filters is None or isinstance(filters, dict):
+            filters = [filters] * len(queries)
+        elif len(filters) != len(queries):
+            raise ValueError(f"Servono {len(queries)} filtri (uno per query), ricevuti {len(filters)}")
+        if not queries:
+            return []
+
+        mode = self._resolve_mode(category, mode)
+        vectors = embed_queries(self.embeddings, queries)
+        k = top_k if mode == "vector" else top_k * settings.HYBRID_CANDIDATES_FACTOR
+
+        # Le query con lo stesso filtro vanno allo store insieme
+        groups: Dict[str, List[int]] = {}
+        for position, filter_metadata in enumerate(filters):
+            groups.setdefault(json.dumps(filter_metadata, sort_keys=True, default=str), []).append(position)
+
+        results: List[List[Document]] = [[] for _ in queries]
+        for positions in groups.values():
+            filter_metadata = filters[positions[0]]
+            store = self._route(category, filter_metadata)
+            group_results = self._search_by_vectors(store, [vectors[position] for position in positions], k, filter_metadata)
+            for position, docs in zip(positions, group_results):
+                results[position] = docs
+
+        if mode == "hybrid":
+            lexical_index = self.get_lexical_index(category)
+            results = [
+                fuse_documents([docs, lexical_index.search(query, k, filter_metadata)], top_k)
+                for docs, query, filter_metadata in zip(results, queries, filters)
+            ]
+        return results
+
+    @staticmethod
+    def _search_by_vectors(store: VectorStore,
+                           vectors: List[List[float]],
+                           k: int,
+                           filter_metadata: Optional[dict]) -> List[List[Document]]:
+        """Ricerca di più vettori con lo stesso filtro.
+
+        Lo store NumPy li cerca con un solo prodotto matrice-vettori; per Chroma si
+        usa l'API pubblica, un vettore alla volta (gli embeddings delle query sono
+        comunque calcolati in un solo batch da search_many).
+        """
+        if isinstance(store, NumpyVectorStore):
+            return store.similarity_search_by_vectors(vectors, k, filter_metadata)
+        return [store.similarity_search_by_vector(vector, k=k, filter=filter_metadata) for vector in vectors]
+
+    async def asearch(self,
+                      category: str,
+                      query: str,
+                      top_k: int = 5,
+                      filter_metadata: Optional[dict] = None,
+                      mode: Optional[str] = None) -> List[Document]:
+        """Versione asincrona di search.
+        
+        Il calcolo dell'embedding della query e la ricerca vengono eseguiti
+        nel pool "cpu", senza bloccare l'event loop.
+        """
+        return await run_cpu(self.search, category, query, top_k, filter_metadata, mode)
+
+    async def asearch_many(self,
+                           category: str,
+                           queries: Sequence[str],
+                           top_k: int = 5,
+                           filters: Union[None, dict, Sequence[Optional[dict]]] = None,
+                           mode: Optional[str] = None) -> List[List[Document]]:
+        """Versione asincrona di search_many (eseguita nel pool "cpu")."""
+        return await run_cpu(self.search_many, category, queries, top_k, filters, mode)
 
 # Istanza globale del servizio
-vector_store_service = VectorStoreService()
+vector_store_service = VectorStoreService(settings.DB_PATH)
 
 # Funzioni di comodo che usano l'istanza globale
-def create_vector_store(docs: List[Document], category: str) -> None:
+def create_vector_store(docs: Iterable[Document], category: str, batch_size: Optional[int] = None) -> IngestionStats:
     """Wrapper per VectorStoreService.create_vector_store."""
-    vector_store_service.create_vector_store(docs, category)
+    return vector_store_service.create_vector_store(docs, category, batch_size)
 
-def get_retriever(db_path: str, category: str, top_k: int = 5):
+def get_retriever(db_path: str,
+                  category: str,
+                  top_k: int = 5,
+                  filter_metadata: Optional[dict] = None,
+                  mode: Optional[str] = None):
     """Wrapper per VectorStoreService.get_retriever.
     
     Args:
         db_path: Path base del database (ignorato, mantenuto per compatibilità)
         category: Categoria di documenti
         top_k: Numero di risultati
+        filter_metadata: Filtro sui metadati (es. {"source": "unipi.pdf"})
+        mode: "vector" o "hybrid" (default: settings.RETRIEVAL_MODE)
     """
-    return vector_store_service.get_retriever(category, top_k)
+    return vector_store_service.get_retriever(category, top_k, filter_metadata, mode)
+
+def build_context(query: str, documents: Sequence[Document], top_k: int, max_tokens: Optional[int] = None) -> str:
+    """Wrapper per VectorStoreService.build_context."""
+    return vector_store_service.build_context(query, documents, top_k, max_tokens)
+
+def close_vector_stores() -> None:
+    """Chiude tutti gli store aperti (allo spegnimento dell'applicazione)."""
+    vector_store_service.close()
 
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+"""Configurazione di gunicorn per il deploy con più worker.
+
+Avvio:
+    gunicorn app.main:app -c gunicorn.conf.py
+
+Con preload_app l'applicazione viene importata una sola volta nel processo
+master: il modello di embeddings (PRELOAD_EMBEDDINGS) è caricato prima del
+fork e le sue pagine di memoria sono condivise dai worker invece di essere
+duplicate. Ogni worker esegue poi il proprio warm-up (vedi /ready).
+"""
+
+import multiprocessing
+import os
+
+# Letto da app.core.config quando il master importa l'applicazione
+os.environ.setdefault("PRELOAD_EMBEDDINGS", "true")
+
+preload_app = True
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+# Il warm-up e le prime estrazioni dei PDF possono richiedere qualche secondo
+timeout = 120
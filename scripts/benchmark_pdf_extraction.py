@@ -0,0 +1,61 @@
+# scripts/benchmark_pdf_extraction.py
+"""Confronta i tempi dei motori di estrazione PDF sui file in data/."""
+
+import sys
+import time
+from pathlib import Path
+
+# Aggiungi la directory root al PYTHONPATH
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.services.pdf_extraction import ENGINES, get_engine
+
+
+DATA_DIR = root_dir / "data"
+
+
+def time_call(fn, pdf_path: str) -> tuple[float, int]:
+    """Esegue l'estrazione e restituisce (millisecondi, caratteri estratti)."""
+    start = time.perf_counter()
+    text = fn(pdf_path)
+    return (time.perf_counter() - start) * 1000, len(text)
+
+
+def main():
+    """Stampa un report affiancato per ogni PDF e ogni motore."""
+    pdf_files = sorted(DATA_DIR.rglob("*.pdf"))
+    if not pdf_files:
+        print(f"Nessun PDF trovato in {DATA_DIR}")
+        sys.exit(1)
+
+    engines = [get_engine(name) for name in ENGINES]
+
+    # Primo giro a vuoto: esclude dai tempi il caricamento iniziale delle librerie
+    for engine in engines:
+        engine.extract_tables_and_text(str(pdf_files[0]))
+
+    header = f"{'PDF':<45} {'modalità':<8}" + "".join(f" {engine.name:>22}" for engine in engines)
+    print(header)
+    print("-" * len(header))
+
+    totals = {(engine.name, mode): 0.0 for engine in engines for mode in ("testo", "tabelle")}
+    for pdf_path in pdf_files:
+        for mode in ("testo", "tabelle"):
+            cells = []
+            for engine in engines:
+                fn = engine.extract_text if mode == "testo" else engine.extract_tables_and_text
+                elapsed, chars = time_call(fn, str(pdf_path))
+                totals[(engine.name, mode)] += elapsed
+                cells.append(f"{elapsed:9.1f} ms {chars:7d} ch")
+            name = str(pdf_path.relative_to(DATA_DIR))[:45]
+            print(f"{name:<45} {mode:<8}" + "".join(f" {cell:>22}" for cell in cells))
+
+    print("-" * len(header))
+    for mode in ("testo", "tabelle"):
+        cells = [f"{totals[(engine.name, mode)]:9.1f} ms" for engine in engines]
+        print(f"{'TOTALE':<45} {mode:<8}" + "".join(f" {cell:>22}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
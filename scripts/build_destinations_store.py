@@ -0,0 +1,48 @@
+# scripts/build_destinations_store.py
+"""Script per caricare le destinazioni di tutte le università nello store indicizzato."""
+
+import sys
+from pathlib import Path
+
+# Aggiungi la directory root al PYTHONPATH
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.services.destinations_store import destinations_store
+from app.services.rag_service import ensure_destinations_loaded
+
+
+DESTINATIONS_DIR = Path("data") / "destinazioni"
+
+
+def find_home_universities() -> list[str]:
+    """Elenca le università con un PDF (destinazioni_bando_<u>) o un txt processato."""
+    universities = set()
+    for pdf_file in DESTINATIONS_DIR.glob("destinazioni_bando_*"):
+        universities.add(pdf_file.name[len("destinazioni_bando_"):])
+    for txt_file in (DESTINATIONS_DIR / "processed").glob("destinazioni_*_LLM_ready.txt"):
+        universities.add(txt_file.name[len("destinazioni_"):-len("_LLM_ready.txt")])
+    return sorted(universities)
+
+
+def main():
+    """Carica nello store le destinazioni di ogni università di provenienza."""
+    print("Inizio costruzione dello store delle destinazioni...")
+
+    universities = find_home_universities()
+    if not universities:
+        print(f"Nessun file di destinazioni trovato in {DESTINATIONS_DIR}")
+        sys.exit(1)
+
+    try:
+        for university in universities:
+            ensure_destinations_loaded(university)
+    except Exception as e:
+        print(f"Errore durante la costruzione dello store: {str(e)}")
+        sys.exit(1)
+
+    print(f"Store completato: {destinations_store.db_path} ({len(universities)} università)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# scripts/ingest.py
+"""Ingestion dei PDF nel vector store, per tutte le categorie.
+
+Le categorie e le rispettive cartelle di PDF sono elencate nel manifest
+data/ingestion.json. Ogni categoria viene aggiornata in modo incrementale
+(vedi app/services/incremental_index.py): il manifest dell'indice viene
+salvato dopo ogni file, quindi rilanciando il comando dopo un'interruzione
+vengono elaborati solo i file mancanti.
+
+Uso:
+    python scripts/ingest.py [--manifest data/ingestion.json] [--category calls ...] [--dry-run]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Aggiungi la directory root al PYTHONPATH
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from app.services.incremental_index import load_ingestion_manifest, update_vector_store
+
+
+def main():
+    """Allinea le categorie del vector store alle cartelle del manifest."""
+    parser = argparse.ArgumentParser(description="Ingestion incrementale e riprendibile dei PDF")
+    parser.add_argument("--manifest", default=str(root_dir / "data" / "ingestion.json"), help="Manifest categoria -> cartella dei PDF")
+    parser.add_argument("--category", action="append", help="Categoria da aggiornare (ripetibile, default: tutte)")
+    parser.add_argument("--dry-run", action="store_true", help="Mostra cosa cambierebbe senza modificare il database")
+    args = parser.parse_args()
+
+    try:
+        sources = load_ingestion_manifest(args.manifest)
+    except ValueError as e:
+        print(f"Errore nel manifest: {e}")
+        sys.exit(1)
+
+    if args.category:
+        unknown = [category for category in args.category if category not in sources]
+        if unknown:
+            print(f"Categorie non presenti nel manifest: {', '.join(unknown)}")
+            sys.exit(1)
+        sources = {category: sources[category] for category in args.category}
+
+    start = time.perf_counter()
+    failed = False
+    for category, source_dir in sources.items():
+        print(f"Ingestion di '{category}' da {source_dir}...")
+        category_start = time.perf_counter()
+        try:
+            report = update_vector_store(str(source_dir), category=category, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"Errore durante l'ingestion di '{category}': {str(e)}")
+            failed = True
+            continue
+        print(report.summary())
+        print(f"Fasi: {report.timings_summary()} | totale {time.perf_counter() - category_start:.1f} s")
+
+    print(f"Ingestion completata in {time.perf_counter() - start:.1f} s" + (" (dry run)" if args.dry_run else ""))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()